@@ -11,13 +11,19 @@ There are two approaches to "resolving" labels:
     references to labels and "patch them up" at the end.
 """
 
+import os
 import re
 import sys
 import json
 from pathlib import Path
 import argparse
 import configparser
-from typing import Dict, List,  Optional, Tuple
+import concurrent.futures
+import hashlib
+from typing import Dict, Iterable, Iterator, List,  Optional, Set, Tuple
+
+import objfile
+import peephole
 
 import logging
 logging.basicConfig()
@@ -26,14 +32,17 @@ log.setLevel(logging.DEBUG)
 
 
 class Configuration:
-    def __init__(self):
+    """TVMLIB may name several directories, separated by os.pathsep
+    (e.g., OBJ:../lib/OBJ), where imported modules are looked for in
+    order.  The first is where the assembler puts what it builds.
+    """
+    def __init__(self, path: str = "asm.conf"):
         config = configparser.ConfigParser()
-        try:
-            config.read("asm.conf")
-            self.tvmlib = Path(config["DEFAULT"]["TVMLIB"])
-        except FileExistsError:
-            # If no configuration file is present, we will look in ./OBJ
-            self.tvmlib = Path("./OBJ")
+        config.read(path)
+        # If no configuration file is present, we will look in ./OBJ
+        tvmlib = config["DEFAULT"].get("TVMLIB", "./OBJ")
+        self.search_path = [Path(d) for d in tvmlib.split(os.pathsep) if d]
+        self.tvmlib = self.search_path[0]
 
 
 CONFIG = Configuration()  # Visible from any code
@@ -44,10 +53,24 @@ def cli() -> object:
         description="Assemble tiny virtual machine module"
                     "into JSON-formatted object code"
     )
-    parser.add_argument("source", type=argparse.FileType("r"))
-    parser.add_argument("target", type=argparse.FileType("w"),
-                        nargs="?", default=sys.stdout)
-    return parser.parse_args()
+    parser.add_argument("source", nargs="+",
+                        help="source [target], or with --jobs, "
+                             "any number of sources")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="Assemble all sources into TVMLIB, "
+                             "using up to this many processes")
+    parser.add_argument("--format", choices=["json", "bin"], default="json",
+                        help="Object code format (bin is read by the "
+                             "VM loader without parsing)")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="Apply peephole optimizations to method code")
+    parser.add_argument("--force", action="store_true",
+                        help="With --jobs, reassemble even classes "
+                             "that are up to date")
+    args = parser.parse_args()
+    if args.jobs is None and len(args.source) > 2:
+        parser.error("Without --jobs, give one source and optional target")
+    return args
 
 
 # ----------------
@@ -55,22 +78,31 @@ def cli() -> object:
 #    - Slot numbers for methods, e.g., "print" is
 #      the second slot.
 #    - Field numbers for load and store operations
+#  That is, only the interface of a module (its lists of methods
+#  and fields), which an ImportResolver finds on the TVMLIB
+#  search path.  Interfaces are also kept in a compact index file,
+#  so that assembling a class need not load and parse the whole
+#  object code of Obj, Int, String, ... again.
 #
 class ImportedModule:
-    """Imported module uses information from
-    json file
-    """
-    def __init__(self, path: Path):
-        with open(path, "r") as source:
-            self.json = json.load(source)
-        # Dict from name to position would be faster, but
-        # number of lookups is very small
-        self.methods: List[str] = self.json["methods"]
-        self.fields:  List[str] = self.json["fields"]
+    """Interface of an imported module"""
+    def __init__(self, methods: List[str], fields: List[str]):
+        # Generated classes can have hundreds of methods, so we
+        # keep name -> position maps alongside the ordered lists
+        self.methods: List[str] = methods
+        self.fields:  List[str] = fields
+        self.method_index = {name: i for i, name in enumerate(self.methods)}
+        self.field_index = {name: i for i, name in enumerate(self.fields)}
+
+    @staticmethod
+    def load(path: Path) -> "ImportedModule":
+        """Interface of an object code file (either format)"""
+        contents = objfile.load(path)
+        return ImportedModule(contents["methods"], contents["fields"])
 
     def method_slot(self, name: str) -> int:
-        if name in self.methods:
-            return self.methods.index(name)
+        if name in self.method_index:
+            return self.method_index[name]
         log.error(f"Method {name} not defined")
         return 0
 
@@ -78,18 +110,137 @@ class ImportedModule:
         return len(self.methods)
 
     def field_slot(self, name: str) -> int:
-        return self.fields.index(name)
+        return self.field_index[name]
+
+    def layout_digest(self) -> str:
+        """Hash of the method and field layout, which is all that
+        modules importing this one depend on.
+        """
+        layout = json.dumps({"methods": self.methods, "fields": self.fields})
+        return hashlib.sha256(layout.encode("utf-8")).hexdigest()
+
+
+def file_signature(path: Path) -> Tuple[int, int]:
+    """Modification time and size, which change when a file is rewritten"""
+    stat = path.stat()
+    return stat.st_mtime_ns, stat.st_size
+
+
+class InterfaceIndex:
+    """Persistent cache of module interfaces, by object file path.
+    An entry is used only while the file has the modification time
+    and size it had when the entry was made.
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+        self.changed = False
+        try:
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass   # Missing or damaged;  we will rebuild it
+
+    def interface(self, object_path: Path) -> ImportedModule:
+        key = str(object_path.resolve())
+        mtime, size = file_signature(object_path)
+        entry = self.entries.get(key)
+        if not entry or entry["mtime"] != mtime or entry["size"] != size:
+            module = ImportedModule.load(object_path)
+            entry = {"mtime": mtime, "size": size,
+                     "methods": module.methods, "fields": module.fields}
+            self.entries[key] = entry
+            self.changed = True
+        return ImportedModule(entry["methods"], entry["fields"])
+
+    def save(self):
+        """Write the index if it has new entries.  Processes
+        assembling in parallel may each save;  the last one wins,
+        which costs at most some entries that will be remade.
+        """
+        if not self.changed:
+            return
+        temp = self.path.with_name(f"{self.path.name}.{os.getpid()}")
+        try:
+            with open(temp, "w") as f:
+                json.dump(self.entries, f, separators=(",", ":"))
+            os.replace(temp, self.path)
+            self.changed = False
+        except OSError as e:
+            log.debug(f"Could not save {self.path}: {e}")
+
+
+class ImportResolver:
+    """Interfaces of imported modules, from modules provided in
+    memory (e.g., classes of a program compiled together) or else
+    the first directory of the search path with object code for the
+    module.  A resolver remembers what it has found (checking that
+    the object file has not changed), so one resolver can serve
+    any number of classes.
+    """
+    def __init__(self, search_path: List[Path],
+                 index: Optional[InterfaceIndex] = None):
+        self.search_path = search_path
+        self.index = index
+        self.provided: Dict[str, ImportedModule] = {}
+        # module -> (object file, its signature, interface)
+        self.found: Dict[str, Tuple[Path, Tuple[int, int], ImportedModule]] = {}
+
+    def scope(self) -> "ImportResolver":
+        """A resolver sharing what this one finds, but with
+        its own provided modules
+        """
+        resolver = ImportResolver(self.search_path, self.index)
+        resolver.found = self.found
+        return resolver
+
+    def provide(self, module: str, methods: List[str], fields: List[str]):
+        """Make the layout of a module importable before (or without)
+        its object code being in TVMLIB
+        """
+        self.provided[module] = ImportedModule(methods, fields)
+
+    def find(self, module: str) -> Path:
+        """Object code file for module"""
+        for directory in self.search_path:
+            path = objfile.find(directory, module)
+            if path.exists():
+                return path
+        raise FileNotFoundError(f"No object code for {module} in "
+                                f"{os.pathsep.join(str(d) for d in self.search_path)}")
+
+    def interface(self, module: str) -> ImportedModule:
+        if module in self.provided:
+            return self.provided[module]
+        if module in self.found:
+            path, signature, interface = self.found[module]
+            if path.exists() and file_signature(path) == signature:
+                return interface
+        path = self.find(module)
+        signature = file_signature(path)
+        if self.index:
+            interface = self.index.interface(path)
+        else:
+            interface = ImportedModule.load(path)
+        self.found[module] = (path, signature, interface)
+        return interface
 
+    def save(self):
+        if self.index:
+            self.index.save()
 
-IMPORTS: Dict[str, Optional[ImportedModule]] = { "$": None }
-# $ will be replaced by current class name in output .json file
 
+INDEX_NAME = ".interface_index.json"   # In the first TVMLIB directory
+DEFAULT_RESOLVER: Optional[ImportResolver] = None
 
-def import_module(module: str) -> ImportedModule:
-    if module not in IMPORTS:
-        path = CONFIG.tvmlib.joinpath(module).with_suffix(".json")
-        IMPORTS[module] = ImportedModule(path)
-    return IMPORTS[module]
+
+def default_resolver() -> ImportResolver:
+    """Resolver for the TVMLIB search path of asm.conf"""
+    global DEFAULT_RESOLVER
+    if DEFAULT_RESOLVER is None:
+        index = InterfaceIndex(CONFIG.tvmlib.joinpath(INDEX_NAME))
+        DEFAULT_RESOLVER = ImportResolver(CONFIG.search_path, index)
+    return DEFAULT_RESOLVER
 
 
 # The named literals MUST match the definitions
@@ -118,10 +269,13 @@ NAMED_LITERALS = {
 #
 
 class InstructionDef:
-    def __init__(self, name: str, code: int, ops: int):
+    def __init__(self, name: str, code: int, ops: int,
+                 parts: Optional[List[str]] = None):
         self.name = name
         self.code = code
         self.ops = ops
+        # A superinstruction names the operations it combines
+        self.parts: List[str] = parts or []
 
     def size(self) -> int:
         """An instruction without an operand
@@ -144,6 +298,8 @@ class InstructionSet:
     def __init__(self, path: str):
         self.ops: Dict[str, InstructionDef] = {}
         """Instruction set initialized from text table"""
+        # Sequence of operation names -> superinstruction
+        self.fusions: Dict[Tuple[str, ...], InstructionDef] = {}
         opcode = 0
         with open(path, "r") as f:
             for line in f:
@@ -153,9 +309,12 @@ class InstructionSet:
                     continue
                 # What remains should be an instruction definition
                 parts = line.split(",")
-                name, code, ops = parts
-                instr = InstructionDef(name, opcode, ops)
+                name, code, ops = parts[:3]
+                components = parts[3].split("+") if len(parts) > 3 else []
+                instr = InstructionDef(name, opcode, ops, components)
                 self.ops[name] = instr
+                if components:
+                    self.fusions[tuple(components)] = instr
                 opcode += 1
 
     def __getitem__(self, name: str):
@@ -175,18 +334,27 @@ class InstructionSet:
 # So assembler does a lot of the symbolic -> numeric resolution. 
 
 # Instruction set is a global
-INSTRS = InstructionSet("opdefs.txt")
+OPDEFS_PATH = "opdefs.txt"
+INSTRS = InstructionSet(OPDEFS_PATH)
 
 
 class Instruction:
-    """Object code instruction, including operand if any."""
+    """Object code instruction, including operand if any.
+    A superinstruction has no operand of its own, but
+    holds the instructions it combines as its parts.
+    """
     def __init__(self, label: Optional[str],
                  operation: InstructionDef,
-                 operand: Optional[str]):
+                 operand: Optional[str],
+                 parts: Optional[List["Instruction"]] = None):
         self.label = label
         self.operation = operation
         self.operand = operand
-        if operation.ops == '0':
+        self.parts: List[Instruction] = parts or []
+        if operation.parts:
+            assert operand is None
+            assert [part.operation.name for part in self.parts] == operation.parts
+        elif operation.ops == '0':
             assert operand is None
         else:
             assert operand is not None
@@ -198,6 +366,9 @@ class Instruction:
             label = "  "
         if self.operand:
             operand = f"    {self.operand}"
+        elif self.parts:
+            operand = "    " + " ".join(str(part.operand) for part in self.parts
+                                        if part.operand is not None)
         else:
             operand = ""
         return f"{label} {self.operation.name} {operand}"
@@ -212,14 +383,19 @@ UNRESOLVED_ADDRESS = -42  # Just an easily recognized value
 
 
 class ObjectCode:
-    def __init__(self):
+    def __init__(self, optimize: bool = False,
+                 resolver: Optional[ImportResolver] = None):
         # The following are initialized in declare_class
         self.class_name: str = ""
         self.super_name: str = ""
         self.method_list: List[str] = []
         self.field_list: List[str] = []
-        # Constant pool
+        # name -> position in the lists above
+        self.method_slots: Dict[str, int] = {}
+        self.field_slots: Dict[str, int] = {}
+        # Constant pool, with each distinct literal appearing once
         self.constants: List[Tuple[str, int]] = []
+        self.constant_index: Dict[Tuple[str, str], int] = {}
         # Method code (instructions)
         self.code = []  # Will expand to code per method
         # For each method defined here, we want its
@@ -228,6 +404,8 @@ class ObjectCode:
         self.method_code: List[dict] = []
         self.method_locals: List[str] = []
         self.method_args: List[str] = []
+        # name -> offset from frame pointer
+        self.local_offsets: Dict[str, int] = {}
         # Things to be resolved
         # Labels resolve to addresses within the code
         # of a method.
@@ -235,26 +413,46 @@ class ObjectCode:
         self.labels: Dict[str, int] = {}
         # address -> unresolved label
         self.label_patch: Dict[int, str] = {}
+        # With optimization, instructions and labels of the current
+        # method are held here until the method is complete
+        self.optimize = optimize
+        self.pending: List[peephole.Item] = []
+        # Modules this class imports, in order of first use;  the
+        # position of a module here is how object code refers to it.
+        # $ will be replaced by current class name in output .json file
+        self.resolver = resolver or default_resolver()
+        self.imports: Dict[str, Optional[ImportedModule]] = {"$": None}
+        self.import_index: Dict[str, int] = {"$": 0}
 
     def declare_class(self, name: str, super_name: str):
         self.class_name = name
         self.super_name = super_name
-        super_module = import_module(super_name)
+        super_module = self.import_module(super_name)
         # Methods and field list are initially those
         # we inherit, but may be extended elsewhere
         # in the assembly code
-        self.method_list = super_module.methods
+        self.method_list = list(super_module.methods)
+        self.method_slots = dict(super_module.method_index)
         self.n_inherited = len(super_module.methods)
-        self.field_list = super_module.fields
+        self.field_list = list(super_module.fields)
+        self.field_slots = dict(super_module.field_index)
         # AND we need to be able to refer to this class in NEW
 
     def declare_field(self, name: str):
         """Add a field to objects of this class;
         do this before methods.
         """
-        assert name not in self.field_list, "Field already exists"
+        assert name not in self.field_slots, "Field already exists"
+        self.field_slots[name] = len(self.field_list)
         self.field_list.append(name)
 
+    def add_method_slot(self, method_name: str) -> int:
+        """Slot of method in the vtable, reserving one if needed"""
+        if method_name not in self.method_slots:
+            self.method_slots[method_name] = len(self.method_list)
+            self.method_list.append(method_name)
+        return self.method_slots[method_name]
+
     def declare_method(self, method_name: str):
         """If we need calls to a method before we
         define the method, we can declare it at the
@@ -262,25 +460,24 @@ class ObjectCode:
         we define before (or without) calling from within
         the same class.
         """
-        if method_name not in self.method_list:
-            self.method_list.append(method_name)
+        self.add_method_slot(method_name)
         # That's all!  We're just reserving a spot
         # in the vtable.  Bad things will happen if
         # it's not filled in later in the code.
 
     def begin_method(self, method_name: str):
-        self.resolve_jumps()  # Of preceding method!
+        self.end_method()  # Of preceding method!
         # And then re-initialize tables
         # label -> address
         self.labels: Dict[str, int] = {}
         # address -> unresolved label
         self.label_patch: Dict[int, str] = {}
         ###
-        if method_name not in self.method_list:
-            self.method_list.append(method_name)
-        method_slot = self.method_list.index(method_name)
+        method_slot = self.add_method_slot(method_name)
         # Initialize code block
         self.method_locals = []
+        self.method_args = []
+        self.local_offsets = {}
         self.code = []  # We will append instructions to this list
         self.method_code.append({"name": method_name, "slot": method_slot,
                                  "code": self.code})
@@ -288,10 +485,26 @@ class ObjectCode:
     def declare_locals(self, method_locals: List[str]):
         """Map local variable names to position in activation record"""
         self.method_locals = method_locals
+        # Local variables start at fp+3 (see resolve_local)
+        for local_num, var in enumerate(method_locals):
+            # An argument of the same name takes precedence
+            self.local_offsets.setdefault(var, 3 + local_num)
+
+    def allocate_locals(self, method_locals: List[str]):
+        """Allocate space on stack for local variables, and
+        set up locals symbol table information
+        """
+        self.add_instruction(Instruction(
+            label=None,
+            operation=INSTRS["alloc"],
+            operand=len(method_locals)))
+        self.declare_locals(method_locals)
 
     def declare_args(self, args: List[str]):
         """Map argument names to offsets *before* the frame pointer"""
         self.method_args = args
+        for arg_num, var in enumerate(args):
+            self.local_offsets[var] = arg_num - len(args)
 
     def resolve_local(self, var: str) -> int:
         """Map local variable to position in activation record.
@@ -304,12 +517,8 @@ class ObjectCode:
         if var == "$":
             # Special case for the "this" variable
             return 0
-        if var in self.method_args:
-            arg_num = self.method_args.index(var)
-            return arg_num - len(self.method_args)
-        if var in self.method_locals:
-            local_num = self.method_locals.index(var)
-            return 3 + local_num
+        if var in self.local_offsets:
+            return self.local_offsets[var]
         log.error(f"Local variable {var} not declared in this method")
         return 88   # Just a placeholder; this code should not be used!
 
@@ -319,10 +528,10 @@ class ObjectCode:
         try:
             if class_name == "$":
                 # This class
-                method_slot = self.method_list.index(method_name)
+                method_slot = self.method_slots[method_name]
             else:
                 # Imported class
-                module_record = import_module(class_name)
+                module_record = self.import_module(class_name)
                 method_slot = module_record.method_slot(method_name)
         except LookupError:
             log.error(f"No such method '{full_name}'")
@@ -335,10 +544,10 @@ class ObjectCode:
         try:
             if class_name == "$":
                 # This class
-                field_slot = self.field_list.index(field_name)
+                field_slot = self.field_slots[field_name]
             else:
                 # Imported class (is that legal in Quack?)
-                module_record = import_module(class_name)
+                module_record = self.import_module(class_name)
                 field_slot = module_record.field_slot(field_name)
         except LookupError:
             log.error(f"No such field '{full_name}'")
@@ -346,9 +555,49 @@ class ObjectCode:
         return field_slot
 
     def resolve_class(self, class_name: str) -> int:
-        import_module(class_name)  # In case we need to
-        index = list(IMPORTS).index(class_name)
-        return index
+        self.import_module(class_name)  # In case we need to
+        return self.import_index[class_name]
+
+    def import_module(self, module: str) -> ImportedModule:
+        if module not in self.imports:
+            self.imports[module] = self.resolver.interface(module)
+            self.import_index[module] = len(self.import_index)
+        return self.imports[module]
+
+    def end_method(self):
+        """Encode buffered code of the current method, if
+        optimizing, and resolve its jumps.
+        """
+        if self.pending:
+            before = peephole.count_instructions(self.pending)
+            optimized = peephole.optimize(self.pending, self.make_instruction)
+            after = peephole.count_instructions(optimized)
+            optimized = peephole.select_superinstructions(
+                optimized, INSTRS.fusions, self.make_superinstruction)
+            dispatches = peephole.count_instructions(optimized)
+            log.info(f"{self.class_name}:{self.method_code[-1]['name']} "
+                     f"{before} -> {after} instructions, "
+                     f"{dispatches} with superinstructions")
+            self.pending = []
+            for item in optimized:
+                if peephole.is_label(item):
+                    self.emit_label(item)
+                else:
+                    self.emit(item)
+        self.resolve_jumps()
+
+    def finish(self):
+        """End the last method"""
+        self.end_method()
+
+    @staticmethod
+    def make_instruction(opname: str, operand: Optional[str]) -> Instruction:
+        return Instruction(None, INSTRS[opname], operand)
+
+    @staticmethod
+    def make_superinstruction(operation: InstructionDef,
+                              parts: List[Instruction]) -> Instruction:
+        return Instruction(None, operation, None, parts)
 
     def resolve_jumps(self):
         """Patch up references to code labels"""
@@ -376,18 +625,33 @@ class ObjectCode:
 
     def add_label(self, label: str):
         """On a line by itself"""
-        self.labels[label] = len(self.code)
+        if self.optimize:
+            self.pending.append(label)
+        else:
+            self.emit_label(label)
 
     def add_instruction(self, instr: Instruction):
+        if self.optimize:
+            self.pending.append(instr)
+        else:
+            self.emit(instr)
+
+    def emit_label(self, label: str):
+        self.labels[label] = len(self.code)
+
+    def emit(self, instr: Instruction):
+        """Encode an instruction in the current method"""
         if instr.label:
             # Address of next instruction
             self.labels[instr.label] = len(self.code)
         self.code.append(instr.operation.code)
-        if instr.operand:
-            # Many operands require interpretation
-            # that depends on the operation
-            op_value = self.encode_operand(instr)
-            self.code.append(op_value)
+        # Operands of a superinstruction are those of its parts, in order
+        for part in instr.parts or [instr]:
+            if part.operand:
+                # Many operands require interpretation
+                # that depends on the operation
+                op_value = self.encode_operand(part)
+                self.code.append(op_value)
 
     def encode_operand(self, instr: Instruction):
         """Each operand type is idiosyncratic"""
@@ -403,17 +667,20 @@ class ObjectCode:
             # in the loader.
             if operand in NAMED_LITERALS:
                 return NAMED_LITERALS[operand]
-            if re.match("[0-9]+", operand):
-                kind = "i"
-            elif re.match('["][^"]*["]', operand):
+            if operand.startswith('"'):
                 kind = "s"
                 operand = operand.strip("\"").\
                     encode("utf-8").decode("unicode_escape")
+            elif INT_LITERAL_PAT.fullmatch(operand):
+                kind = "i"
             else:
                 log.error(f"Could not type operand '{operand}'")
                 kind = "BOGUS CONSTANT"
-            self.constants.append({"kind": kind, "value": operand})
-            return len(self.constants) - 1
+            key = (kind, operand)
+            if key not in self.constant_index:
+                self.constant_index[key] = len(self.constants)
+                self.constants.append({"kind": kind, "value": operand})
+            return self.constant_index[key]
         if op == "call":
             slot = self.resolve_call(operand)
             return slot
@@ -439,11 +706,12 @@ class ObjectCode:
         # Match should be exhaustive
         log.error(f"Unhandled operand type for {instr}")
 
-    def json(self) -> str:
-        struct = {
+    def struct(self) -> dict:
+        """Contents of the object code file"""
+        return {
             "class_name": self.class_name,
             "super": self.super_name,
-            "imports": [self.class_name] + list(IMPORTS)[1:],
+            "imports": [self.class_name] + list(self.imports)[1:],
             "methods": self.method_list,
             "fields": self.field_list,
             # It's just simpler to count fields and methods
@@ -455,7 +723,9 @@ class ObjectCode:
             "constants": self.constants,
             "code": self.method_code
         }
-        return json.dumps(struct, indent=4)
+
+    def json(self) -> str:
+        return json.dumps(self.struct(), indent=4)
 
     def __str__(self) -> str:
         return self.json()
@@ -463,190 +733,344 @@ class ObjectCode:
 
 # ----------------
 #  Assembly code is line-oriented and can be parsed
-#  with regular expressions.  We strip away comments
-#  and then scan for label, operation, and operand fields.
+#  with regular expressions.  A single pattern classifies
+#  a line as one of the directives, an instruction, or a
+#  label, and also skips blank lines and comments;  the
+#  alternative that matched is the last group of the match
+#  (lastgroup), since each is wrapped in a named group.
 #
 
-def strip_comments(line: str) -> str:
-    return line.split("#")[0].strip()
-    # Note comment lines will now be empty,
-    # as will blank lines.
+LINE_PAT = re.compile(r"""
+    \s*
+    (?:
+      # Directive:  Name this class
+        (?P<class_decl> [.]class \s+
+            (?P<class_name> [\w$]+ )[:](?P<super_name> \w+) )
+      # Directive:  Name this method, which is either declared to be
+      # defined later in this class, so we can call it before we
+      # define it (.method f forward), or followed immediately by
+      # its body (starting a new method entry in the code object)
+      | (?P<method_decl> [.]method \s+
+            (?P<method_name> [$]?\w+ ) (?P<forward> \s+ forward )? )
+      # Directive:  Add fields to the objects of this class
+      | (?P<field_decl> [.]field \s+
+            (?P<field_names> \w+ (\s*,\s*\w+)* ) )
+      # Local variables:  The assembler emits an "alloc" instruction
+      # and records the positions of local variables so that they
+      # can be used within method code.
+      | (?P<locals_decl> [.]local \s+
+            (?P<local_names> \w+ (\s*,\s*\w+)* ) )
+      # Method arguments:  These will have addresses that are at
+      # a negative offset from the frame pointer
+      | (?P<args_decl> [.]args \s+
+            (?P<arg_names> \w+ (\s*,\s*\w+)* ) )
+      # Instruction (single operation of vm), with optional label
+      | (?P<instr>
+            ((?P<label> \w+) [:] \s* )?
+            (?P<opname> [a-zA-Z_]+)     # Operation name is required
+            (\s+ (?P<operand>           # Operands are integers, quoted strings, or names
+                     -?[0-9]+           # Integers are strings of digits, maybe negative
+                   |
+                     ["](               # String begins and ends with quote
+                       ([\\].)  |           # Anything escaped
+                       [^"\\]               # Anything but a quote or escape
+                     )*["]
+                   |
+                     (\w|[:$])+         # name, which may be part:part or $:part
+                 )
+            )?                          # Operand is optional
+        )
+      # Bare label
+      | (?P<bare_label> (?P<label_only> \w+) [:] )
+    )?
+    \s*
+    (?: [#] .* )?     # Comment
+    """, re.VERBOSE | re.DOTALL)
 
+NAME_LIST_SEP = re.compile(r"\s*,\s*")
 
-# Instruction pattern (single operation of vm)
-INSTR_PAT = re.compile(r"""
-    ((?P<label> \w+) [:] )?   # Optional label
-    \s*
-    (?P<opname> [a-zA-Z_]+)      # Operation name is required
-    (\s+ (?P<operand>     # Operands are integers, quoted strings, or names
-             [0-9]+           # Integers are strings of digits
-           |
-             ["](             # String begins and ends with quote 
-               ([\\].)  |           # Anything escaped
-               [^"\\]               # Anything but a quote or escape
-             )*["]
-           |
-             (\w|[:$])+         # name, which may be part:part or $:part
-             )
-    )?                # Operand is optional
-   \s*
-    """, re.VERBOSE)
-
-# Bare labels
-LABEL_PAT = re.compile(r"""
-    ((?P<label> \w+):)   # Nothing but the label
-   \s*
-    """, re.VERBOSE)
-
-# Directive:  Name this class
-CLASS_DECL_PAT = re.compile(r"""
-[.]class \s+ 
-(?P<class_name> [\w$]+ )[:](?P<super_name> \w+)
-\s*
-""", re.VERBOSE)
-
-# Directive: Name this method
-#   (Starts a new method entry in the code object)
-METHOD_DEF_PAT = re.compile(r"""
-[.]method \s+
-(?P<method_name> [$]?\w+ )
-\s*
-""", re.VERBOSE)
-
-# Directive:  Declare a method to be defined
-# later in this class, so we can call it before
-# we define it.
-METHOD_DECL_PAT = re.compile(r"""
-[.]method \s+ 
-(?P<method_name> [$]?\w+ )
-\s+ forward
-\s*
-""", re.VERBOSE)
-
-
-# Directive: Add a field to the objects of this class
-FIELD_DECL_PAT = re.compile(r"""
-[.]field \s+
-(?P<field_name> \w+ )
-\s*
-""", re.VERBOSE)
-
-# Local variable:  The assembler emits an "alloc" instruction
-#   and records the positions of local variables so that they
-#   can be used within method code.
-LOCALS_DECL_PAT = re.compile(r"""
-[.]local \s+
-(?P<local_var_name> (\w+)(,\w+)*)
-\s*
-""", re.VERBOSE)
-
-# Method argument:
-#    These will have addresses that are at a negative
-#    offset from the frame pointer
-ARGS_DECL_PAT = re.compile(r"""
-[.]args \s+
-(?P<arg_var_name> (\w+)(,\w+)*)
-\s*
-""", re.VERBOSE)
-
-
-def translate(lines: List[str]) -> ObjectCode:
-    code = ObjectCode()
+INT_LITERAL_PAT = re.compile(r"-?[0-9]+")
+
+
+def parse_lines(lines: Iterable[str]) -> Iterator[re.Match]:
+    """Matches of LINE_PAT for the non-blank lines of a source,
+    which is read lazily
+    """
     for line in lines:
-        line = strip_comments(line)
-        if not line:
-            continue
+        match = LINE_PAT.fullmatch(line)
+        if not match:
+            log.error(f"NO MATCH on '{line.strip()}'")
+        elif match.lastgroup:
+            yield match
+
+
+def translate(lines: Iterable[str], optimize: bool = False,
+              resolver: Optional[ImportResolver] = None) -> ObjectCode:
+    code = ObjectCode(optimize, resolver)
+    for match in parse_lines(lines):
+        kind = match.lastgroup
+        if kind == "instr":
+            # An operation (label: operation operand)
+            instruction = Instruction(match["label"], INSTRS[match["opname"]],
+                                      match["operand"])
+            code.add_instruction(instruction)
+        elif kind == "bare_label":
+            # A label with no instruction
+            code.add_label(match["label_only"])
+        elif kind == "method_decl":
+            if match["forward"]:
+                code.declare_method(match["method_name"])
+            else:
+                code.begin_method(match["method_name"])
+        elif kind == "locals_decl":
+            code.allocate_locals(NAME_LIST_SEP.split(match["local_names"]))
+        elif kind == "args_decl":
+            # No space allocation needed, unlike local variables,
+            # because these are *before* (at negative offsets from)
+            # the frame pointer.
+            code.declare_args(NAME_LIST_SEP.split(match["arg_names"]))
+        elif kind == "field_decl":
+            for field_name in NAME_LIST_SEP.split(match["field_names"]):
+                code.declare_field(field_name)
+        elif kind == "class_decl":
+            code.declare_class(match["class_name"], match["super_name"])
+
+    code.finish()
+    return code
 
-        # Kinds of assembly language line:
-        # Class declaration (.class)
-        match = CLASS_DECL_PAT.match(line)
-        if match:
-            class_name = match.groupdict()["class_name"]
-            superclass_name = match.groupdict()["super_name"]
-            code.declare_class(class_name, superclass_name)
-            continue
 
-        # Method (.method f forward) to be filled in later
-        match = METHOD_DECL_PAT.match(line)
-        if match:
-            method_name = match.groupdict()["method_name"]
-            code.declare_method(method_name)
-            continue
+# ----------------
+#  Building many classes at once.  A class can be assembled only
+#  after the object code of every class it imports exists, so we
+#  scan each source for the classes it refers to and assemble
+#  them in dependency order, independent classes in parallel.
+#
 
-        # Method (.method) followed immediately by body
-        match = METHOD_DEF_PAT.match(line)
-        if match:
-            method_name = match.groupdict()["method_name"]
-            code.begin_method(method_name)
-            continue
+# Operands of the form Class:name refer to Class
+QUALIFIED_OPERAND_PAT = re.compile(r"(?P<module>\w+):[$]?\w+")
 
-        # Field declaration, ".field name"
-        match = FIELD_DECL_PAT.match(line)
-        if match:
-            field_name = match.groupdict()["field_name"]
-            code.declare_field(field_name)
-            continue
 
-        # Local variable declaration, ".local name,name,name"
-        match = LOCALS_DECL_PAT.match(line)
-        if match:
-            locals_name_list = match.groupdict()["local_var_name"]
-            method_locals = locals_name_list.split(",")
-            n_locals = len(method_locals)
-            # Allocate space on stack for local variables
-            code.add_instruction(Instruction(
-                label=None,
-                operation=INSTRS["alloc"],
-                operand=n_locals))
-            # Now set up locals symbol table information
-            code.declare_locals(method_locals)
+def module_dependencies(lines: Iterable[str]) -> Tuple[str, Set[str]]:
+    """Name of the class defined in assembly source,
+    and the names of the other classes it imports.
+    """
+    class_name = ""
+    depends: Set[str] = set()
+    for match in parse_lines(lines):
+        kind = match.lastgroup
+        if kind == "class_decl":
+            class_name = match["class_name"]
+            depends.add(match["super_name"])
             continue
-
-        # Local variable declaration, ".local name,name,name"
-        match = ARGS_DECL_PAT.match(line)
-        if match:
-            locals_name_list = match.groupdict()["arg_var_name"]
-            args = locals_name_list.split(",")
-            # No space allocation needed, unlike local variables,
-            # because these are *before* (at negative offsets from)
-            # the frame pointer.
-            # Set up locals symbol table information
-            code.declare_args(args)
+        if kind != "instr" or not match["operand"]:
             continue
+        opname = match["opname"]
+        operand = match["operand"]
+        if opname in ["new", "is_instance"]:
+            depends.add(operand)
+        elif opname in ["call", "load_field", "store_field"]:
+            qualified = QUALIFIED_OPERAND_PAT.fullmatch(operand)
+            if qualified:
+                depends.add(qualified.groupdict()["module"])
+    depends.discard(class_name)
+    return class_name, depends
+
+
+def object_suffix(binary: bool) -> str:
+    return objfile.BINARY_SUFFIX if binary else objfile.JSON_SUFFIX
+
+
+def remove_other_format(target: Path, binary: bool):
+    """Remove object code for the same class in the other format
+    next to target;  the loaders prefer .tvm, so a stale one would
+    shadow the new code.
+    """
+    if target.suffix == object_suffix(binary):
+        target.with_suffix(object_suffix(not binary)).unlink(missing_ok=True)
 
-        # An operation (label: operation operand)
-        match = INSTR_PAT.fullmatch(line)
-        if match:
-            parts = match.groupdict()
-            label = parts["label"]
-            opname = parts["opname"]
-            operand = parts["operand"]
-            instruction = Instruction(label, INSTRS[opname], operand)
-            code.add_instruction(instruction)
-            continue
 
-        # A label with no instruction
-        # An operation (label: operation operand)
-        match = LABEL_PAT.match(line)
-        if not match:
-            log.error(f"NO MATCH on '{line}'")
-            continue
-        parts = match.groupdict()
-        label = parts["label"]
-        code.add_label(label)
+def assemble_file(source: Path, target: Path, binary: bool = False,
+                  optimize: bool = False,
+                  resolver: Optional[ImportResolver] = None) -> bool:
+    """Assemble one source file into one object code file.
+    The resolver checks that imported modules have not been
+    rebuilt since it last looked at them.
+    """
+    resolver = resolver or default_resolver()
+    try:
+        with open(source, "r") as f:
+            objcode = translate(f, optimize, resolver)
+        with open(target, "wb") as f:
+            objfile.write(objcode.struct(), f, binary)
+    except Exception as e:
+        log.error(f"Failed to assemble {source}: {e}")
+        return False
+    finally:
+        resolver.save()
+    return True
+
+
+def file_digest(path) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class BuildManifest:
+    """What each class in TVMLIB was assembled from: hashes of
+    its source, of the instruction set, and of the method and field
+    layout of each module it imports.  A class is up to date if none
+    of these have changed since it was assembled.  Since a rebuilt
+    class is re-hashed before its dependents are checked, a change
+    in layout (e.g., a superclass gaining a method slot) cascades to
+    the classes that import it, while a change to method code alone
+    does not.
+    """
+    def __init__(self, lib: Path, suffix: str, optimize: bool = False):
+        self.path = lib.joinpath(".asm_manifest.json")
+        self.suffix = suffix   # Of the object files we build
+        self.optimize = optimize
+        self.records: Dict[str, dict] = {}
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                self.records = json.load(f)
+        self.opdefs_digest = file_digest(OPDEFS_PATH)
+        self.layouts: Dict[str, Optional[str]] = {}   # module -> digest
+
+    def layout_digest(self, module: str) -> Optional[str]:
+        """Current layout of a module on the TVMLIB search path,
+        or None if missing
+        """
+        if module not in self.layouts:
+            try:
+                self.layouts[module] = default_resolver().interface(module).layout_digest()
+            except FileNotFoundError:
+                self.layouts[module] = None
+        return self.layouts[module]
+
+    def up_to_date(self, class_name: str, source: Path) -> bool:
+        record = self.records.get(class_name)
+        if not record:
+            return False
+        target = CONFIG.tvmlib.joinpath(class_name + self.suffix)
+        if not target.exists():
+            return False
+        if (record["source_digest"] != file_digest(source)
+                or record["opdefs_digest"] != self.opdefs_digest
+                or record.get("optimize", False) != self.optimize):
+            return False
+        for module, digest in record["imports"].items():
+            if self.layout_digest(module) != digest:
+                log.debug(f"Layout of {module} changed; rebuilding {class_name}")
+                return False
+        return True
+
+    def record(self, class_name: str, source: Path):
+        """Note inputs of a freshly assembled class"""
+        target = CONFIG.tvmlib.joinpath(class_name + self.suffix)
+        self.layouts.pop(class_name, None)   # May have changed
+        imports = objfile.load(target)["imports"]
+        self.records[class_name] = {
+            "source": str(source),
+            "source_digest": file_digest(source),
+            "opdefs_digest": self.opdefs_digest,
+            "optimize": self.optimize,
+            "imports": {module: self.layout_digest(module)
+                        for module in imports if module != class_name}
+        }
 
+    def save(self):
+        with open(self.path, "w") as f:
+            json.dump(self.records, f, indent=4)
 
 
-    code.resolve_jumps()  # Of the last method entered
-    return code
+def build(sources: List[Path], jobs: int, force: bool = False,
+          binary: bool = False, optimize: bool = False) -> bool:
+    """Assemble sources into CONFIG.tvmlib in dependency order,
+    using a pool of up to 'jobs' processes.  Unless forced, classes
+    that are up to date according to the build manifest are skipped.
+    """
+    units: Dict[str, Path] = {}
+    waiting_for: Dict[str, Set[str]] = {}
+    for source in sources:
+        with open(source, "r") as f:
+            class_name, depends = module_dependencies(f)
+        if not class_name:
+            log.error(f"No .class declaration in {source}")
+            return False
+        units[class_name] = source
+        waiting_for[class_name] = depends
+    # Dependencies on modules outside this build must already
+    # be available in TVMLIB
+    for class_name in units:
+        waiting_for[class_name] &= set(units)
+    suffix = object_suffix(binary)
+    manifest = BuildManifest(CONFIG.tvmlib, suffix, optimize)
+    ok = True
+    ready = [c for c in units if not waiting_for[c]]
+    running: Dict[concurrent.futures.Future, str] = {}
+
+    def finished(class_name: str):
+        """Dependents of class_name may now be ready"""
+        for dependent, depends in waiting_for.items():
+            if class_name in depends:
+                depends.remove(class_name)
+                if not depends:
+                    ready.append(dependent)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        while ready or running:
+            while ready:
+                class_name = ready.pop()
+                del waiting_for[class_name]
+                if not force and manifest.up_to_date(class_name, units[class_name]):
+                    log.info(f"{class_name} is up to date")
+                    finished(class_name)
+                    continue
+                target = CONFIG.tvmlib.joinpath(class_name + suffix)
+                remove_other_format(target, binary)
+                future = pool.submit(assemble_file, units[class_name],
+                                     target, binary, optimize)
+                running[future] = class_name
+            if not running:
+                break
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                class_name = running.pop(future)
+                if not future.result():
+                    ok = False
+                    manifest.records.pop(class_name, None)
+                    continue
+                log.info(f"Assembled {units[class_name]}")
+                manifest.record(class_name, units[class_name])
+                finished(class_name)
+    manifest.save()
+    for class_name, depends in waiting_for.items():
+        log.error(f"Could not assemble {class_name}, "
+                  f"which depends on {', '.join(sorted(depends))}")
+        ok = False
+    return ok
 
 
 def main():
-    """Assemble one file into object code in json format"""
+    """Assemble one file into object code in json (or binary) format,
+    or with --jobs, many files into TVMLIB.
+    """
     args = cli()
-    source = [line for line in args.source]
-    objcode = translate(source)
-    print(objcode.json(), file=args.target)
+    binary = args.format == "bin"
+    if args.jobs is not None:
+        ok = build([Path(src) for src in args.source], args.jobs,
+                   args.force, binary, args.optimize)
+        sys.exit(0 if ok else 1)
+    with open(args.source[0], "r") as f:
+        objcode = translate(f, args.optimize)
+    if len(args.source) > 1:
+        target = Path(args.source[1])
+        remove_other_format(target, binary)
+        with open(target, "wb") as f:
+            objfile.write(objcode.struct(), f, binary)
+    else:
+        objfile.write(objcode.struct(), sys.stdout.buffer, binary)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,101 @@
+"""Assembler throughput on a generated multi-megabyte source file.
+
+The generated class has many methods of ordinary code:  constants,
+loads and stores of locals, field accesses, calls, and branches,
+with comments and blank lines sprinkled in.  The assembler reads
+the file as a stream and writes JSON object code;  we report lines
+and megabytes of source per second.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+os.chdir(ROOT)       # assemble.py reads asm.conf and opdefs.txt from here
+sys.path.insert(0, str(ROOT))
+import assemble      # noqa: E402
+
+BODY = """\
+    # Method {m}
+    load a
+    const {k}
+    call Int:plus
+    store v0
+    const "label {m}"
+    store v1
+loop_{m}:
+    const 10
+    load v0
+    call Int:less
+    jump_ifnot done_{m}
+    load v0
+    const 1
+    call Int:plus
+    store v0
+    load $
+    load_field $:count
+    pop
+    jump loop_{m}
+
+done_{m}:   # Fall through to the return
+    load v1
+    load b
+    load a
+    call $:m{callee}
+    pop
+    load v0
+    return 2
+"""
+
+
+def write_source(path: Path, n_methods: int) -> int:
+    """Generate a class with n_methods methods; number of lines"""
+    n_lines = 0
+    with open(path, "w") as f:
+        header = [".class Synthetic:Obj", ".field count"]
+        header += [f".method m{m} forward" for m in range(n_methods)]
+        f.write("\n".join(header) + "\n")
+        n_lines += len(header)
+        for m in range(n_methods):
+            text = (f".method m{m}\n.args a,b\n.local v0,v1\n    enter\n"
+                    + BODY.format(m=m, k=m % 1000, callee=(m * 7) % n_methods))
+            f.write(text)
+            n_lines += text.count("\n")
+    return n_lines
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--methods", type=int, default=5000,
+                        help="Methods in the generated class")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Best of this many runs")
+    return parser.parse_args()
+
+
+def main():
+    args = cli()
+    assemble.log.setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp).joinpath("Synthetic.asm")
+        target = Path(tmp).joinpath("Synthetic.json")
+        n_lines = write_source(source, args.methods)
+        megabytes = source.stat().st_size / 1e6
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            if not assemble.assemble_file(source, target):
+                sys.exit("Assembly failed")
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    print(f"{'lines':>8} {'MB':>6} {'seconds':>8} {'lines/s':>10} {'MB/s':>6}")
+    print(f"{n_lines:>8} {megabytes:>6.1f} {best:>8.3f} "
+          f"{n_lines / best:>10.0f} {megabytes / best:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
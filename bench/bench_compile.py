@@ -0,0 +1,81 @@
+"""The Quack compiler on large synthetic programs.
+
+Each generated program is a main block of n statements:  assignments
+of small Int expressions to ten variables, with an if/else every
+hundred statements.  Parsing and the analysis passes (initialization,
+type checking, constant folding) are timed separately from code
+generation, which streams the assembly code to a file, and from
+generating object code directly (emit_objects) and from assembling
+the generated file.  Time per statement should stay roughly constant
+as n grows.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+os.chdir(ROOT)       # compile.py reads orilib/ from here
+sys.path.insert(0, str(ROOT))
+import assemble      # noqa: E402
+import compile       # noqa: E402
+
+N_VARS = 10
+
+
+def synthetic_program(n_statements: int) -> str:
+    """Quack source for a main block of n_statements statements"""
+    lines = [f"v{k} = {k};" for k in range(N_VARS)]
+    for i in range(n_statements):
+        a, b, c = (f"v{(i + k) % N_VARS}" for k in range(3))
+        if i % 100 == 99:
+            lines.append(f"if {a} < {b} {{ {c} = {c} + 1; }} else {{ {c} = 0; }}")
+        else:
+            lines.append(f"{a} = {c} * 2 + {i % 1000};")
+    return "\n".join(lines) + "\n"
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("sizes", nargs="*", type=int,
+                        default=[10000, 30000, 100000],
+                        help="Numbers of statements to try")
+    return parser.parse_args()
+
+
+def main():
+    args = cli()
+    compile.log.setLevel(logging.WARNING)
+    assemble.log.setLevel(logging.WARNING)
+    compiler = compile.Compiler(compile.cached_parser())
+    print(f"{'statements':>10} {'asm lines':>10} {'analyze s':>10} "
+          f"{'codegen s':>10} {'usec/stmt':>10} {'objects s':>10} {'assemble s':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        target = Path(tmp).joinpath("Synthetic.asm")
+        for n in args.sizes:
+            source = synthetic_program(n)
+            start = time.perf_counter()
+            ast = compiler.analyze(source)
+            analyzed = time.perf_counter()
+            with open(target, "w") as out:
+                compile.emit(ast, out)
+            generated = time.perf_counter()
+            compile.emit_objects(ast)
+            objects = time.perf_counter() - generated
+            assembly_start = time.perf_counter()
+            with open(target) as asm:
+                assemble.translate(asm)
+            assembled = time.perf_counter() - assembly_start
+            with open(target) as asm:
+                n_lines = sum(1 for _ in asm)
+            codegen = generated - analyzed
+            print(f"{n:>10} {n_lines:>10} {analyzed - start:>10.3f} "
+                  f"{codegen:>10.3f} {1e6 * codegen / n:>10.2f} "
+                  f"{objects:>10.3f} {assembled:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""The native Dict on 10^3 .. 10^6 keys, against a linear search.
+
+Each Quack program puts n keys, looks up each of them and n keys
+that are not there, and (for Dict) removes them all again, then
+prints how many lookups found their key.  The keys are Ints, or
+Strings made from Ints.  The linear program keeps its keys in a
+List and compares them one by one with equals, as Quack code had
+to before Dict;  it is only run up to --linear-max keys.  Programs
+are compiled with compile.py --objects and run in a release build
+of bin/tiny_vm.
+"""
+import argparse
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+os.chdir(ROOT)       # compile.py reads orilib/ from here
+sys.path.insert(0, str(ROOT))
+import assemble      # noqa: E402
+import compile       # noqa: E402
+
+BUILTINS = ["Bool.json", "Dict.json", "Int.json", "List.json", "Nothing.json",
+            "Obj.json", "String.json", "StringBuilder.json"]
+
+# Lookups alternate between a key that is there and one that is not
+DICT_INT = """\
+d = Dict();
+i = 0;
+while i < {n} {
+    d.put(i * 7, i);
+    i = i + 1;
+}
+found = 0;
+i = 0;
+while i < {n} {
+    if d.has(i * 7) == true { found = found + 1; }
+    if d.has(i * 7 + 3) == true { found = found + 1; }
+    i = i + 1;
+}
+i = 0;
+while i < {n} {
+    d.remove(i * 7);
+    i = i + 1;
+}
+found.print();
+"""
+
+DICT_STRING = """\
+d = Dict();
+i = 0;
+while i < {n} {
+    d.put(i.string(), i);
+    i = i + 1;
+}
+found = 0;
+i = 0;
+while i < {n} {
+    if d.has(i.string()) == true { found = found + 1; }
+    if d.has((i + {n}).string()) == true { found = found + 1; }
+    i = i + 1;
+}
+i = 0;
+while i < {n} {
+    d.remove(i.string());
+    i = i + 1;
+}
+found.print();
+"""
+
+LINEAR = """\
+keys = List();
+i = 0;
+while i < {n} {
+    keys.append(i * 7);
+    i = i + 1;
+}
+found = 0;
+j = 0;
+i = 0;
+while i < {n} {
+    j = 0;
+    while j < keys.length() and keys.get(j).equals(i * 7) == false { j = j + 1; }
+    if j < keys.length() { found = found + 1; }
+    j = 0;
+    while j < keys.length() and keys.get(j).equals(i * 7 + 3) == false { j = j + 1; }
+    if j < keys.length() { found = found + 1; }
+    i = i + 1;
+}
+found.print();
+"""
+
+# Name: (template, operations per key)
+PROGRAMS = {"Dict Int": (DICT_INT, 4), "Dict String": (DICT_STRING, 4),
+            "linear": (LINEAR, 3)}
+
+ELAPSED = re.compile(r"in ([0-9.]+) seconds")
+
+
+def build(compiler: compile.Compiler, lib: Path, template: str, n: int):
+    """Object code for the program with n keys in lib"""
+    # The templates are full of braces, so fill in n by hand
+    objects = compiler.compile_to_objects(template.replace("{n}", str(n)))
+    compile.write_objects(objects, lib)
+
+
+def run(tiny_vm: Path, lib: Path, heap: str) -> (str, float):
+    """Output and run time of $Main"""
+    proc = subprocess.run([str(tiny_vm), "-S", "-H", heap, "-L", str(lib), "$Main"],
+                          text=True, check=True, capture_output=True)
+    runs = ELAPSED.findall(proc.stderr)
+    if not runs:
+        sys.exit(f"No statistics from tiny_vm:\n{proc.stderr[-2000:]}")
+    return proc.stdout.strip(), float(runs[-1])
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("sizes", nargs="*", type=int,
+                        default=[1000, 10000, 100000, 1000000],
+                        help="Numbers of keys to try")
+    parser.add_argument("--linear-max", type=int, default=1000,
+                        help="Largest number of keys for the linear search")
+    parser.add_argument("--heap", default="256M",
+                        help="Heap size for tiny_vm -H")
+    return parser.parse_args()
+
+
+def main():
+    args = cli()
+    tiny_vm = ROOT.joinpath("bin", "tiny_vm")
+    if not tiny_vm.exists():
+        sys.exit(f"Build {tiny_vm} first")
+    compile.log.setLevel(logging.WARNING)
+    assemble.log.setLevel(logging.WARNING)
+    compiler = compile.Compiler(compile.cached_parser())
+    print(f"{'keys':>8} {'program':>11} {'run s':>9} {'nsec/op':>9}")
+    for n in args.sizes:
+        for name, (template, ops_per_key) in PROGRAMS.items():
+            if name == "linear" and n > args.linear_max:
+                continue
+            with tempfile.TemporaryDirectory() as tmp:
+                lib = Path(tmp)
+                for builtin in BUILTINS:
+                    shutil.copy(ROOT.joinpath("OBJ", builtin), lib)
+                build(compiler, lib, template, n)
+                output, seconds = run(tiny_vm, lib, args.heap)
+            if output != str(n):
+                sys.exit(f"{name} found {output} of {n} keys")
+            print(f"{n:>8} {name:>11} {seconds:>9.4f} "
+                  f"{1e9 * seconds / (ops_per_key * n):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
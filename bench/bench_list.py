@@ -0,0 +1,148 @@
+"""The native List against a linked list of Quack objects.
+
+Each program builds a list of the Ints 0 .. n-1 and then adds them
+up.  The linked list is made of Node objects, with a call per
+element to walk it;  the List programs append to a built-in List
+and then either walk it with get or add it up with its native sum
+method.  get returns an Obj, which Quack cannot add to an Int, so
+the get program visits every element and then calls sum too.  All
+three print the same total.  Programs are compiled with
+compile.py --objects and run in a release build of bin/tiny_vm.
+"""
+import argparse
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+os.chdir(ROOT)       # compile.py reads orilib/ from here
+sys.path.insert(0, str(ROOT))
+import assemble      # noqa: E402
+import compile       # noqa: E402
+
+BUILTINS = ["Bool.json", "Dict.json", "Int.json", "List.json", "Nothing.json",
+            "Obj.json", "String.json", "StringBuilder.json"]
+
+LINKED = """\
+class Link() {
+    def last(): Bool { return true; }
+    def value(): Int { return 0; }
+    def next(): Link { return this; }
+}
+
+class Node(v: Int, rest: Link) extends Link {
+    this.v = v;
+    this.rest = rest;
+    def last(): Bool { return false; }
+    def value(): Int { return this.v; }
+    def next(): Link { return this.rest; }
+}
+
+items: Link = Link();
+i = 0;
+while i < {n} {
+    items = Node(i, items);
+    i = i + 1;
+}
+total = 0;
+cur: Link = items;
+while cur.last() == false {
+    total = total + cur.value();
+    cur = cur.next();
+}
+total.print();
+"""
+
+LIST_GET = """\
+items = List();
+i = 0;
+while i < {n} {
+    items.append(i);
+    i = i + 1;
+}
+i = 0;
+while i < items.length() {
+    items.get(i);
+    i = i + 1;
+}
+total = items.sum();
+total.print();
+"""
+
+LIST_SUM = """\
+items = List();
+i = 0;
+while i < {n} {
+    items.append(i);
+    i = i + 1;
+}
+total = items.sum();
+total.print();
+"""
+
+PROGRAMS = {"linked": LINKED, "List get": LIST_GET, "List sum": LIST_SUM}
+
+ELAPSED = re.compile(r"in ([0-9.]+) seconds")
+
+
+def build(compiler: compile.Compiler, lib: Path, template: str, n: int):
+    """Object code for the program with list size n in lib"""
+    # The templates are full of braces, so fill in n by hand
+    objects = compiler.compile_to_objects(template.replace("{n}", str(n)))
+    compile.write_objects(objects, lib)
+
+
+def run(tiny_vm: Path, lib: Path, heap: str) -> (str, float):
+    """Output and run time of $Main"""
+    proc = subprocess.run([str(tiny_vm), "-S", "-H", heap, "-L", str(lib), "$Main"],
+                          text=True, check=True, capture_output=True)
+    runs = ELAPSED.findall(proc.stderr)
+    if not runs:
+        sys.exit(f"No statistics from tiny_vm:\n{proc.stderr[-2000:]}")
+    return proc.stdout.strip(), float(runs[-1])
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("sizes", nargs="*", type=int,
+                        default=[10000, 100000, 1000000],
+                        help="List lengths to try")
+    parser.add_argument("--heap", default="256M",
+                        help="Heap size for tiny_vm -H")
+    return parser.parse_args()
+
+
+def main():
+    args = cli()
+    tiny_vm = ROOT.joinpath("bin", "tiny_vm")
+    if not tiny_vm.exists():
+        sys.exit(f"Build {tiny_vm} first")
+    compile.log.setLevel(logging.WARNING)
+    assemble.log.setLevel(logging.WARNING)
+    compiler = compile.Compiler(compile.cached_parser())
+    print(f"{'n':>8} {'program':>9} {'run s':>8} {'nsec/elt':>9} {'speedup':>8}")
+    for n in args.sizes:
+        baseline = None
+        expected = None
+        for name, template in PROGRAMS.items():
+            with tempfile.TemporaryDirectory() as tmp:
+                lib = Path(tmp)
+                for builtin in BUILTINS:
+                    shutil.copy(ROOT.joinpath("OBJ", builtin), lib)
+                build(compiler, lib, template, n)
+                output, seconds = run(tiny_vm, lib, args.heap)
+            if expected is None:
+                expected, baseline = output, seconds
+            elif output != expected:
+                sys.exit(f"{name} printed {output}, expected {expected}")
+            print(f"{n:>8} {name:>9} {seconds:>8.4f} "
+                  f"{1e9 * seconds / n:>9.1f} {baseline / seconds:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
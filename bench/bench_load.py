@@ -0,0 +1,108 @@
+"""Loading programs of many classes into the C vm (bin/tiny_vm).
+
+Each generated program has n classes, in inheritance chains ten
+deep, and a main class that creates an object of each and calls
+its string method, so the vm loads every class through the imports
+of the main class.  tiny_vm -S reports the time spent loading;
+time per class should stay roughly constant as n grows.
+Build bin/tiny_vm first.
+"""
+import argparse
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+os.chdir(ROOT)       # assemble.py reads asm.conf and opdefs.txt from here
+sys.path.insert(0, str(ROOT))
+import assemble      # noqa: E402
+
+BUILTINS = ["Bool.json", "Dict.json", "Int.json", "List.json", "Nothing.json",
+            "Obj.json", "String.json", "StringBuilder.json"]
+CHAIN = 10           # Depth of inheritance chains
+
+CLASS = """\
+.class C{i}:{super}
+.field f{i}
+.method m{i}
+    enter
+    const "C{i} is class {i}"
+    return 0
+.method string
+    enter
+    load $
+    call $:m{i}
+    return 0
+"""
+
+LOADED = re.compile(r"Loaded (\d+) classes \((\d+) code words in (\d+) segments\) "
+                    r"in ([0-9.]+) seconds")
+
+
+def write_program(lib: Path, source_dir: Path, n_classes: int):
+    """Object code for classes C0 .. Cn-1 and Main in lib"""
+    resolver = assemble.ImportResolver([lib])
+    main = [".class Main:Obj", ".method $constructor", "    enter"]
+    for i in range(n_classes):
+        super_name = "Obj" if i % CHAIN == 0 else f"C{i - 1}"
+        source = source_dir.joinpath(f"C{i}.asm")
+        source.write_text(CLASS.format(i=i, super=super_name))
+        if not assemble.assemble_file(source, lib.joinpath(f"C{i}.json"),
+                                      resolver=resolver):
+            sys.exit(f"Failed to assemble {source}")
+        main += [f"    new C{i}", f"    call C{i}:string", "    pop"]
+    main += ["    const nothing", "    return 0", ""]
+    source = source_dir.joinpath("Main.asm")
+    source.write_text("\n".join(main))
+    if not assemble.assemble_file(source, lib.joinpath("Main.json"), resolver=resolver):
+        sys.exit("Failed to assemble Main")
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("sizes", nargs="*", type=int,
+                        default=[250, 1000, 2000, 4000],
+                        help="Numbers of classes to try")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Best of this many runs")
+    return parser.parse_args()
+
+
+def main():
+    args = cli()
+    tiny_vm = ROOT.joinpath("bin", "tiny_vm")
+    if not tiny_vm.exists():
+        sys.exit(f"Build {tiny_vm} first")
+    assemble.log.setLevel(logging.WARNING)
+    print(f"{'classes':>8} {'code words':>11} {'segments':>9} "
+          f"{'load s':>9} {'usec/class':>11}")
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            lib = Path(tmp).joinpath("OBJ")
+            lib.mkdir()
+            for name in BUILTINS:
+                shutil.copy(ROOT.joinpath("OBJ", name), lib)
+            write_program(lib, Path(tmp), n)
+            best = None
+            for _ in range(args.repeat):
+                proc = subprocess.run([str(tiny_vm), "-S", "-L", str(lib), "Main"],
+                                      text=True, check=True, stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.PIPE)
+                loaded = LOADED.search(proc.stderr)
+                if not loaded:
+                    sys.exit(f"No load statistics from tiny_vm:\n{proc.stderr[-2000:]}")
+                if best is None or float(loaded.group(4)) < float(best.group(4)):
+                    best = loaded
+            classes, words, segments, seconds = best.groups()
+            seconds = float(seconds)
+            print(f"{classes:>8} {words:>11} {segments:>9} "
+                  f"{seconds:>9.4f} {1e6 * seconds / int(classes):>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
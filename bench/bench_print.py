@@ -0,0 +1,99 @@
+"""Print-heavy programs with output buffers of different sizes.
+
+The Quack program prints an Int and a String on each of n
+iterations, like tests/src/Looper.asm.  It is run with tiny_vm -B
+set to one byte (so every print is a write system call, as with
+an unbuffered stream), 4K (a typical stdio buffer), and the default
+64K, with output to a file as the test harness does.  tiny_vm -S
+reports the run time and how many writes the output took.  The
+program is compiled with compile.py --objects and run in a release
+build of bin/tiny_vm.
+"""
+import argparse
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+os.chdir(ROOT)       # compile.py reads orilib/ from here
+sys.path.insert(0, str(ROOT))
+import assemble      # noqa: E402
+import compile       # noqa: E402
+
+BUILTINS = ["Bool.json", "Dict.json", "Int.json", "List.json", "Nothing.json",
+            "Obj.json", "String.json", "StringBuilder.json"]
+
+PRINTER = """\
+i = 0;
+while i < {n} {
+    i.print();
+    " bottles on the wall\\n".print();
+    i = i + 1;
+}
+"""
+
+BUFFERS = ["1", "4K", "64K"]
+
+ELAPSED = re.compile(r"in ([0-9.]+) seconds")
+OUTPUT = re.compile(r"Output: (\d+) bytes in (\d+) writes")
+
+
+def run(tiny_vm: Path, lib: Path, buffer: str, out: Path) -> (float, int, int):
+    """Run time, bytes, and writes of $Main"""
+    with open(out, "w") as stdout:
+        proc = subprocess.run([str(tiny_vm), "-S", "-B", buffer, "-L", str(lib), "$Main"],
+                              text=True, check=True, stdout=stdout,
+                              stderr=subprocess.PIPE)
+    runs = ELAPSED.findall(proc.stderr)
+    output = OUTPUT.search(proc.stderr)
+    if not runs or not output:
+        sys.exit(f"No statistics from tiny_vm:\n{proc.stderr[-2000:]}")
+    return float(runs[-1]), int(output.group(1)), int(output.group(2))
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("sizes", nargs="*", type=int,
+                        default=[10000, 100000, 1000000],
+                        help="Numbers of lines to print")
+    return parser.parse_args()
+
+
+def main():
+    args = cli()
+    tiny_vm = ROOT.joinpath("bin", "tiny_vm")
+    if not tiny_vm.exists():
+        sys.exit(f"Build {tiny_vm} first")
+    compile.log.setLevel(logging.WARNING)
+    assemble.log.setLevel(logging.WARNING)
+    compiler = compile.Compiler(compile.cached_parser())
+    print(f"{'lines':>8} {'buffer':>6} {'MB':>6} {'writes':>8} {'run s':>8} {'nsec/line':>10}")
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            lib = Path(tmp).joinpath("OBJ")
+            lib.mkdir()
+            for builtin in BUILTINS:
+                shutil.copy(ROOT.joinpath("OBJ", builtin), lib)
+            # The template is full of braces, so fill in n by hand
+            objects = compiler.compile_to_objects(PRINTER.replace("{n}", str(n)))
+            compile.write_objects(objects, lib)
+            expected = None
+            for buffer in BUFFERS:
+                out = Path(tmp).joinpath("out.txt")
+                seconds, n_bytes, writes = run(tiny_vm, lib, buffer, out)
+                text = out.read_text()
+                if expected is None:
+                    expected = text
+                elif text != expected:
+                    sys.exit(f"Output with -B {buffer} differs")
+                print(f"{n:>8} {buffer:>6} {n_bytes / 1e6:>6.2f} {writes:>8} "
+                      f"{seconds:>8.4f} {1e9 * seconds / n:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
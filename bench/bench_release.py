@@ -0,0 +1,92 @@
+"""Instructions per second of the debugging and release builds of
+the C vm, on the test programs in tests/src and on the Int loop of
+bench_vm.py.  Both builds are made with cmake in a temporary
+directory (so bin/tiny_vm is not disturbed), and each program is
+run with -S, which reports the instruction count and run time.
+"""
+import argparse
+import csv
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from bench_vm import ROOT, BUILTINS, ASMREQS, LOOP
+
+STATS_PAT = re.compile(r"(?P<count>\d+) instructions in (?P<seconds>[0-9.]+) seconds")
+BUILDS = {"debug": "OFF", "release": "ON"}
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--loop", type=int, default=100000,
+                        help="Iterations of the Int loop")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="Assemble with -O (superinstructions)")
+    return parser.parse_args()
+
+
+def build(kind: str, work: Path) -> Path:
+    """Build tiny_vm with TINY_VM_RELEASE on or off"""
+    build_dir = work.joinpath("build-" + kind)
+    bin_dir = work.joinpath("bin-" + kind)
+    build_dir.mkdir()
+    subprocess.run(["cmake", str(ROOT), f"-DTINY_VM_RELEASE={BUILDS[kind]}",
+                    f"-DTINY_VM_BIN_DIR={bin_dir}"],
+                   cwd=build_dir, check=True, stdout=subprocess.DEVNULL)
+    subprocess.run(["make", "tiny_vm"], cwd=build_dir, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return bin_dir.joinpath("tiny_vm")
+
+
+def run_stats(vm: Path, class_name: str, work: Path) -> tuple:
+    """(instructions, seconds) for one run"""
+    proc = subprocess.run([str(vm), "-S", class_name], cwd=work, text=True,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    match = STATS_PAT.search(proc.stderr)
+    if proc.returncode != 0 or not match:
+        raise RuntimeError(f"{vm} failed on {class_name}")
+    return int(match["count"]), float(match["seconds"])
+
+
+def main():
+    args = cli()
+    with open(ROOT.joinpath("tests", "src", "TESTS.csv")) as f:
+        programs = [case["Class"] for case in csv.DictReader(f)
+                    if case["Action"] == "run"]
+    with tempfile.TemporaryDirectory() as tmp:
+        work = Path(tmp)
+        vms = {kind: build(kind, work) for kind in BUILDS}
+        work.joinpath("OBJ").mkdir()
+        for name in BUILTINS:
+            shutil.copy(ROOT.joinpath("OBJ", name), work.joinpath("OBJ"))
+        for name in ASMREQS:
+            shutil.copy(ROOT.joinpath(name), work)
+        sources = [str(src) for src in ROOT.joinpath("tests", "src").glob("*.asm")]
+        work.joinpath("Bench.asm").write_text(LOOP.format(n=args.loop))
+        sources.append("Bench.asm")
+        asm = [sys.executable, str(ROOT.joinpath("assemble.py")), "--jobs", "4"]
+        if args.optimize:
+            asm.append("-O")
+        subprocess.run(asm + sources, cwd=work, check=True,
+                       stderr=subprocess.DEVNULL)
+        programs.append("Bench")
+
+        print(f"{'program':>24} {'instructions':>12} "
+              + " ".join(f"{kind + ' instr/s':>16}" for kind in BUILDS)
+              + f" {'speedup':>8}")
+        for program in programs:
+            rates = []
+            for vm in vms.values():
+                count, seconds = run_stats(vm, program, work)
+                rates.append(count / seconds if seconds else 0.0)
+            speedup = rates[1] / rates[0] if rates[0] else 0.0
+            print(f"{program:>24} {count:>12} "
+                  + " ".join(f"{rate:>16.3g}" for rate in rates)
+                  + f" {speedup:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
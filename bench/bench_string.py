@@ -0,0 +1,117 @@
+"""Building a long String in a Quack loop:  StringBuilder against +.
+
+Each program appends a 100-byte chunk n times, then prints the
+length of the result (100 n bytes;  10 MB at the largest default
+size).  The builder program appends to a StringBuilder and makes
+one String at the end.  The plus program concatenates with
+String:plus, copying everything built so far on every iteration,
+so its time grows with the square of n;  it is only run up to
+--plus-max chunks.  Programs are compiled with compile.py --objects
+and run in a release build of bin/tiny_vm.
+"""
+import argparse
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+os.chdir(ROOT)       # compile.py reads orilib/ from here
+sys.path.insert(0, str(ROOT))
+import assemble      # noqa: E402
+import compile       # noqa: E402
+
+BUILTINS = ["Bool.json", "Dict.json", "Int.json", "List.json", "Nothing.json",
+            "Obj.json", "String.json", "StringBuilder.json"]
+
+CHUNK = "0123456789" * 10
+
+BUILDER = """\
+sb = StringBuilder();
+i = 0;
+while i < {n} {
+    sb.append("{chunk}");
+    i = i + 1;
+}
+s = sb.string();
+check = StringBuilder();
+check.append(s);
+check.length().print();
+"""
+
+PLUS = """\
+s = "";
+i = 0;
+while i < {n} {
+    s = s + "{chunk}";
+    i = i + 1;
+}
+check = StringBuilder();
+check.append(s);
+check.length().print();
+"""
+
+PROGRAMS = {"builder": BUILDER, "plus": PLUS}
+
+ELAPSED = re.compile(r"in ([0-9.]+) seconds")
+
+
+def build(compiler: compile.Compiler, lib: Path, template: str, n: int):
+    """Object code for the program with n chunks in lib"""
+    # The templates are full of braces, so fill in n by hand
+    source = template.replace("{n}", str(n)).replace("{chunk}", CHUNK)
+    compile.write_objects(compiler.compile_to_objects(source), lib)
+
+
+def run(tiny_vm: Path, lib: Path) -> (str, float):
+    """Output and run time of $Main"""
+    proc = subprocess.run([str(tiny_vm), "-S", "-L", str(lib), "$Main"],
+                          text=True, check=True, capture_output=True)
+    runs = ELAPSED.findall(proc.stderr)
+    if not runs:
+        sys.exit(f"No statistics from tiny_vm:\n{proc.stderr[-2000:]}")
+    return proc.stdout.strip(), float(runs[-1])
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("sizes", nargs="*", type=int,
+                        default=[300, 1000, 10000, 100000],
+                        help="Numbers of chunks to append")
+    parser.add_argument("--plus-max", type=int, default=1000,
+                        help="Largest number of chunks for the plus program")
+    return parser.parse_args()
+
+
+def main():
+    args = cli()
+    tiny_vm = ROOT.joinpath("bin", "tiny_vm")
+    if not tiny_vm.exists():
+        sys.exit(f"Build {tiny_vm} first")
+    compile.log.setLevel(logging.WARNING)
+    assemble.log.setLevel(logging.WARNING)
+    compiler = compile.Compiler(compile.cached_parser())
+    print(f"{'chunks':>8} {'MB':>6} {'program':>8} {'run s':>9} {'MB/s':>9}")
+    for n in args.sizes:
+        megabytes = n * len(CHUNK) / 1e6
+        for name, template in PROGRAMS.items():
+            if name == "plus" and n > args.plus_max:
+                continue
+            with tempfile.TemporaryDirectory() as tmp:
+                lib = Path(tmp)
+                for builtin in BUILTINS:
+                    shutil.copy(ROOT.joinpath("OBJ", builtin), lib)
+                build(compiler, lib, template, n)
+                output, seconds = run(tiny_vm, lib)
+            if output != str(n * len(CHUNK)):
+                sys.exit(f"{name} built {output} bytes, expected {n * len(CHUNK)}")
+            print(f"{n:>8} {megabytes:>6.2f} {name:>8} {seconds:>9.4f} "
+                  f"{megabytes / seconds:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
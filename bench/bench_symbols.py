@@ -0,0 +1,69 @@
+"""Assembler symbol resolution on large synthetic classes.
+
+Each generated class has n methods; each method has a few arguments
+and locals and calls several other methods of the same class.  With
+indexed symbol tables, assembly time per method should stay roughly
+constant as n grows (linear scaling overall).
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+os.chdir(ROOT)       # assemble.py reads asm.conf and opdefs.txt from here
+sys.path.insert(0, str(ROOT))
+import assemble      # noqa: E402
+
+
+def synthetic_class(n_methods: int, n_locals: int = 20) -> list:
+    """Assembly source for a class with n_methods methods"""
+    local_names = [f"v{i}" for i in range(n_locals)]
+    lines = [".class Synthetic:Obj", ".field count"]
+    for m in range(n_methods):
+        lines.append(f".method m{m} forward")
+    for m in range(n_methods):
+        lines.append(f".method m{m}")
+        lines.append(".args a,b")
+        lines.append(f".local {','.join(local_names)}")
+        lines.append("    enter")
+        for k in range(3):
+            callee = (m * 7 + k * 13) % n_methods
+            var = local_names[(m + k) % n_locals]
+            lines.append("    load a")
+            lines.append("    load b")
+            lines.append(f"    load {var}")
+            lines.append(f"    call $:m{callee}")
+            lines.append(f"    store {var}")
+        lines.append("    load $")
+        lines.append("    load_field $:count")
+        lines.append("    new Obj")
+        lines.append("    pop")
+        lines.append("    return 2")
+    return lines
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("sizes", nargs="*", type=int,
+                        default=[1250, 2500, 5000, 10000],
+                        help="Numbers of methods to try")
+    return parser.parse_args()
+
+
+def main():
+    args = cli()
+    assemble.log.setLevel(logging.WARNING)
+    print(f"{'methods':>8} {'lines':>8} {'seconds':>9} {'usec/method':>12}")
+    for n in args.sizes:
+        source = synthetic_class(n)
+        start = time.perf_counter()
+        assemble.translate(source)
+        elapsed = time.perf_counter() - start
+        print(f"{n:>8} {len(source):>8} {elapsed:>9.3f} {1e6 * elapsed / n:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""The C vm (bin/tiny_vm) and the Python interpreter (pyvm) on
+the same object code:  a loop summing 0 .. n-1 with Int methods.
+Both must print the same sum (which wraps around at 32 bits).
+Build bin/tiny_vm first; the C vm is skipped if it is missing.
+"""
+import argparse
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+BUILTINS = ["Bool.json", "Dict.json", "Int.json", "List.json", "Nothing.json",
+            "Obj.json", "String.json", "StringBuilder.json"]
+ASMREQS = ["asm.conf", "opdefs.txt"]
+
+LOOP = """
+.class Bench:Obj
+.method $constructor
+.local i,total
+    enter
+    const 0
+    store i
+    const 0
+    store total
+loop:
+    const {n}
+    load i
+    call Int:less
+    jump_ifnot done
+    load i
+    load total
+    call Int:plus
+    store total
+    const 1
+    load i
+    call Int:plus
+    store i
+    jump loop
+done:
+    load total
+    call Int:print
+    pop
+    const nothing
+    return 0
+"""
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("sizes", nargs="*", type=int,
+                        default=[10000, 100000, 1000000],
+                        help="Loop iterations to try")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="Assemble with -O (superinstructions)")
+    return parser.parse_args()
+
+
+def timed(command: list, cwd: Path) -> tuple:
+    start = time.perf_counter()
+    proc = subprocess.run(command, cwd=cwd, text=True, check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start, proc.stdout
+
+
+def main():
+    args = cli()
+    tiny_vm = ROOT.joinpath("bin", "tiny_vm")
+    vms = {"pyvm": [sys.executable, str(ROOT.joinpath("pyvm"))]}
+    if tiny_vm.exists():
+        vms = {"tiny_vm": [str(tiny_vm)], **vms}
+    print(f"{'n':>9} " + " ".join(f"{vm + ' s':>10} {'ns/iter':>8}" for vm in vms)
+          + f" {'ratio':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        work = Path(tmp)
+        work.joinpath("OBJ").mkdir()
+        for name in BUILTINS:
+            shutil.copy(ROOT.joinpath("OBJ", name), work.joinpath("OBJ"))
+        for name in ASMREQS:
+            shutil.copy(ROOT.joinpath(name), work)
+        for n in args.sizes:
+            work.joinpath("Bench.asm").write_text(LOOP.format(n=n))
+            asm = [sys.executable, str(ROOT.joinpath("assemble.py"))]
+            if args.optimize:
+                asm.append("-O")
+            subprocess.run(asm + ["Bench.asm", "OBJ/Bench.json"], cwd=work,
+                           check=True, stderr=subprocess.DEVNULL)
+            times = []
+            outputs = set()
+            for command in vms.values():
+                elapsed, output = timed(command + ["Bench"], work)
+                times.append(elapsed)
+                outputs.add(output)
+            assert len(outputs) == 1, f"Outputs differ: {outputs}"
+            row = " ".join(f"{t:>10.3f} {1e9 * t / n:>8.0f}" for t in times)
+            ratio = f"{times[-1] / times[0]:>7.1f}" if len(times) > 1 else ""
+            print(f"{n:>9} {row} {ratio}")
+
+
+if __name__ == "__main__":
+    main()
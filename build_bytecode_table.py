@@ -1,6 +1,8 @@
 """Build table mapping integer byte codes to function pointers.
 Machine operations, their names, and the number of operands
-for each are given in opdefs.txt.
+for each are given in opdefs.txt.  Superinstructions, which
+list the operations they combine, get a generated function
+that executes those operations in sequence.
 """
 import argparse
 import datetime
@@ -26,12 +28,21 @@ PROLOGUE = f"""
  */
  
 #include "vm_code_table.h"
+"""
+
+TABLE_START = f"""
 op_tbl_entry vm_op_bytecodes[] = {LB}
 """
 
+# Operations that transfer control may only be the last
+# part of a superinstruction
+CONTROL_OPS = ["halt", "call", "return", "jump", "jump_if", "jump_ifnot"]
+
+MAX_OP_PARTS = 4   # Must match vm_code_table.h
+
 # Fixed code at end of generated file
 CODA = """
-    { 0, 0, 0}  // SENTRY
+    { 0, 0, 0, 0, {0}}  // SENTRY
 };
 """
 
@@ -49,12 +60,23 @@ def cli() -> object:
     return args
 
 
-def main():
-    log.info("Bytecode table generation")
-    args = cli()
-    print(PROLOGUE, file=args.outfile)
-    next_byte_code = 0;
-    for line in args.infile:
+class OpDef:
+    """One line of opdefs.txt"""
+    def __init__(self, code: int, name: str, func: str, inlines: str,
+                 parts: list, comment: str):
+        self.code = code
+        self.name = name
+        self.func = func
+        self.inlines = inlines
+        self.parts = parts
+        self.comment = comment
+
+
+def read_opdefs(infile) -> list:
+    ops = []
+    by_name = {}
+    next_byte_code = 0
+    for line in infile:
         line = line.strip()
         # Strip off comments
         parts = line.split("#")
@@ -66,11 +88,46 @@ def main():
         if len(line) == 0:
             continue
         parts = line.split(",")
-        assert len(parts) == 3, f"Couldn't parse {line}"
-        name, func, inlines = parts
-        print(f'\t {LB} "{name}", {func}, {inlines} {RB}, //{next_byte_code} {comment}',
-              file=args.outfile)
+        assert len(parts) in [3, 4], f"Couldn't parse {line}"
+        name, func, inlines = parts[:3]
+        components = []
+        if len(parts) == 4:
+            components = [by_name[part] for part in parts[3].split("+")]
+            assert 1 < len(components) <= MAX_OP_PARTS, \
+                f"Superinstruction {name} must have 2..{MAX_OP_PARTS} parts"
+            assert all(part.name not in CONTROL_OPS
+                       for part in components[:-1]), \
+                f"Only the last part of {name} may transfer control"
+            assert all(not part.parts for part in components), \
+                f"Parts of {name} must be basic operations"
+            assert int(inlines) == sum(int(part.inlines) for part in components), \
+                f"Operand count of {name} does not match its parts"
+        op = OpDef(next_byte_code, name, func, inlines, components, comment)
+        ops.append(op)
+        by_name[name] = op
         next_byte_code += 1
+    return ops
+
+
+def main():
+    log.info("Bytecode table generation")
+    args = cli()
+    ops = read_opdefs(args.infile)
+    print(PROLOGUE, file=args.outfile)
+    for op in ops:
+        if op.parts:
+            calls = " ".join(f"{part.func}();" for part in op.parts)
+            print(f"static void {op.func}(void) {LB} {calls} {RB}",
+                  file=args.outfile)
+    print(TABLE_START, file=args.outfile)
+    for op in ops:
+        parts = ", 0, {0}"   # Every field initialized, for -Wextra
+        if op.parts:
+            codes = ", ".join(str(part.code) for part in op.parts)
+            parts = f", {len(op.parts)}, {LB}{codes}{RB}"
+        print(f'\t {LB} "{op.name}", {op.func}, {op.inlines}{parts} {RB}, '
+              f'//{op.code} {op.comment}',
+              file=args.outfile)
     print(CODA, file=args.outfile)
     log.info("Finished bytecode table generation")
 
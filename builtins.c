@@ -4,6 +4,7 @@
  *
  */
 #include <stdio.h>
+#include <stdarg.h>
 #include <stdlib.h>  /* Malloc lives here   */
 #include <string.h>  /* For strcpy */
 
@@ -11,6 +12,9 @@
 #include "vm_core.h"
 #include "vm_state.h"
 #include "vm_ops.h"
+#include "vm_gc.h"
+#include "vm_icache.h"
+#include "vm_output.h"
 #include "logger.h"
 
 #include <assert.h>
@@ -59,7 +63,10 @@ obj_ref native_tbd() {
     obj_ref this = vm_fp->obj;
     class_ref clazz = this->header.clazz;
     char *class_name = clazz->header.class_name;
-    printf("Unimplemented method on %s\n", class_name);
+    static const char message[] = "Unimplemented method on ";
+    vm_output_write(message, sizeof message - 1);
+    vm_output_write(class_name, strlen(class_name));
+    vm_output_write("\n", 1);
     return nothing;
 }
 
@@ -148,9 +155,9 @@ vm_Word method_Obj_print[] = {
         {.instr = vm_op_load},
         {.intval = 0},
         {.instr = vm_op_methodcall},
-        {.intval = 1},  // string method
+        CALL_SITE(1, "Obj:print", 3),  // string method
         {.instr = vm_op_methodcall},
-        {.intval = 2},  // print method of class string
+        CALL_SITE(2, "Obj:print", 5),  // print method of class string
         {.instr = vm_op_return},
         {.intval = 0}
 };
@@ -202,7 +209,7 @@ const class_ref the_class_Obj = &the_class_Obj_struct;
 /* ================
  * String
  * Fields:
- *    One hidden field, currently holding char*
+ *    Hidden:  the text, its length, and its hash
  * Methods:
  *    Those of Obj, plus ordering, concatenation
  *    Constructor  (called after allocation)
@@ -220,23 +227,30 @@ const class_ref the_class_Obj = &the_class_Obj_struct;
  * Used by built-in vm methods, not
  * available directly to the interpreted program.
  */
-obj_ref new_string(char *s) {
+obj_ref new_string_of_length(char *s, size_t length) {
     obj_String boxed = (obj_String) vm_new_obj(the_class_String);
     boxed->text = s;
+    boxed->length = length;
+    boxed->hash = 0;
+    boxed->header.gc_flags |= GC_OWNS_TEXT;  // s is freed with boxed
     return (obj_ref) boxed;
 }
 
+obj_ref new_string(char *s) {
+    return new_string_of_length(s, strlen(s));
+}
+
 /* String literals constructor,
  * used by compiler and not otherwise available in
  * Quack programs.
  */
 int str_literal_const(char *s_lit) {
-    int const_index = lookup_const_index(s_lit);
+    int const_index = lookup_const_index(the_class_String, s_lit);
     if (const_index) {
         return const_index;
     }
-    obj_ref boxed = new_string(s_lit);
-    const_index = create_const_value(s_lit, boxed);
+    obj_ref boxed = new_string(strdup(s_lit));
+    const_index = create_const_value(the_class_String, s_lit, boxed);
     return const_index;
 }
 
@@ -246,6 +260,8 @@ obj_ref native_String_constructor(void ) {
     assert_is_type(this, the_class_String);
     obj_String this_str = (obj_String) this;
     this_str->text = "";
+    this_str->length = 0;
+    this_str->hash = 0;
     return this;
 }
 
@@ -274,7 +290,7 @@ obj_ref native_String_print() {
     struct obj_String_struct* this_string = (struct obj_String_struct*)  this;
     /* Then we can access fields */
     log_debug( "**** PRINT |%s| ****\n", this_string->text);
-    printf("%s", this_string->text);
+    vm_output_write(this_string->text, this_string->length);
     return nothing;
 }
 
@@ -287,6 +303,44 @@ vm_Word method_String_print[] = {
 };
 
 
+/* Equal texts.  Most unequal strings differ in length, or
+ * in hash if both have been hashed (e.g., as Dict keys), and
+ * we need not look at their text.
+ */
+static int strings_equal(obj_String a, obj_String b) {
+    if (a == b) {
+        return 1;
+    }
+    if (a->length != b->length) {
+        return 0;
+    }
+    if (a->hash && b->hash && a->hash != b->hash) {
+        return 0;
+    }
+    return memcmp(a->text, b->text, a->length) == 0;
+}
+
+/* String:flush prints the string, then writes out everything
+ * printed so far rather than waiting for the output buffer to fill
+ * (e.g., "".flush() before a long computation)
+ */
+obj_ref native_String_flush(void ) {
+    obj_ref this = vm_fp->obj;
+    assert_is_type(this, the_class_String);
+    obj_String this_str = (obj_String) this;
+    vm_output_write(this_str->text, this_str->length);
+    vm_output_flush();
+    return nothing;
+}
+
+vm_Word method_String_flush[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_String_flush},
+        {.instr = vm_op_return},
+        {.intval = 0}
+};
+
 /* String:equals  */
 obj_ref native_String_equals(void ) {
     obj_ref this = vm_fp->obj;
@@ -295,7 +349,7 @@ obj_ref native_String_equals(void ) {
     obj_ref other = (vm_fp - 1)->obj;
     assert_is_type(other, the_class_String);
     obj_String other_str = (obj_String) other;
-    if (strcmp(this_str->text, other_str->text) == 0) {
+    if (strings_equal(this_str, other_str)) {
         return lit_true;
     } else {
         return lit_false;
@@ -322,10 +376,12 @@ obj_ref native_String_plus(void ) {
     obj_ref other = (vm_fp - 1)->obj;
     assert_is_type(other, the_class_String);
     obj_String other_str = (obj_String) other;
-    char *s = (char *)malloc(sizeof(char)*255);
-    strcat(s, this_str->text);
-    strcat(s, other_str->text);
-    return new_string(s);
+    size_t length = this_str->length + other_str->length;
+    char *s = malloc(length + 1);
+    assert(s);
+    memcpy(s, this_str->text, this_str->length);
+    memcpy(s + this_str->length, other_str->text, other_str->length + 1);
+    return new_string_of_length(s, length);
 }
 
 vm_Word method_String_plus[] = {
@@ -336,6 +392,37 @@ vm_Word method_String_plus[] = {
         {.intval = 1}
 };
 
+/* String:hash (FNV-1a of the text, so equal strings hash alike),
+ * computed once and kept in the string
+ */
+unsigned int string_hash(obj_String s) {
+    if (s->hash) {
+        return s->hash;
+    }
+    unsigned int hash = 2166136261u;
+    unsigned char *text = (unsigned char *) s->text;
+    for (size_t i = 0; i < s->length; ++i) {
+        hash ^= text[i];
+        hash *= 16777619u;
+    }
+    s->hash = hash;
+    return hash;
+}
+
+obj_ref native_String_hash(void ) {
+    obj_ref this = vm_fp->obj;
+    assert_is_type(this, the_class_String);
+    return new_int((int) string_hash((obj_String) this));
+}
+
+vm_Word method_String_hash[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_String_hash},
+        {.instr = vm_op_return},
+        {.intval = 0}
+};
+
 /* The String Class (a singleton) */
 struct  class_struct  the_class_String_struct = {
         .header = {.class_name="String",
@@ -348,7 +435,9 @@ struct  class_struct  the_class_String_struct = {
         method_String_print,
         method_String_equals,
         method_tbd_1, //tbd for less
-        method_String_plus
+        method_String_plus,
+        method_String_hash,
+        method_String_flush
 };
 
 class_ref the_class_String = &the_class_String_struct;
@@ -534,19 +623,17 @@ obj_ref nothing = (obj_ref) &nothing_struct;
 
 /* Constructor */
 
-/* If you create a new Int object, it is
- * initialized to zero.  Note that the return value of the
- * native function is pushed onto the stack to be returned
- * from the interpreted constructor method.  We return "this"
- * so that allocation and initialization leave the constructed
- * object on the stack.
+/* If you create a new Int object, it is zero.  Note that
+ * the return value of the native function is pushed onto
+ * the stack to be returned from the interpreted constructor
+ * method.  Ints are immutable, so rather than initializing
+ * "this" we return the shared zero (which vm_op_new has
+ * already provided as "this").
  */
 obj_ref native_int_constructor(void ) {
     obj_ref this = vm_fp->obj;
     assert_is_type(this, the_class_Int);
-    obj_Int this_int = (obj_Int) this;
-    this_int->value = 0;
-    return this;
+    return new_int(0);
 }
 
 vm_Word method_int_constructor[] = {
@@ -723,6 +810,25 @@ vm_Word method_Int_div[] = {
         {.intval = 1}
 };
 
+/* Int:hash (the value itself;  Dict scrambles it) */
+unsigned int int_hash(int n) {
+    return (unsigned int) n;
+}
+
+obj_ref native_Int_hash(void ) {
+    obj_ref this = vm_fp->obj;
+    assert_is_type(this, the_class_Int);
+    return new_int((int) int_hash(((obj_Int) this)->value));
+}
+
+vm_Word method_Int_hash[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_Int_hash},
+        {.instr = vm_op_return},
+        {.intval = 0}
+};
+
 /* The Int Class (a singleton) */
 struct  class_struct  the_class_Int_struct = {
         .header = {
@@ -741,7 +847,8 @@ struct  class_struct  the_class_Int_struct = {
                 method_Int_plus,
                 method_Int_sub,
                 method_Int_mult,
-                method_Int_div
+                method_Int_div,
+                method_Int_hash
         }
  };
 
@@ -753,9 +860,26 @@ class_ref the_class_Int = &the_class_Int_struct;
  * Used by built-in vm methods like Int:add, not
  * available directly to the interpreted program.
  */
+long n_ints_cached = 0;
+long n_ints_allocated = 0;
+
+/* Shared Ints, outside the heap, each initialized on first use */
+static struct obj_Int_struct int_cache[INT_CACHE_MAX - INT_CACHE_MIN + 1];
+
 obj_ref new_int(int n) {
+    if (n >= INT_CACHE_MIN && n <= INT_CACHE_MAX) {
+        obj_Int cached = &int_cache[n - INT_CACHE_MIN];
+        if (! cached->header.clazz) {
+            cached->header.clazz = the_class_Int;
+            cached->header.tag = GOOD_OBJ_TAG;
+            cached->value = n;
+        }
+        n_ints_cached += 1;
+        return (obj_ref) cached;
+    }
     obj_Int boxed = (obj_Int) vm_new_obj(the_class_Int);
     boxed->value = n;
+    n_ints_allocated += 1;
     return (obj_ref) boxed;
 }
 
@@ -767,16 +891,764 @@ obj_ref new_int(int n) {
  * e.g., Int.add.
  */
 int int_literal_const(char *n_lit) {
-    int const_index = lookup_const_index(n_lit);
+    int const_index = lookup_const_index(the_class_Int, n_lit);
     if (const_index) {
         return const_index;
     }
     int as_int = atoi(n_lit);
     obj_ref boxed = new_int(as_int);
-    const_index = create_const_value(n_lit, boxed);
+    const_index = create_const_value(the_class_Int, n_lit, boxed);
     return const_index;
 }
 
+/* ================
+ * List
+ * Fields:
+ *    Hidden:  length, capacity, and a malloced array of
+ *    element references
+ * Methods:
+ *    Those of Obj, plus
+ *    LENGTH, GET, SET, APPEND, SUM, JOIN, SLICE
+ * =================
+ */
+
+/* A built-in method was misused in a way the program could
+ * have avoided (e.g., an index out of range).  Unlike a failed
+ * assertion, this stops release builds too.
+ */
+static void builtin_failure(char *message, ...) {
+    va_list args;
+    va_start(args, message);
+    fprintf(stderr, "Error: ");
+    vfprintf(stderr, message, args);
+    fprintf(stderr, "\n");
+    va_end(args);
+    exit(1);
+}
+
+static obj_List this_list(void) {
+    obj_ref this = vm_fp->obj;
+    assert_is_type(this, the_class_List);
+    return (obj_List) this;
+}
+
+/* Value of an Int argument that must be an index 0..limit */
+static int list_index(obj_List list, obj_ref arg, int limit) {
+    if (arg->header.clazz != the_class_Int) {
+        builtin_failure("List index must be an Int, not %s",
+                        arg->header.clazz->header.class_name);
+    }
+    int index = ((obj_Int) arg)->value;
+    if (index < 0 || index > limit) {
+        builtin_failure("Index %d out of range for List of length %d",
+                        index, list->length);
+    }
+    return index;
+}
+
+/* Room for at least n elements, doubling the array as needed
+ * so that appending is amortized constant time
+ */
+static void list_reserve(obj_List list, int n) {
+    if (n <= list->capacity) {
+        return;
+    }
+    int capacity = list->capacity ? list->capacity : 8;
+    while (capacity < n) {
+        capacity *= 2;
+    }
+    list->items = realloc(list->items, capacity * sizeof(obj_ref));
+    assert(list->items);
+    list->capacity = capacity;
+}
+
+/* Constructor:  An empty list */
+obj_ref native_List_constructor(void) {
+    obj_List list = this_list();
+    list->length = 0;
+    list->capacity = 0;
+    list->items = 0;
+    list->header.gc_flags |= GC_OWNS_ITEMS;
+    return (obj_ref) list;
+}
+
+vm_Word method_List_constructor[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_List_constructor},
+        {.instr = vm_op_return},
+        {.intval = 0}
+};
+
+/* List:string, e.g., "[1, two, true]".  Elements of the built-in
+ * value classes are shown by value;  for others we cannot call
+ * their string methods from native code, so we show "<Class>".
+ */
+static void write_element(FILE *out, obj_ref item) {
+    class_ref clazz = item->header.clazz;
+    if (clazz == the_class_Int) {
+        fprintf(out, "%d", ((obj_Int) item)->value);
+    } else if (clazz == the_class_String) {
+        fwrite(((obj_String) item)->text, 1, ((obj_String) item)->length, out);
+    } else if (item == lit_true) {
+        fputs("true", out);
+    } else if (item == lit_false) {
+        fputs("false", out);
+    } else if (item == nothing) {
+        fputs("nothing", out);
+    } else {
+        fprintf(out, "<%s>", clazz->header.class_name);
+    }
+}
+
+obj_ref native_List_string(void) {
+    obj_List list = this_list();
+    char *text;
+    size_t size;
+    FILE *out = open_memstream(&text, &size);
+    assert(out);
+    fputc('[', out);
+    for (int i = 0; i < list->length; ++i) {
+        if (i > 0) {
+            fputs(", ", out);
+        }
+        write_element(out, list->items[i]);
+    }
+    fputc(']', out);
+    fclose(out);
+    return new_string(text);
+}
+
+vm_Word method_List_string[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_List_string},
+        {.instr = vm_op_return},
+        {.intval = 0}
+};
+
+/* Inherit Obj:print, which will call List:string,
+ * and Obj:equals (identity)
+ */
+
+/* List:length */
+obj_ref native_List_length(void) {
+    return new_int(this_list()->length);
+}
+
+vm_Word method_List_length[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_List_length},
+        {.instr = vm_op_return},
+        {.intval = 0}
+};
+
+/* List:get(index) */
+obj_ref native_List_get(void) {
+    obj_List list = this_list();
+    int index = list_index(list, (vm_fp - 1)->obj, list->length - 1);
+    return list->items[index];
+}
+
+vm_Word method_List_get[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_List_get},
+        {.instr = vm_op_return},
+        {.intval = 1}
+};
+
+/* List:set(index, value) */
+obj_ref native_List_set(void) {
+    obj_List list = this_list();
+    int index = list_index(list, (vm_fp - 2)->obj, list->length - 1);
+    list->items[index] = (vm_fp - 1)->obj;
+    return nothing;
+}
+
+vm_Word method_List_set[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_List_set},
+        {.instr = vm_op_return},
+        {.intval = 2}
+};
+
+/* List:append(value) */
+obj_ref native_List_append(void) {
+    obj_List list = this_list();
+    list_reserve(list, list->length + 1);
+    list->items[list->length++] = (vm_fp - 1)->obj;
+    return nothing;
+}
+
+vm_Word method_List_append[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_List_append},
+        {.instr = vm_op_return},
+        {.intval = 1}
+};
+
+/* List:sum, of a list of Ints (wrapping around, like Int:plus) */
+obj_ref native_List_sum(void) {
+    obj_List list = this_list();
+    unsigned int sum = 0;
+    for (int i = 0; i < list->length; ++i) {
+        obj_ref item = list->items[i];
+        if (item->header.clazz != the_class_Int) {
+            builtin_failure("List:sum of a list holding a %s",
+                            item->header.clazz->header.class_name);
+        }
+        sum += (unsigned int) ((obj_Int) item)->value;
+    }
+    return new_int((int) sum);
+}
+
+vm_Word method_List_sum[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_List_sum},
+        {.instr = vm_op_return},
+        {.intval = 0}
+};
+
+/* List:join(separator), of a list of Strings */
+obj_ref native_List_join(void) {
+    obj_List list = this_list();
+    obj_ref sep_arg = (vm_fp - 1)->obj;
+    assert_is_type(sep_arg, the_class_String);
+    char *sep = ((obj_String) sep_arg)->text;
+    size_t sep_length = ((obj_String) sep_arg)->length;
+    size_t length = 0;
+    for (int i = 0; i < list->length; ++i) {
+        obj_ref item = list->items[i];
+        if (item->header.clazz != the_class_String) {
+            builtin_failure("List:join of a list holding a %s",
+                            item->header.clazz->header.class_name);
+        }
+        length += ((obj_String) item)->length + (i ? sep_length : 0);
+    }
+    char *text = malloc(length + 1);
+    assert(text);
+    char *end = text;
+    for (int i = 0; i < list->length; ++i) {
+        if (i) {
+            memcpy(end, sep, sep_length);
+            end += sep_length;
+        }
+        obj_String item = (obj_String) list->items[i];
+        memcpy(end, item->text, item->length);
+        end += item->length;
+    }
+    *end = '\0';
+    return new_string_of_length(text, length);
+}
+
+vm_Word method_List_join[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_List_join},
+        {.instr = vm_op_return},
+        {.intval = 1}
+};
+
+/* List:slice(from, to), a new list of the elements from..to-1 */
+obj_ref native_List_slice(void) {
+    obj_List list = this_list();
+    int from = list_index(list, (vm_fp - 2)->obj, list->length);
+    int to = list_index(list, (vm_fp - 1)->obj, list->length);
+    if (to < from) {
+        builtin_failure("List:slice from %d to %d", from, to);
+    }
+    // The only allocation;  this (on the frame stack) keeps list alive
+    obj_List slice = (obj_List) vm_new_obj(the_class_List);
+    slice->length = 0;
+    slice->capacity = 0;
+    slice->items = 0;
+    slice->header.gc_flags |= GC_OWNS_ITEMS;
+    list_reserve(slice, to - from);
+    memcpy(slice->items, list->items + from, (to - from) * sizeof(obj_ref));
+    slice->length = to - from;
+    return (obj_ref) slice;
+}
+
+vm_Word method_List_slice[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_List_slice},
+        {.instr = vm_op_return},
+        {.intval = 2}
+};
+
+/* The List Class (a singleton) */
+struct  class_struct  the_class_List_struct = {
+        .header = {
+                .class_name = "List",
+                .healthy_class_tag = HEALTHY,
+                .super = the_class_Obj,
+                .n_fields = 0,
+                .object_size = sizeof(struct obj_List_struct),
+                .gc_flags = GC_OWNS_ITEMS,
+        },
+        .vtable = {
+                method_List_constructor,  // constructor
+                method_List_string, // STRING
+                method_Obj_print, // PRINT
+                method_Obj_equals,  // EQUALS
+                method_List_length,
+                method_List_get,
+                method_List_set,
+                method_List_append,
+                method_List_sum,
+                method_List_join,
+                method_List_slice
+        }
+};
+
+class_ref the_class_List = &the_class_List_struct;
+
+/* ================
+ * Dict
+ * Fields:
+ *    Hidden:  size, the entries in insertion order, and a table
+ *    of entry numbers indexed by hash
+ * Methods:
+ *    Those of Obj, plus
+ *    GET, PUT, HAS, REMOVE, SIZE
+ * =================
+ */
+
+#define DICT_EMPTY (-1)     // Slot never used
+#define DICT_REMOVED (-2)   // Slot of a removed key;  probing continues
+
+static void dict_rebuild(obj_Dict dict);
+
+/* A new Dict (zeroed by new) gets its table on first use, since
+ * the constructor of a subclass does not call the Dict constructor.
+ */
+static obj_Dict this_dict(void) {
+    obj_ref this = vm_fp->obj;
+    assert_is_type(this, the_class_Dict);
+    obj_Dict dict = (obj_Dict) this;
+    if (! dict->slots) {
+        dict_rebuild(dict);
+    }
+    return dict;
+}
+
+/* Hash of a key, which must be an Int or a String */
+static unsigned int key_hash(obj_ref key) {
+    class_ref clazz = key->header.clazz;
+    if (clazz == the_class_Int) {
+        return int_hash(((obj_Int) key)->value);
+    }
+    if (clazz != the_class_String) {
+        builtin_failure("Dict key must be an Int or String, not %s",
+                        clazz->header.class_name);
+    }
+    return string_hash((obj_String) key);
+}
+
+static int keys_equal(obj_ref a, obj_ref b) {
+    if (a == b) {
+        return 1;
+    }
+    if (a->header.clazz != b->header.clazz) {
+        return 0;
+    }
+    if (a->header.clazz == the_class_Int) {
+        return ((obj_Int) a)->value == ((obj_Int) b)->value;
+    }
+    return strings_equal((obj_String) a, (obj_String) b);
+}
+
+/* First slot to probe.  Int hashes are often small consecutive
+ * numbers, so we scramble the hash before masking off its low bits.
+ */
+static inline int home_slot(unsigned int hash, int n_slots) {
+    hash ^= hash >> 16;
+    hash *= 0x45d9f3bu;
+    hash ^= hash >> 16;
+    return (int) (hash & (n_slots - 1));
+}
+
+/* Slot of the entry for key, or -1 if there is none, in which case
+ * *free_slot is where to put it.  The table is never more than
+ * half full (counting removed keys), so probing always ends.
+ */
+static int find_slot(obj_Dict dict, obj_ref key, unsigned int hash, int *free_slot) {
+    int mask = dict->n_slots - 1;
+    int first_free = -1;
+    for (int i = home_slot(hash, dict->n_slots); ; i = (i + 1) & mask) {
+        int entry = dict->slots[i];
+        if (entry == DICT_EMPTY) {
+            *free_slot = first_free < 0 ? i : first_free;
+            return -1;
+        }
+        if (entry == DICT_REMOVED) {
+            if (first_free < 0) {
+                first_free = i;
+            }
+        } else if (dict->entries[entry].hash == hash
+                   && keys_equal(dict->entries[entry].key, key)) {
+            return i;
+        }
+    }
+}
+
+/* Make room for at least one more entry.  Entries of removed
+ * keys are dropped and the table rebuilt, growing both so that
+ * putting is amortized constant time.
+ */
+static void dict_rebuild(obj_Dict dict) {
+    int capacity = 8;
+    while (capacity < dict->size + dict->size / 2 + 1) {
+        capacity *= 2;
+    }
+    struct dict_entry *entries = malloc(capacity * sizeof(struct dict_entry));
+    int *slots = malloc(2 * capacity * sizeof(int));
+    assert(entries && slots);
+    int n_slots = 2 * capacity;
+    for (int i = 0; i < n_slots; ++i) {
+        slots[i] = DICT_EMPTY;
+    }
+    int n_entries = 0;
+    for (int i = 0; i < dict->n_entries; ++i) {
+        if (! dict->entries[i].key) {
+            continue;
+        }
+        entries[n_entries] = dict->entries[i];
+        int slot = home_slot(entries[n_entries].hash, n_slots);
+        while (slots[slot] != DICT_EMPTY) {
+            slot = (slot + 1) & (n_slots - 1);
+        }
+        slots[slot] = n_entries++;
+    }
+    free(dict->entries);
+    free(dict->slots);
+    dict->entries = entries;
+    dict->slots = slots;
+    dict->n_entries = n_entries;
+    dict->capacity = capacity;
+    dict->n_slots = n_slots;
+}
+
+/* Constructor:  An empty dict, with its table (see this_dict) */
+obj_ref native_Dict_constructor(void) {
+    return (obj_ref) this_dict();
+}
+
+vm_Word method_Dict_constructor[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_Dict_constructor},
+        {.instr = vm_op_return},
+        {.intval = 0}
+};
+
+/* Dict:string, e.g., "{one: 1, 2: two}", in insertion order */
+obj_ref native_Dict_string(void) {
+    obj_Dict dict = this_dict();
+    char *text;
+    size_t size;
+    FILE *out = open_memstream(&text, &size);
+    assert(out);
+    fputc('{', out);
+    int first = 1;
+    for (int i = 0; i < dict->n_entries; ++i) {
+        if (! dict->entries[i].key) {
+            continue;
+        }
+        if (! first) {
+            fputs(", ", out);
+        }
+        first = 0;
+        write_element(out, dict->entries[i].key);
+        fputs(": ", out);
+        write_element(out, dict->entries[i].value);
+    }
+    fputc('}', out);
+    fclose(out);
+    return new_string(text);
+}
+
+vm_Word method_Dict_string[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_Dict_string},
+        {.instr = vm_op_return},
+        {.intval = 0}
+};
+
+/* Inherit Obj:print, which will call Dict:string,
+ * and Obj:equals (identity)
+ */
+
+/* Dict:get(key) */
+obj_ref native_Dict_get(void) {
+    obj_Dict dict = this_dict();
+    obj_ref key = (vm_fp - 1)->obj;
+    int free_slot;
+    int slot = find_slot(dict, key, key_hash(key), &free_slot);
+    if (slot < 0) {
+        char *text;
+        size_t size;
+        FILE *out = open_memstream(&text, &size);
+        assert(out);
+        write_element(out, key);
+        fclose(out);
+        builtin_failure("Dict has no key %s", text);
+    }
+    return dict->entries[dict->slots[slot]].value;
+}
+
+vm_Word method_Dict_get[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_Dict_get},
+        {.instr = vm_op_return},
+        {.intval = 1}
+};
+
+/* Dict:put(key, value) */
+obj_ref native_Dict_put(void) {
+    obj_Dict dict = this_dict();
+    obj_ref key = (vm_fp - 2)->obj;
+    obj_ref value = (vm_fp - 1)->obj;
+    unsigned int hash = key_hash(key);
+    int free_slot;
+    int slot = find_slot(dict, key, hash, &free_slot);
+    if (slot >= 0) {
+        dict->entries[dict->slots[slot]].value = value;
+        return nothing;
+    }
+    if (dict->n_entries == dict->capacity) {
+        dict_rebuild(dict);
+        find_slot(dict, key, hash, &free_slot);
+    }
+    struct dict_entry *entry = &dict->entries[dict->n_entries];
+    entry->key = key;
+    entry->value = value;
+    entry->hash = hash;
+    dict->slots[free_slot] = dict->n_entries++;
+    dict->size += 1;
+    return nothing;
+}
+
+vm_Word method_Dict_put[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_Dict_put},
+        {.instr = vm_op_return},
+        {.intval = 2}
+};
+
+/* Dict:has(key) */
+obj_ref native_Dict_has(void) {
+    obj_Dict dict = this_dict();
+    obj_ref key = (vm_fp - 1)->obj;
+    int free_slot;
+    if (find_slot(dict, key, key_hash(key), &free_slot) >= 0) {
+        return lit_true;
+    }
+    return lit_false;
+}
+
+vm_Word method_Dict_has[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_Dict_has},
+        {.instr = vm_op_return},
+        {.intval = 1}
+};
+
+/* Dict:remove(key), true if the key was there */
+obj_ref native_Dict_remove(void) {
+    obj_Dict dict = this_dict();
+    obj_ref key = (vm_fp - 1)->obj;
+    int free_slot;
+    int slot = find_slot(dict, key, key_hash(key), &free_slot);
+    if (slot < 0) {
+        return lit_false;
+    }
+    struct dict_entry *entry = &dict->entries[dict->slots[slot]];
+    entry->key = 0;
+    entry->value = 0;
+    dict->slots[slot] = DICT_REMOVED;
+    dict->size -= 1;
+    return lit_true;
+}
+
+vm_Word method_Dict_remove[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_Dict_remove},
+        {.instr = vm_op_return},
+        {.intval = 1}
+};
+
+/* Dict:size */
+obj_ref native_Dict_size(void) {
+    return new_int(this_dict()->size);
+}
+
+vm_Word method_Dict_size[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_Dict_size},
+        {.instr = vm_op_return},
+        {.intval = 0}
+};
+
+/* The Dict Class (a singleton) */
+struct  class_struct  the_class_Dict_struct = {
+        .header = {
+                .class_name = "Dict",
+                .healthy_class_tag = HEALTHY,
+                .super = the_class_Obj,
+                .n_fields = 0,
+                .object_size = sizeof(struct obj_Dict_struct),
+                .gc_flags = GC_OWNS_TABLE,
+        },
+        .vtable = {
+                method_Dict_constructor,  // constructor
+                method_Dict_string, // STRING
+                method_Obj_print, // PRINT
+                method_Obj_equals,  // EQUALS
+                method_Dict_get,
+                method_Dict_put,
+                method_Dict_has,
+                method_Dict_remove,
+                method_Dict_size
+        }
+};
+
+class_ref the_class_Dict = &the_class_Dict_struct;
+
+/* ================
+ * StringBuilder
+ * Fields:
+ *    Hidden:  length, capacity, and a malloced buffer
+ * Methods:
+ *    Those of Obj, plus
+ *    APPEND, LENGTH
+ * =================
+ */
+
+static obj_StringBuilder this_builder(void) {
+    obj_ref this = vm_fp->obj;
+    assert_is_type(this, the_class_StringBuilder);
+    return (obj_StringBuilder) this;
+}
+
+/* Constructor:  Nothing appended yet */
+obj_ref native_StringBuilder_constructor(void) {
+    obj_StringBuilder builder = this_builder();
+    builder->length = 0;
+    builder->capacity = 0;
+    builder->text = 0;
+    builder->header.gc_flags |= GC_OWNS_BUFFER;
+    return (obj_ref) builder;
+}
+
+vm_Word method_StringBuilder_constructor[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_StringBuilder_constructor},
+        {.instr = vm_op_return},
+        {.intval = 0}
+};
+
+/* StringBuilder:string, a copy of the text so far */
+obj_ref native_StringBuilder_string(void) {
+    obj_StringBuilder builder = this_builder();
+    char *text = malloc(builder->length + 1);
+    assert(text);
+    memcpy(text, builder->text, builder->length);
+    text[builder->length] = '\0';
+    return new_string_of_length(text, builder->length);
+}
+
+vm_Word method_StringBuilder_string[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_StringBuilder_string},
+        {.instr = vm_op_return},
+        {.intval = 0}
+};
+
+/* Inherit Obj:print, which will call StringBuilder:string,
+ * and Obj:equals (identity)
+ */
+
+/* StringBuilder:append(s).  The buffer doubles as needed,
+ * so appending is amortized linear in the length of s.
+ */
+obj_ref native_StringBuilder_append(void) {
+    obj_StringBuilder builder = this_builder();
+    obj_ref arg = (vm_fp - 1)->obj;
+    assert_is_type(arg, the_class_String);
+    obj_String s = (obj_String) arg;
+    size_t length = builder->length + s->length;
+    if (length > builder->capacity) {
+        size_t capacity = builder->capacity ? builder->capacity : 64;
+        while (capacity < length) {
+            capacity *= 2;
+        }
+        builder->text = realloc(builder->text, capacity);
+        assert(builder->text);
+        builder->capacity = capacity;
+    }
+    memcpy(builder->text + builder->length, s->text, s->length);
+    builder->length = length;
+    return nothing;
+}
+
+vm_Word method_StringBuilder_append[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_StringBuilder_append},
+        {.instr = vm_op_return},
+        {.intval = 1}
+};
+
+/* StringBuilder:length */
+obj_ref native_StringBuilder_length(void) {
+    return new_int((int) this_builder()->length);
+}
+
+vm_Word method_StringBuilder_length[] = {
+        {.instr = vm_op_enter},
+        {.instr = vm_op_call_native},
+        {.native = native_StringBuilder_length},
+        {.instr = vm_op_return},
+        {.intval = 0}
+};
+
+/* The StringBuilder Class (a singleton) */
+struct  class_struct  the_class_StringBuilder_struct = {
+        .header = {
+                .class_name = "StringBuilder",
+                .healthy_class_tag = HEALTHY,
+                .super = the_class_Obj,
+                .n_fields = 0,
+                .object_size = sizeof(struct obj_StringBuilder_struct),
+                .gc_flags = GC_OWNS_BUFFER,
+        },
+        .vtable = {
+                method_StringBuilder_constructor,  // constructor
+                method_StringBuilder_string, // STRING
+                method_Obj_print, // PRINT
+                method_Obj_equals,  // EQUALS
+                method_StringBuilder_append,
+                method_StringBuilder_length
+        }
+};
+
+class_ref the_class_StringBuilder = &the_class_StringBuilder_struct;
+
 void class_health_check(class_ref clazz) {
     assert(clazz->header.healthy_class_tag == HEALTHY);
 }
@@ -788,4 +1660,7 @@ void health_check_builtins() {
     class_health_check(the_class_String);
     class_health_check(the_class_Boolean);
     class_health_check(the_class_Nothing);
+    class_health_check(the_class_List);
+    class_health_check(the_class_Dict);
+    class_health_check(the_class_StringBuilder);
 }
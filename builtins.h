@@ -11,7 +11,10 @@
  *     or something like 'void' or 'NULL' in C.
  * Boolean:  has only two values, true and false.
  * Int:  holds a native integer.
- * String: holds a char*
+ * String: holds a char* and its length
+ * StringBuilder:  a growable buffer for building a String
+ * List:  holds a growable array of object references
+ * Dict:  maps Int and String keys to object references
  *
  * 2022 revision:  All methods return obj_ref, not more specific
  * classes.  The C type system, lacking a notion of subtype / subclass,
@@ -39,6 +42,9 @@ extern class_ref the_class_String;
 extern class_ref the_class_Boolean;
 extern class_ref the_class_Int;
 extern class_ref the_class_Nothing;
+extern class_ref the_class_List;
+extern class_ref the_class_Dict;
+extern class_ref the_class_StringBuilder;
 
 /* Literal constants.  */
 extern obj_ref nothing;                 // token: nothing
@@ -104,9 +110,12 @@ extern  const class_ref the_class_Obj; /* Initialized in builtins.c */
 /* ================
  * String
  * Fields:
- *    One hidden field, holding char*
+ *    Hidden fields:  the text (a char*, NUL terminated), its
+ *    length, and its hash once computed.  Strings are immutable,
+ *    so the length and hash are never out of date.
  * Methods:
- *    Those of Obj, plus ordering, concatenation
+ *    Those of Obj, plus ordering, concatenation, HASH,
+ *    FLUSH (print, then write out the output buffer)
  *    FIXME: (Incomplete for now.)
  * ==================
  */
@@ -115,7 +124,9 @@ typedef struct class_String_struct* class_String;
 
 typedef struct obj_String_struct {
     struct obj_header_struct header;
-    char *text;  // Hidden field
+    char *text;         // Hidden fields
+    size_t length;      // Bytes of text, not counting the NUL
+    unsigned int hash;  // 0 until computed
 } * obj_String;
 
 struct class_String_struct {
@@ -128,6 +139,8 @@ struct class_String_struct {
     /* Added method */
     vm_addr m_less;
     vm_addr m_plus;
+    vm_addr m_hash;
+    vm_addr m_flush;
 };
 
 extern class_ref the_class_String;
@@ -227,6 +240,8 @@ extern obj_ref nothing;
  *    and introducing
  *    LESS
  *    PLUS
+ *    SUB, MULT, DIV
+ *    HASH
  *    (add more later)
  * =================
  */
@@ -251,6 +266,7 @@ struct class_Int_struct {
     vm_addr m_sub;
     vm_addr m_mult;
     vm_addr m_div;
+    vm_addr m_hash;
 };
 
 extern class_ref the_class_Int;
@@ -261,8 +277,160 @@ extern class_ref the_class_Int;
 extern int int_literal_const(char *n_lit);  // Index to constants table
 extern obj_ref new_int(int n);  // An object reference, not a literal
 
+/* Ints are immutable, so new_int returns a shared object for
+ * values from INT_CACHE_MIN to INT_CACHE_MAX rather than
+ * allocating one.  (Set the range with the cmake variables of
+ * the same names.)  The counters measure how well that works.
+ */
+#ifndef INT_CACHE_MIN
+#define INT_CACHE_MIN (-128)
+#endif
+#ifndef INT_CACHE_MAX
+#define INT_CACHE_MAX 1024
+#endif
+extern long n_ints_cached;     // new_int calls answered from the cache
+extern long n_ints_allocated;  // new_int calls that allocated
+
+/* ================
+ * List
+ * Fields:
+ *    Hidden:  the elements, in a malloced array that doubles
+ *    in size as needed.  The collector marks the elements
+ *    and frees the array with the list (GC_OWNS_ITEMS).
+ * Methods:
+ *    Those of Obj, plus
+ *    LENGTH, GET, SET, APPEND
+ *    SUM (of a list of Ints), JOIN (of a list of Strings),
+ *    SLICE (a new list)
+ * =================
+ */
+
+struct class_List_struct;
+typedef struct class_List_struct* class_List;
+
+typedef struct obj_List_struct {
+    struct obj_header_struct header;
+    int length;       // Hidden fields
+    int capacity;
+    obj_ref *items;
+} * obj_List;
+
+struct class_List_struct {
+    struct class_header_struct header;
+    /* Method table: Inherited or overridden */
+    vm_addr constructor;
+    vm_addr m_string;
+    vm_addr m_print;
+    vm_addr m_equals;
+    /* Added methods */
+    vm_addr m_length;
+    vm_addr m_get;
+    vm_addr m_set;
+    vm_addr m_append;
+    vm_addr m_sum;
+    vm_addr m_join;
+    vm_addr m_slice;
+};
+
+extern class_ref the_class_List;
+
+/* Hash codes of Int and String values, as returned by their
+ * HASH methods and used by Dict
+ */
+extern unsigned int int_hash(int n);
+extern unsigned int string_hash(obj_String s);
+
+/* ================
+ * Dict
+ * Fields:
+ *    Hidden:  the entries (key, value, and hash of the key) in
+ *    the order their keys were first put, and an open addressing
+ *    table of entry numbers, probed linearly from the hash.  Both
+ *    are malloced and grow as needed.  The collector marks the
+ *    keys and values and frees both with the dict (GC_OWNS_TABLE).
+ *    Keys must be Ints or Strings;  they are compared by value.
+ * Methods:
+ *    Those of Obj, plus
+ *    GET, PUT, HAS, REMOVE, SIZE
+ * =================
+ */
+
+struct class_Dict_struct;
+typedef struct class_Dict_struct* class_Dict;
+
+struct dict_entry {
+    obj_ref key;      // 0 once removed
+    obj_ref value;
+    unsigned int hash;
+};
+
+typedef struct obj_Dict_struct {
+    struct obj_header_struct header;
+    int size;         // Hidden fields:  keys present
+    int n_entries;    // Entries in use, including removed ones
+    int capacity;     // Room for entries
+    int n_slots;      // Table size, a power of two
+    int *slots;       // Entry numbers, or DICT_EMPTY or DICT_REMOVED
+    struct dict_entry *entries;
+} * obj_Dict;
+
+struct class_Dict_struct {
+    struct class_header_struct header;
+    /* Method table: Inherited or overridden */
+    vm_addr constructor;
+    vm_addr m_string;
+    vm_addr m_print;
+    vm_addr m_equals;
+    /* Added methods */
+    vm_addr m_get;
+    vm_addr m_put;
+    vm_addr m_has;
+    vm_addr m_remove;
+    vm_addr m_size;
+};
+
+extern class_ref the_class_Dict;
+
+/* ================
+ * StringBuilder
+ * Fields:
+ *    Hidden:  a malloced buffer that doubles in size as needed,
+ *    freed with the builder by the collector (GC_OWNS_BUFFER)
+ * Methods:
+ *    Those of Obj, plus
+ *    APPEND (a String), LENGTH
+ *    STRING makes a String of the text so far
+ * =================
+ */
+
+struct class_StringBuilder_struct;
+typedef struct class_StringBuilder_struct* class_StringBuilder;
+
+typedef struct obj_StringBuilder_struct {
+    struct obj_header_struct header;
+    size_t length;      // Hidden fields
+    size_t capacity;
+    char *text;         // Not NUL terminated
+} * obj_StringBuilder;
+
+struct class_StringBuilder_struct {
+    struct class_header_struct header;
+    /* Method table: Inherited or overridden */
+    vm_addr constructor;
+    vm_addr m_string;
+    vm_addr m_print;
+    vm_addr m_equals;
+    /* Added methods */
+    vm_addr m_append;
+    vm_addr m_length;
+};
+
+extern class_ref the_class_StringBuilder;
+
 extern int str_literal_const(char *s_lit); // Index to constants table
 extern obj_ref new_string(char *s);  // An object reference, not a literal
+/* The same, when the length of s is known */
+extern obj_ref new_string_of_length(char *s, size_t length);
 
 /* Debugging - health checks */
 extern void class_health_check(class_ref clazz);
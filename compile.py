@@ -5,9 +5,16 @@ Lark Parser Generator
 REPL calculator shows how to write a basic calculator with variables.
 """
 from lark import Lark, Transformer, v_args, visitors
+import lark
 import sys, os
 import json
-from typing import List, Callable
+import copy
+import argparse
+import hashlib
+import importlib.util
+import io
+from pathlib import Path
+from typing import List, Callable, Iterator, Optional, TextIO
 import logging
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 log = logging.getLogger(__name__)
@@ -20,21 +27,300 @@ def new_label(prefix: str) -> str:
     JUMP_COUNT += 1
     return f"{prefix}_{JUMP_COUNT}"
 
-def ignore(node: "ASTNode", visit_state, variables):
+def ignore(node: "ASTNode", visit_state, variables=None):
     log.debug(f"No visitor action at {node.__class__.__name__} node")
     return
 
 def flatten(m: list):
     """Flatten nested lists into a single level of list"""
     flat = []
-    for item in m:
-        if isinstance(item, list):
-            flat += flatten(item)
-        else:
+    pending = [iter(m)]   # Lists we are in the middle of
+    while pending:
+        for item in pending[-1]:
+            if isinstance(item, list):
+                pending.append(iter(item))
+                break
             flat.append(item)
+        else:
+            pending.pop()
     return flat
 
 
+# ----------------
+#  Static types.  The types are the classes, ordered by
+#  inheritance, with Obj at the top;  the least upper bound
+#  of two types is their nearest common ancestor.  The symbol
+#  table (visit_state) maps each class name to its entry,
+#  {"super": ..., "fields": {name: type}, "methods": {name:
+#  {"params": [types], "ret": type}}}, for the builtin classes
+#  (from orilib/builtin_methods.json) and the classes of the
+#  program (added by initialization).
+#
+
+# Operators are methods of the left operand, named for the vm
+# (Int:plus), but the builtin table uses the Quack names.
+OPERATOR_METHODS = {"plus": "PLUS", "sub": "MINUS",
+                    "mult": "TIMES", "div": "DIVIDE"}
+
+
+def class_entry(visit_state: dict, name: str) -> dict:
+    entry = visit_state.get(name)
+    if not isinstance(entry, dict) or "methods" not in entry:
+        raise Exception(f"Unknown class {name}")
+    return entry
+
+
+def ancestors(visit_state: dict, name: str) -> List[str]:
+    """name, its superclass, ..., Obj"""
+    chain = [name]
+    while name != "Obj":
+        name = str(class_entry(visit_state, name)["super"])
+        if name in chain:
+            raise Exception(f"Circular inheritance through {name}")
+        chain.append(name)
+    return chain
+
+
+def is_subtype(visit_state: dict, sub: str, sup: str) -> bool:
+    return sup in ancestors(visit_state, sub)
+
+
+def lub(visit_state: dict, a: str, b: str) -> str:
+    """Least upper bound of two types"""
+    b_ancestors = ancestors(visit_state, b)
+    for clazz in ancestors(visit_state, a):
+        if clazz in b_ancestors:
+            return clazz
+    return "Obj"
+
+
+def join_envs(visit_state: dict, left: dict, right: dict) -> dict:
+    """Variable types where control flow merges.  A variable
+    assigned on only one path is not available after the merge.
+    """
+    return {var: lub(visit_state, t, right[var])
+            for var, t in left.items() if var in right}
+
+
+def method_signature(visit_state: dict, clazz: str, method: str) -> dict:
+    """Signature of method in clazz, possibly inherited"""
+    for ancestor in ancestors(visit_state, clazz):
+        methods = class_entry(visit_state, ancestor)["methods"]
+        if method in methods:
+            return methods[method]
+    raise Exception(f"Class {clazz} has no method {method}")
+
+
+def check_args(visit_state: dict, where: str, params: List[str],
+               args: List["ASTNode"]):
+    """Type check actual arguments against formal parameter types"""
+    if len(args) != len(params):
+        raise Exception(f"{where} takes {len(params)} arguments, not {len(args)}")
+    for arg, param in zip(args, params):
+        arg_type = arg.type_check(visit_state)
+        if not is_subtype(visit_state, arg_type, param):
+            raise Exception(f"{where} expects {param}, not {arg_type}")
+
+
+def qualifier(visit_state: dict, clazz: str) -> str:
+    """How assembly code names clazz in Class:method and Class:field
+    operands.  The class being compiled is $, since the assembler
+    cannot import it.
+    """
+    return "$" if clazz == visit_state["current_class"] else clazz
+
+
+def field_owner(visit_state: dict, clazz: str, field: str) -> str:
+    """The class that declares field for objects of clazz.  A
+    subclass cannot add a second field of the same name, so this is
+    the most distant ancestor that has it.
+    """
+    for ancestor in reversed(ancestors(visit_state, clazz)):
+        if field in class_entry(visit_state, ancestor)["fields"]:
+            return ancestor
+    raise Exception(f"Class {clazz} has no field {field}")
+
+
+def field_type(visit_state: dict, clazz: str, field: str) -> str:
+    owner = field_owner(visit_state, clazz, field)
+    return class_entry(visit_state, owner)["fields"][field]
+
+
+# ----------------
+#  Constant folding, after type checking.  fold() returns the
+#  node that replaces an expression (often the same node, with its
+#  children folded), or the list of statements that replaces a
+#  statement.  We fold only what gives the same result as the vm:
+#  Int results must fit in a 32-bit int, and division by zero is
+#  left for the vm to report.
+#
+INT_MIN = -2 ** 31
+INT_MAX = 2 ** 31 - 1
+
+
+def int_value(node: "ASTNode") -> Optional[int]:
+    """Value of an Int literal, or None"""
+    if isinstance(node, VarNode) and node.type == "Int":
+        try:
+            return int(node.const)
+        except ValueError:
+            return None
+    return None
+
+
+def bool_value(node: "ASTNode") -> Optional[bool]:
+    """Value of a Bool literal, or None"""
+    if isinstance(node, VarNode) and node.type == "Bool":
+        return node.const == "true"
+    return None
+
+
+def int_literal(value: int) -> Optional["VarNode"]:
+    if INT_MIN <= value <= INT_MAX:
+        return VarNode(str(value), "Int")
+    return None
+
+
+def bool_literal(value: bool) -> "VarNode":
+    return VarNode("true" if value else "false", "Bool")
+
+
+def fold_block(block) -> List["ASTNode"]:
+    """Fold a statement or list of statements to a list of statements"""
+    folded = []
+    for statement in flatten([block]):
+        folded += flatten([statement.fold()])
+    return folded
+
+
+def count_nodes(node) -> int:
+    """Size of the AST below node"""
+    count = 0
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        count += 1
+        children = flatten([getattr(node, "children", [])])
+        pending += [c for c in children if isinstance(c, ASTNode)]
+    return count
+
+
+# ----------------
+#  Code generation.  Each node gives its code as a list of work
+#  items (gen):  instructions (Op) and labels, nodes whose code
+#  goes in their place, Branches (conditions to evaluate for a
+#  jump, see c_eval), and directive lines of assembly code.
+#  expand turns them into a sequence of Ops, Labels, and lines
+#  with a stack rather than by recursion, so long blocks and deeply
+#  nested expressions cost no Python stack.  emit writes the
+#  sequence as assembly code, as it is produced;  emit_objects
+#  feeds the Ops and Labels of each method to the assembler's
+#  ObjectCode, giving object code without assembly text.
+#
+
+class Op:
+    """Work item: one vm instruction"""
+    __slots__ = ("opname", "operand")
+
+    def __init__(self, opname: str, operand: Optional[str] = None):
+        self.opname = opname
+        self.operand = operand
+
+    def __str__(self):
+        if self.operand is None:
+            return self.opname
+        return f"{self.opname} {self.operand}"
+
+
+class Label:
+    """Work item: label of the next instruction"""
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __str__(self):
+        return f"{self.name}:"
+
+
+class Branch:
+    """Work item: code for cond that jumps to true_branch or false_branch"""
+    def __init__(self, cond: "ASTNode", true_branch: str, false_branch: str):
+        self.cond = cond
+        self.true_branch = true_branch
+        self.false_branch = false_branch
+
+
+LEAF_ITEMS = (Op, Label, str)
+
+
+def expand(items: list) -> Iterator:
+    """Ops, Labels, and lines for a list of work items, in order"""
+    work = list(reversed(items))
+    while work:
+        item = work.pop()
+        if isinstance(item, LEAF_ITEMS):
+            yield item
+        elif isinstance(item, ASTNode):
+            items = item.gen()
+            items.reverse()
+            work += items
+        elif isinstance(item, Branch):
+            items = item.cond.c_eval(item.true_branch, item.false_branch)
+            items.reverse()
+            work += items
+        elif isinstance(item, list):
+            work += reversed(item)
+        else:
+            raise Exception(f"No code for {item!r}")
+
+
+def emit(root: "ASTNode", out: TextIO, chunk: int = 4096):
+    """Write the assembly code for root to out, chunk lines at a time"""
+    lines = []
+    for item in expand([root]):
+        lines.append(str(item))
+        if len(lines) == chunk:
+            lines.append("")
+            out.write("\n".join(lines))
+            lines = []
+    lines.append("")
+    out.write("\n".join(lines))
+
+
+def emit_objects(program: "ProgramNode", optimize: bool = False) -> list:
+    """An assembler ObjectCode for each class of the program.
+    Classes of the program may refer to one another in any order,
+    so we first make the method and field layout of each class
+    importable (superclasses first), then translate the methods.
+    """
+    import assemble
+    classes = sorted(program.classes, key=lambda c: program.depth(c.name))
+    resolver = assemble.default_resolver().scope()
+    for clazz in classes:
+        header = clazz.object_header(assemble.ObjectCode(resolver=resolver))
+        resolver.provide(clazz.name, header.method_list, header.field_list)
+    objects = []
+    for clazz in program.classes:
+        code = clazz.object_header(assemble.ObjectCode(optimize, resolver))
+        for method in clazz.method_nodes():
+            code.begin_method(str(method.name))
+            if method.arg_names():
+                code.declare_args(method.arg_names())
+            if method.local_names():
+                code.allocate_locals(method.local_names())
+            for item in expand(method.code()):
+                if isinstance(item, Op):
+                    operation = assemble.INSTRS[item.opname]
+                    code.add_instruction(assemble.Instruction(None, operation, item.operand))
+                else:
+                    code.add_label(item.name)
+        code.finish()
+        objects.append(code)
+    resolver.save()
+    return objects
+
+
 class ASTNode:
     """Abstract base class"""
     def __init__(self):
@@ -47,31 +333,90 @@ class ASTNode:
                 c.initialization(visit_state)
         else: ignore(self, visit_state)
 
-    def type_check(self, visit_state: dict):
+    def type_check(self, visit_state: dict) -> Optional[str]:
+        """Static type of an expression (also kept as self.type
+        for code generation), or None for a statement.  Variable
+        types in visit_state["env"] are updated in execution order.
+        """
         if self.children:
             for c in flatten([self.children]):
-                c.initialization(visit_state)
+                c.type_check(visit_state)
         else: ignore(self, visit_state)
+        return None
+
+    def fold(self):
+        """Constant folding (leaves are already as simple as can be)"""
+        return self
 
     def r_eval(self, visit_state: dict) -> List[str]:
         """Evaluate for value"""
         #raise NotImplementedError(f"r_eval not implemented for node type {self.__class__.__name__}")
         raise NotImplementedError(f"r_eval not implemented for node type {self.__class__.__name__}")
 
-    def c_eval(self, true_branch: str, false_branch: str) -> List[str]:
+    def gen(self) -> list:
+        """Work items for emit, to evaluate for value"""
+        raise NotImplementedError(f"gen not implemented for node type {self.__class__.__name__}")
+
+    def c_eval(self, true_branch: str, false_branch: str) -> list:
+        """Work items for emit, to evaluate for a jump"""
         raise NotImplementedError(f"c_eval not implemented for node type {self.__class__.__name__}")
 
+    def __str__(self) -> str:
+        out = io.StringIO()
+        emit(self, out)
+        return out.getvalue()
+
 
 class ProgramNode(ASTNode):
     '''program : [(classes)* (statement)*]'''
     def __init__(self, classes: List[ASTNode] = [], methods: List[ASTNode] = [], stmt_block: List[ASTNode] = []):
-        self.classes = classes
+        # A single class is not wrapped in a list (?classes)
+        self.classes = flatten([classes])
         main_class = ClassNode("$Main", [], "Obj", stmt_block, methods)
         self.classes.append(main_class)
         self.children = [classes, methods, stmt_block]
 
-    def __str__(self) -> str:
-        return "\n".join([str(c) for c in self.classes])
+    def gen(self) -> list:
+        return list(self.classes)
+
+    def initialization(self, visit_state: dict):
+        # Including $Main, which is not among the children
+        for c in self.classes:
+            c.initialization(visit_state)
+
+    def type_check(self, visit_state: dict):
+        """Check every class until the inferred field types settle.
+        Constructors go first, superclasses before subclasses, since
+        they introduce the fields that methods use.  Field types only
+        grow (by least upper bound), so this ends.
+        """
+        classes = sorted(self.classes, key=lambda c: self.depth(c.name))
+        while True:
+            before = {c.name: dict(visit_state[c.name]["fields"]) for c in self.classes}
+            for c in classes:
+                c.type_check_constructor(visit_state)
+            for c in classes:
+                c.type_check(visit_state)
+            if before == {c.name: visit_state[c.name]["fields"] for c in self.classes}:
+                return
+
+    def fold(self):
+        for c in self.classes:
+            c.fold()
+        return self
+
+    def size(self) -> int:
+        """Number of nodes, including $Main"""
+        return 1 + sum(count_nodes(c) for c in self.classes)
+
+    def depth(self, name: str) -> int:
+        """Superclasses of class name that are in this program"""
+        names = {c.name: c for c in self.classes}
+        depth = 0
+        while str(names[name].super_class) in names:
+            name = str(names[name].super_class)
+            depth += 1
+        return depth
 
 
 class ClassNode(ASTNode):
@@ -85,24 +430,47 @@ class ClassNode(ASTNode):
         self.super_class = super_class
         self.methods = methods
         self.constructor = MethodNode("$constructor", formals, name, block)
+        self.fields = []    # Names of fields not inherited, from type_check
         self.children = [methods, self.constructor]
 
-    def __str__(self):
-        ret = f"\n.class {self.name}:{self.super_class}\n"
-        formals_str = ", ".join([str(fm) for fm in flatten([self.formals])])
-        if formals_str:
-            ret += f".field {formals_str}\n"
-        methods_str = "\n".join([f"{method}" for method in flatten([self.methods])])
-        ret += f"{methods_str}\n\n{self.constructor}"
-        return ret
+    def field_names(self) -> List[str]:
+        """Constructor arguments, then fields found by type_check,
+        less those a superclass already has
+        """
+        fields = [str(fm) for fm in flatten([self.formals])]
+        return ([f for f in fields if f in self.fields]
+                + [f for f in self.fields if f not in fields])
+
+    def method_nodes(self) -> List["MethodNode"]:
+        return flatten([self.methods]) + [self.constructor]
+
+    def gen(self) -> list:
+        ret = ["", f".class {self.name}:{self.super_class}"]
+        if self.field_names():
+            ret.append(f".field {', '.join(self.field_names())}")
+        # Methods may call methods defined after them
+        ret += [f".method {method.name} forward" for method in self.method_nodes()]
+        return ret + flatten([self.methods]) + ["", self.constructor]
+
+    def object_header(self, code):
+        """Declare the class, its fields, and its methods in an
+        assembler ObjectCode, as the directives of gen would
+        """
+        code.declare_class(self.name, str(self.super_class))
+        for field in self.field_names():
+            code.declare_field(field)
+        for method in self.method_nodes():
+            code.declare_method(str(method.name))
+        return code
 
     def initialization(self, visit_state: List):
         """Create class entry in symbol table (as a preorder visit)"""
         if self.name in visit_state:
             raise Exception(f"Shadowing class {self.name} is not permitted")
         visit_state[self.name] = {
-            "super": self.super_class,
-            "fields": { f"{fm.var_type}" for fm in flatten([self.formals])},
+            "super": str(self.super_class),
+            "fields": {str(fm): str(fm.var_type) for fm in flatten([self.formals])},
+            "declared": [str(fm) for fm in flatten([self.formals])],
             "methods": {}
         }
         visit_state["current_class"] = self.name
@@ -113,8 +481,25 @@ class ClassNode(ASTNode):
             for c in flatten(self.children):
                 c.initialization(visit_state)
 
+    def type_check_constructor(self, visit_state: dict):
+        visit_state["current_class"] = self.name
+        self.constructor.type_check(visit_state)
+
+    def type_check(self, visit_state: dict):
+        """Check the methods;  ProgramNode checks the constructor first"""
+        visit_state["current_class"] = self.name
+        for method in flatten([self.methods]):
+            method.type_check(visit_state)
+        self.fields = [f for f in visit_state[self.name]["fields"]
+                       if field_owner(visit_state, self.name, f) == self.name]
+
+    def fold(self):
+        for method in flatten([self.methods]):
+            method.fold()
+        self.constructor.fold()
+        return self
+
 
-###FIX RETURN
 class MethodNode(ASTNode):
     def __init__(self, name: str, formals: List[ASTNode],
                  returns: str, body: List[ASTNode]):
@@ -125,22 +510,29 @@ class MethodNode(ASTNode):
         self.variables = {}
         self.children = [formals, body]
 
-    def __str__(self):
-        ret = f".method {self.name}\n"
-        if self.formals:
-            formals_str = ",".join([str(fm) for fm in flatten([self.formals])])
-            ret += f".args {formals_str}\n"
-        if self.variables:
-            locals_str = ",".join([str(v) for v in self.variables])
-            ret += f".local {locals_str}\n"
-        if self.body:
-            ret += "\n".join([str(b) for b in flatten([self.body])])
-        f_size = len(flatten([self.formals]))
-        if f_size:
-            ret += f"\nreturn {f_size}"
+    def arg_names(self) -> List[str]:
+        return [str(fm) for fm in flatten([self.formals])]
+
+    def local_names(self) -> List[str]:
+        return [str(v) for v in self.variables]
+
+    def code(self) -> list:
+        """Work items for the body.  Falling off the end returns
+        the new object from a constructor, and nothing otherwise.
+        """
+        if self.name == "$constructor":
+            result = Op("load", "$")
         else:
-            ret += f"\nconst nothing\nreturn {len(self.formals)}"
-        return ret
+            result = Op("const", "nothing")
+        return flatten([self.body]) + [result, Op("return", str(len(self.arg_names())))]
+
+    def gen(self) -> list:
+        ret = [f".method {self.name}"]
+        if self.arg_names():
+            ret.append(f".args {','.join(self.arg_names())}")
+        if self.local_names():
+            ret.append(f".local {','.join(self.local_names())}")
+        return ret + self.code()
 
     # Add this method to the symbol table
     def initialization(self, visit_state: List):
@@ -148,7 +540,7 @@ class MethodNode(ASTNode):
         clazz = visit_state["current_class"]
         if self.name in visit_state[clazz]:
             raise Exception(f"Redeclaration of method {self.name} not permitted")
-        visit_state[clazz]["methods"][str(self.name)] = { "params": { f"{fm.var_type}" for fm in flatten([self.formals])}, "ret": str(self.returns) }
+        visit_state[clazz]["methods"][str(self.name)] = { "params": [str(fm.var_type) for fm in flatten([self.formals])], "ret": str(self.returns) }
 
         visit_state["def_init"] = set()
         classField = visit_state["fields"].copy()
@@ -162,6 +554,20 @@ class MethodNode(ASTNode):
         self.variables = visit_state["def_init"]
         visit_state["def_init"] = set()
 
+    def type_check(self, visit_state: dict):
+        """Variables start with the declared types of the formals"""
+        visit_state["env"] = {str(fm): str(fm.var_type) for fm in flatten([self.formals])}
+        visit_state["env"]["this"] = visit_state["current_class"]
+        visit_state["returns"] = str(self.returns)
+        visit_state["arity"] = len(self.arg_names())
+        for statement in flatten([self.body]):
+            statement.type_check(visit_state)
+
+    def fold(self):
+        self.body = fold_block(self.body)
+        self.children = [self.formals, self.body]
+        return self
+
 
 class FormalNode(ASTNode):
     def __init__(self, var_name: ASTNode, var_type: ASTNode):
@@ -178,10 +584,42 @@ class ReturnNode(ASTNode):
     def __init__(self, ret: List[ASTNode]):
         self.ret = ret
         self.children = ret
+        self.arity = 0    # Of the method, from type_check
 
-    def __str__(self):
-        ret = "\n".join([str(r) for r in self.ret])
-        return ret
+    def gen(self) -> list:
+        value = [r for r in self.ret if r is not None] or [Op("const", "nothing")]
+        return value + [Op("return", str(self.arity))]
+
+    def type_check(self, visit_state: dict):
+        self.type = "Nothing"
+        self.arity = visit_state["arity"]
+        for r in flatten([self.ret]):
+            self.type = r.type_check(visit_state)
+        if not is_subtype(visit_state, self.type, visit_state["returns"]):
+            raise Exception(f"Returning {self.type} from a method of type {visit_state['returns']}")
+
+    def fold(self):
+        self.ret = [r.fold() if isinstance(r, ASTNode) else r for r in self.ret]
+        self.children = self.ret
+        return self
+
+
+class ExprStmtNode(ASTNode):
+    """statement : r_exp ";"  (the value is discarded)"""
+    def __init__(self, exp: ASTNode):
+        self.exp = exp
+        self.children = [exp]
+
+    def gen(self) -> list:
+        return [self.exp, Op("pop")]
+
+    def type_check(self, visit_state: dict):
+        self.exp.type_check(visit_state)
+
+    def fold(self):
+        self.exp = self.exp.fold()
+        self.children = [self.exp]
+        return self
 
 
 class AsmtNode(ASTNode):
@@ -192,16 +630,31 @@ class AsmtNode(ASTNode):
         self.right = right
         self.children = [right, left]
 
-    def __str__(self):
-        ret = "\n".join([str(re) for re in self.children])
-        return ret
+    def gen(self) -> list:
+        return list(self.children)
 
     def initialization(self, visit_state: dict):
         self.right.initialization(visit_state)
         var = self.left.initialization(visit_state)
-        if var not in visit_state["fields"]:
+        if var is not None and var not in visit_state["fields"]:
             visit_state["def_init"].add(var)
 
+    def type_check(self, visit_state: dict):
+        """x: T = e checks e against T, and x has type T afterward"""
+        value_type = self.right.type_check(visit_state)
+        if self.type is not None:
+            declared = str(self.type)
+            if not is_subtype(visit_state, value_type, declared):
+                raise Exception(f"Assigning {value_type} to {self.left} declared {declared}")
+            value_type = declared
+        self.left.assign_type(visit_state, value_type)
+
+    def fold(self):
+        self.right = self.right.fold()
+        self.left = self.left.fold()
+        self.children = [self.right, self.left]
+        return self
+
 
 class WhileNode(ASTNode):
     """while_stmt : "while" condition stmt_block"""
@@ -213,22 +666,51 @@ class WhileNode(ASTNode):
         self.whilepart = whilepart
         self.children = [cond, whilepart]
 
-    def __str__(self):
+    def gen(self) -> list:
         cond_label = new_label("cond")
         loop_label = new_label("loop")
         endloop_label = new_label("endloop")
-        iftest = "\n".join([str(it) for it in flatten(self.cond.c_eval(loop_label, endloop_label))])
-        ret = f'''{cond_label}:\n{iftest}\n{loop_label}:\n'''
-        ret += '\n'.join([str(t) for t in flatten([self.whilepart])])
-        return ret + f"\njump {cond_label}\n{endloop_label}:"
+        return ([Label(cond_label), Branch(self.cond, loop_label, endloop_label), Label(loop_label)]
+                + flatten([self.whilepart])
+                + [Op("jump", cond_label), Label(endloop_label)])
 
     def initialization(self, visit_state: dict):
         original = visit_state["def_init"].copy()
         self.cond.initialization(visit_state)
-        for w in self.whilepart:
+        for w in flatten([self.whilepart]):
             w.initialization(visit_state)
         visit_state["def_init"] = original
 
+    def type_check(self, visit_state: dict):
+        """Types at the head of the loop are the least upper bound of
+        the types on entry and after the body; iterate to a fixed point.
+        """
+        entry = dict(visit_state["env"])
+        head = entry
+        while True:
+            visit_state["env"] = dict(head)
+            for c in flatten([self.cond]):
+                c.type_check(visit_state)
+            for w in flatten([self.whilepart]):
+                w.type_check(visit_state)
+            new_head = join_envs(visit_state, entry, visit_state["env"])
+            if new_head == head:
+                break
+            head = new_head
+        # The loop exits from the condition, at the head
+        visit_state["env"] = head
+
+    def fold(self):
+        """A loop that never runs disappears;  while true jumps
+        straight into the body (see VarNode.c_eval).
+        """
+        self.cond = self.cond.fold()
+        if bool_value(self.cond) is False:
+            return []
+        self.whilepart = fold_block(self.whilepart)
+        self.children = [self.cond, self.whilepart]
+        return self
+
 
 class IfNode(ASTNode):
     """if condition stmt_block [otherwise*]"""
@@ -241,18 +723,15 @@ class IfNode(ASTNode):
         self.elsepart = elsepart
         self.children = [cond, thenpart, elsepart]
 
-    def __str__(self):
+    def gen(self) -> list:
         then_label = new_label("then")
         else_label = new_label("else")
         endif_label = new_label("endif")
-        iftest = "\n".join([str(it) for it in flatten(self.cond.c_eval(then_label, else_label))])
-        retStr =  f"{iftest}\n{then_label}:\n"
-        retStr += '\n'.join([str(t) for t in flatten([self.thenpart])])
-        retStr += f"\njump {endif_label}\n"
-        if self.elsepart:
-            retStr += f"{else_label}:\n"
-            retStr += '\n'.join([str(e) for e in flatten([self.elsepart])])
-        return retStr + f"\n{endif_label}:"
+        return ([Branch(self.cond, then_label, else_label), Label(then_label)]
+                + flatten([self.thenpart])
+                + [Op("jump", endif_label), Label(else_label)]
+                + flatten([self.elsepart])
+                + [Label(endif_label)])
 
 
     def initialization(self, visit_state: dict):
@@ -272,6 +751,31 @@ class IfNode(ASTNode):
                 init_var.add(var)
         visit_state["def_init"] = init_var
 
+    def type_check(self, visit_state: dict):
+        for c in flatten([self.cond]):
+            c.type_check(visit_state)
+        before = dict(visit_state["env"])
+        for t in flatten([self.thenpart]):
+            t.type_check(visit_state)
+        env_if_true = visit_state["env"]
+        visit_state["env"] = dict(before)
+        for e in flatten([self.elsepart]):
+            e.type_check(visit_state)
+        visit_state["env"] = join_envs(visit_state, env_if_true, visit_state["env"])
+
+    def fold(self):
+        """With a constant condition, only one branch remains"""
+        self.cond = self.cond.fold()
+        taken = bool_value(self.cond)
+        if taken is True:
+            return fold_block(self.thenpart)
+        if taken is False:
+            return fold_block(self.elsepart)
+        self.thenpart = fold_block(self.thenpart)
+        self.elsepart = fold_block(self.elsepart)
+        self.children = [self.cond, self.thenpart, self.elsepart]
+        return self
+
 
 class AndNode(ASTNode):
     """Boolean and, short circuit; can be evaluated for jump or for boolean value"""
@@ -280,13 +784,34 @@ class AndNode(ASTNode):
         self.right = right
         self.children = [left, right]
 
-    def c_eval(self, true_branch: str, false_branch: str) -> List[str]:
+    def c_eval(self, true_branch: str, false_branch: str) -> list:
         """Use in a conditional branch"""
         continue_label = new_label("and")
-        return ( self.left.c_eval(continue_label, false_branch)
-                 + [continue_label + ":"]
-                 + self.right.c_eval(true_branch, false_branch)
-                 )
+        return [Branch(self.left, continue_label, false_branch),
+                Label(continue_label),
+                Branch(self.right, true_branch, false_branch)]
+
+    def type_check(self, visit_state: dict) -> str:
+        self.left.type_check(visit_state)
+        self.right.type_check(visit_state)
+        self.type = "Bool"
+        return self.type
+
+    def fold(self):
+        """The left operand is always evaluated, so we keep it
+        unless it is constant
+        """
+        self.left = self.left.fold()
+        self.right = self.right.fold()
+        self.children = [self.left, self.right]
+        left = bool_value(self.left)
+        if left is False:
+            return self.left
+        if left is True:
+            return self.right
+        if bool_value(self.right) is True:
+            return self.left
+        return self
 
 
 class OrNode(ASTNode):
@@ -297,13 +822,31 @@ class OrNode(ASTNode):
         self.right = right
         self.children = [left, right]
 
-    def c_eval(self, true_branch: str, false_branch: str) -> List[str]:
+    def c_eval(self, true_branch: str, false_branch: str) -> list:
         """Use in a conditional branch"""
         continue_label = new_label("or")
-        return (self.left.c_eval(true_branch, continue_label)
-                + [continue_label + ":"]
-                + self.right.c_eval(true_branch, false_branch)
-                )
+        return [Branch(self.left, true_branch, continue_label),
+                Label(continue_label),
+                Branch(self.right, true_branch, false_branch)]
+
+    def type_check(self, visit_state: dict) -> str:
+        self.left.type_check(visit_state)
+        self.right.type_check(visit_state)
+        self.type = "Bool"
+        return self.type
+
+    def fold(self):
+        self.left = self.left.fold()
+        self.right = self.right.fold()
+        self.children = [self.left, self.right]
+        left = bool_value(self.left)
+        if left is True:
+            return self.left
+        if left is False:
+            return self.right
+        if bool_value(self.right) is False:
+            return self.left
+        return self
 
 
 class ComparisonNode(ASTNode):
@@ -312,15 +855,35 @@ class ComparisonNode(ASTNode):
     and can also return boolean values
     """
     def __init__(self, comp_op: str, left: ASTNode, right: ASTNode):
-        self.type = "Obj"
+        self.type = "Obj"     # Class of the comparison method, from type_check
+        self.target = "Obj"   # ... as named in the call
         self.comp_op = comp_op
         self.left = left
         self.right = right
         self.children = [right, left]
 
-    def c_eval(self, true_branch: str, false_branch: str) -> List[str]:
-        bool_code = self.children
-        return bool_code + [f"call {self.type}:{self.comp_op}\njump_if {true_branch}", f"jump {false_branch}"]
+    def c_eval(self, true_branch: str, false_branch: str) -> list:
+        return [self.right, self.left, Op("call", f"{self.target}:{self.comp_op}"),
+                Op("jump_if", true_branch), Op("jump", false_branch)]
+
+    def type_check(self, visit_state: dict) -> str:
+        """The comparison is a method of the left operand"""
+        self.type = self.left.type_check(visit_state)
+        self.target = qualifier(visit_state, self.type)
+        sig = method_signature(visit_state, self.type, self.comp_op)
+        check_args(visit_state, f"{self.type}:{self.comp_op}", sig["params"], [self.right])
+        return "Bool"
+
+    def fold(self):
+        self.left = self.left.fold()
+        self.right = self.right.fold()
+        self.children = [self.right, self.left]
+        left, right = int_value(self.left), int_value(self.right)
+        if left is None or right is None:
+            return self
+        if self.comp_op == "less":
+            return bool_literal(left < right)
+        return bool_literal(left == right)
 
 
 class NotNode(ASTNode):
@@ -329,50 +892,125 @@ class NotNode(ASTNode):
         self.right = right
         self.children = right
 
-    def c_eval(self, true_branch: str, false_branch: str) -> List[str]:
-        return self.right.c_eval(false_branch, true_branch)
+    def c_eval(self, true_branch: str, false_branch: str) -> list:
+        return [Branch(self.right, false_branch, true_branch)]
+
+    def type_check(self, visit_state: dict) -> str:
+        self.right.type_check(visit_state)
+        self.type = "Bool"
+        return self.type
+
+    def fold(self):
+        self.right = self.right.fold()
+        self.children = self.right
+        value = bool_value(self.right)
+        if value is not None:
+            return bool_literal(not value)
+        return self
 
 
 class NewNode(ASTNode):
-    class MethodCallNode(ASTNode):
-        '''r_exp "." ident "(" args* ")" ->method_call'''
+    '''NAME "(" args* ")" -> new'''
     def __init__(self, ident: ASTNode, args: List[ASTNode]):
         self.ident = ident
         self.args = args
         self.children = [args, ident]
 
-    def __str__(self):
-        ret = f"new {self.ident}\ncall {self.ident}:$constructor"
-        return ret
+    def gen(self) -> list:
+        # Constructor arguments go below the new object
+        return flatten([self.args]) + [Op("new", str(self.ident)), Op("call", f"{self.ident}:$constructor")]
+
+    def type_check(self, visit_state: dict) -> str:
+        self.type = str(self.ident)
+        sig = method_signature(visit_state, self.type, "$constructor")
+        check_args(visit_state, f"{self.type}()", sig["params"], flatten([self.args]))
+        return self.type
+
+    def fold(self):
+        self.args = [arg.fold() for arg in flatten([self.args])]
+        self.children = [self.args, self.ident]
+        return self
 
 ###IMPORTANT AND HARD TYPE CHECK
 class MethodCallNode(ASTNode):
     '''r_exp "." ident "(" args* ")" -> method_call'''
-    def __init__(self, ident: ASTNode, left: List[ASTNode], right: List[ASTNode]):
-        self.type = "Obj"
-        self.ident = ident
-        self.left = left
-        self.right = right
+    def __init__(self, ident: ASTNode, left: ASTNode, right: List[ASTNode]):
+        self.type = "Obj"     # Static type of the receiver, from type_check
+        self.target = "Obj"   # ... as named in the call
+        self.ident = ident    # Method name
+        self.left = left      # Receiver
+        self.right = right    # Arguments
         self.children = [left, right]
 
-    def __str__(self):
-        ret = f"{self.left}\n"
-        if self.right:
-            ret += f"{self.right}\n"
-        return ret + f"call {self.type}:{self.ident}"
+    def gen(self) -> list:
+        # Arguments in order, then the receiver
+        return flatten([self.right]) + [self.left, Op("call", f"{self.target}:{self.ident}")]
+
+    def type_check(self, visit_state: dict) -> str:
+        """Calls name the static type of the receiver, e.g. Counter:inc"""
+        self.type = self.left.type_check(visit_state)
+        self.target = qualifier(visit_state, self.type)
+        sig = method_signature(visit_state, self.type, str(self.ident))
+        check_args(visit_state, f"{self.type}:{self.ident}", sig["params"], flatten([self.right]))
+        return sig["ret"]
+
+    def fold(self):
+        self.left = self.left.fold()
+        self.right = [arg.fold() for arg in flatten([self.right])]
+        self.children = [self.left, self.right]
+        return self
 
 
 class ArithNode(ASTNode):
     """Arithmetic operations"""
     def __init__(self, op: str, left: ASTNode, right: ASTNode):
-        self.type = ''
+        self.type = ''        # Static type of the left operand, from type_check
+        self.target = ''      # ... as named in the call
         self.op = op
         self.left = left
         self.right = right
         self.children = [left, right]
 
-    def __str__(self):
-        return f"{self.right}\n{self.left}\ncall {self.type}:{self.op}"
+    def gen(self) -> list:
+        return [self.right, self.left, Op("call", f"{self.target}:{self.op}")]
+
+    def type_check(self, visit_state: dict) -> str:
+        self.type = self.left.type_check(visit_state)
+        self.target = qualifier(visit_state, self.type)
+        method = OPERATOR_METHODS[self.op]
+        sig = method_signature(visit_state, self.type, method)
+        check_args(visit_state, f"{self.type}:{self.op}", sig["params"], [self.right])
+        return sig["ret"]
+
+    def fold(self):
+        """Int arithmetic and concatenation of String literals;
+        x + 0, x - 0, x * 1, x / 1 are x when x is an Int
+        """
+        self.left = self.left.fold()
+        self.right = self.right.fold()
+        self.children = [self.left, self.right]
+        left, right = int_value(self.left), int_value(self.right)
+        if left is not None and right is not None:
+            folded = None
+            if self.op == "plus":
+                folded = int_literal(left + right)
+            elif self.op == "sub":
+                folded = int_literal(left - right)
+            elif self.op == "mult":
+                folded = int_literal(left * right)
+            elif self.op == "div" and right != 0:
+                # Truncating, as in C
+                quotient = abs(left) // abs(right)
+                folded = int_literal(quotient if (left < 0) == (right < 0) else -quotient)
+            return folded or self
+        if (self.op == "plus" and isinstance(self.left, VarNode) and isinstance(self.right, VarNode)
+                and self.left.type == "String" and self.right.type == "String"):
+            # Both are quoted, escapes and all
+            return VarNode(self.left.const[:-1] + self.right.const[1:], "String")
+        if self.type == "Int":
+            if (self.op in ("plus", "sub") and right == 0) or (self.op in ("mult", "div") and right == 1):
+                return self.left
+        return self
 
 
 
@@ -382,8 +1020,17 @@ class ArgsNode(ASTNode):
         self.right = right
         self.children = [right]
 
-    def __str__(self):
-        return str(self.right)
+    def gen(self) -> list:
+        return [self.right]
+
+    def type_check(self, visit_state: dict) -> str:
+        self.type = self.right.type_check(visit_state)
+        return self.type
+
+    def fold(self):
+        self.right = self.right.fold()
+        self.children = [self.right]
+        return self
 
 
 class NegateNode(ASTNode):
@@ -392,8 +1039,24 @@ class NegateNode(ASTNode):
         self.exps = exps
         self.children = exps
 
-    def __str__(self):
-        return f"{self.exps}\nconst 0\ncall Int:sub"
+    def gen(self) -> list:
+        return [self.exps, Op("const", "0"), Op("call", "Int:sub")]
+
+    def type_check(self, visit_state: dict) -> str:
+        operand = self.exps.type_check(visit_state)
+        if operand != "Int":
+            raise Exception(f"Cannot negate {operand}")
+        self.type = "Int"
+        return self.type
+
+    def fold(self):
+        """-5 is a literal (const -5)"""
+        self.exps = self.exps.fold()
+        self.children = self.exps
+        value = int_value(self.exps)
+        if value is not None:
+            return int_literal(-value) or self
+        return self
 
 
 class VarNode(ASTNode):
@@ -402,12 +1065,19 @@ class VarNode(ASTNode):
         self.const = var
         self.type = type
 
-    def __str__(self):
-        return f"const {self.const}"
+    def gen(self) -> list:
+        return [Op("const", str(self.const))]
+
+    def c_eval(self, true_branch: str, false_branch: str) -> list:
+        """A condition that folded to true or false"""
+        return [Op("jump", true_branch if self.const == "true" else false_branch)]
 
     def initialization(self, visit_state: List):
         return
 
+    def type_check(self, visit_state: dict) -> str:
+        return self.type
+
 
 class StoreNode(ASTNode):
     """ident   -> call_var"""
@@ -415,12 +1085,15 @@ class StoreNode(ASTNode):
         self.value = value
         self.children = [value]
 
-    def __str__(self):
-        return f"store {self.value}"
+    def gen(self) -> list:
+        return [Op("store", str(self.value))]
 
     def initialization(self, visit_state: List):
         return self.value.initialization(visit_state)
 
+    def assign_type(self, visit_state: dict, value_type: str):
+        visit_state["env"][str(self.value)] = value_type
+
 ###Maybe Init?
 class StoreFieldNode(ASTNode):
     def __init__(self,
@@ -430,8 +1103,35 @@ class StoreFieldNode(ASTNode):
         self.value = value
         self.children = [field, value]
 
-    def __str__(self):
-        return f'''{self.field}\nstore_field {self.value}'''
+    def gen(self) -> list:
+        return [self.field, Op("store_field", f"{self.target}:{self.value}")]
+
+    def assign_type(self, visit_state: dict, value_type: str):
+        """Fields that are constructor arguments keep their declared
+        types; others have the least upper bound of the types
+        assigned to them.  An inherited field belongs to the
+        superclass that has it, so its type is updated there.
+        """
+        clazz = self.field.type_check(visit_state)
+        self.target = qualifier(visit_state, clazz)
+        name = str(self.value)
+        try:
+            entry = class_entry(visit_state, field_owner(visit_state, clazz, name))
+        except Exception:
+            entry = class_entry(visit_state, clazz)
+        fields = entry["fields"]
+        if name in entry.get("declared", []):
+            if not is_subtype(visit_state, value_type, fields[name]):
+                raise Exception(f"Assigning {value_type} to field {name} declared {fields[name]}")
+        elif name in fields:
+            fields[name] = lub(visit_state, fields[name], value_type)
+        else:
+            fields[name] = value_type
+
+    def fold(self):
+        self.field = self.field.fold()
+        self.children = [self.field, self.value]
+        return self
 
 
 class LoadNode(ASTNode):
@@ -440,13 +1140,25 @@ class LoadNode(ASTNode):
         self.value = value
         self.children = [value]
 
-    def __str__(self):
-        return f"load {self.value}"
+    def gen(self) -> list:
+        if str(self.value) == "this":
+            return [Op("load", "$")]
+        return [Op("load", str(self.value))]
 
     def initialization(self, visit_state: dict):
+        if str(self.value) == "this":
+            return
         if str(self.value) not in visit_state["def_init"] and str(self.value) not in visit_state["fields"]:
             raise Exception(f"This variable is not initialized : {self.value} not present")
 
+    def type_check(self, visit_state: dict) -> str:
+        name = str(self.value)
+        if name in visit_state["env"]:
+            self.type = visit_state["env"][name]
+        else:
+            self.type = field_type(visit_state, visit_state["current_class"], name)
+        return self.type
+
 ###Maybe Init?
 class LoadFieldNode(ASTNode):
     def __init__(self,
@@ -456,8 +1168,19 @@ class LoadFieldNode(ASTNode):
         self.value = value
         self.children = [field, value]
 
-    def __str__(self):
-        return f'''{self.field}\nload_field {self.value}'''
+    def gen(self) -> list:
+        return [self.field, Op("load_field", f"{self.target}:{self.value}")]
+
+    def type_check(self, visit_state: dict) -> str:
+        clazz = self.field.type_check(visit_state)
+        self.target = qualifier(visit_state, clazz)
+        self.type = field_type(visit_state, clazz, str(self.value))
+        return self.type
+
+    def fold(self):
+        self.field = self.field.fold()
+        self.children = [self.field, self.value]
+        return self
 
 
 class VarRefNode(ASTNode):
@@ -485,6 +1208,8 @@ class ASTBuilder(Transformer):
     def clazz(self, e):
         log.debug("->clazz")
         name, formals, super, constructor, methods = e
+        if super is None:
+            super = "Obj"
         if formals is None:
             formals = []
         if methods is None:
@@ -519,15 +1244,16 @@ class ASTBuilder(Transformer):
         left, ident, right = e
         return AsmtNode(left, ident, right)
 
+    def expr_stmt(self, e):
+        return ExprStmtNode(e[0])
+
     def new(self, e):
-        return NewNode(e[0],e[1:-1])
+        return NewNode(e[0], e[1:])
 
     def method_call(self, e):
         '''r_exp "." ident "(" args* ")" ->method_call'''
-        if len(e) == 2:
-            return MethodCallNode(e[0], e[1], [])
-        else:
-            return MethodCallNode(e[0], e[1], e[2:-1])
+        receiver, ident, args = e[0], e[1], e[2:]
+        return MethodCallNode(ident, receiver, args)
 
     def args(self, e):
         value = e[0]
@@ -573,11 +1299,11 @@ class ASTBuilder(Transformer):
 
     def greater_than(self, e):
         left, right = e
-        return NotNode(AndNode(ComparisonNode("less", left, right), ComparisonNode("equals", left, right)))
+        return NotNode(OrNode(ComparisonNode("less", left, right), ComparisonNode("equals", left, right)))
 
     def less_equal(self, e):
         left, right = e
-        return AndNode(ComparisonNode("less", left, right), ComparisonNode("equals", left, right))
+        return OrNode(ComparisonNode("less", left, right), ComparisonNode("equals", left, right))
 
     def greater_equal(self, e):
         left, right = e
@@ -654,33 +1380,314 @@ def set_default(obj):
         return list(obj)
     raise TypeError
 
+
+# ----------------
+#  Building the LALR tables for the Quack grammar takes much longer
+#  than parsing a typical source file, so we keep the built parser
+#  in an on-disk cache.  The cache file name is derived from the
+#  grammar text and the Lark version, so editing quack_grammar.txt
+#  or upgrading Lark simply misses the old entry.
+#
+GRAMMAR_PATH = Path("orilib/quack_grammar.txt")
+PARSER_CACHE_DIR = Path("orilib/__parser_cache__")
+
+
+def grammar_digest(grammar: str) -> str:
+    """Content hash identifying a built parser"""
+    key = grammar + lark.__version__
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def cached_parser(grammar_path: Path = GRAMMAR_PATH,
+                  cache_dir: Optional[Path] = PARSER_CACHE_DIR) -> Lark:
+    """LALR parser for Quack, loaded from the cache when possible.
+    With cache_dir None the tables are always rebuilt.
+    """
+    grammar = grammar_path.read_text()
+    if cache_dir is None:
+        return Lark(grammar, parser='lalr', transformer=ASTBuilder())
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cache_file = cache_dir.joinpath(f"quack_grammar-{grammar_digest(grammar)[:16]}.lark")
+    log.debug(f"Parser cache file {cache_file}")
+    return Lark(grammar, parser='lalr', transformer=ASTBuilder(),
+                cache=str(cache_file))
+
+
+def gen_standalone(module_path: Path, grammar_path: Path = GRAMMAR_PATH):
+    """Write a stand-alone parser module with pre-built tables.
+    The module records the digest of the grammar it was built from,
+    so that a stale module can be detected when it is loaded.
+    """
+    from lark.tools.standalone import gen_standalone as lark_standalone
+    grammar = grammar_path.read_text()
+    parser = Lark(grammar, parser='lalr')
+    with open(module_path, "w") as out:
+        lark_standalone(parser, out=out)
+        print(f'\nGRAMMAR_DIGEST = "{grammar_digest(grammar)}"', file=out)
+    log.info(f"Wrote stand-alone parser {module_path}")
+
+
+def standalone_parser(module_path: Path, grammar_path: Path = GRAMMAR_PATH):
+    """Parser from a module written by gen_standalone, or None if
+    the module was generated from a different grammar.
+    """
+    spec = importlib.util.spec_from_file_location("quack_standalone", module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    digest = grammar_digest(grammar_path.read_text())
+    if getattr(module, "GRAMMAR_DIGEST", None) != digest:
+        log.warning(f"{module_path} is out of date with {grammar_path}")
+        return None
+    return module.Lark_StandAlone(transformer=ASTBuilder())
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        description="Compile Quack source into tiny vm assembly code. "
+                    "With no sources, read one program from stdin "
+                    "and write ./Quack.asm"
+    )
+    parser.add_argument("sources", nargs="*", type=Path,
+                        help="Quack source files, or directories of .qk files")
+    parser.add_argument("-o", "--outdir", type=Path,
+                        help="Write .asm files here instead of beside the sources")
+    parser.add_argument("--serve", action="store_true",
+                        help="Compile sources named on stdin, one request per line")
+    parser.add_argument("--socket", type=Path,
+                        help="Serve compile requests on this Unix socket")
+    parser.add_argument("--no-parser-cache", action="store_true",
+                        help="Rebuild parser tables instead of using the cache")
+    parser.add_argument("--parser-cache", type=Path, default=PARSER_CACHE_DIR,
+                        help="Directory for cached parser tables")
+    parser.add_argument("--standalone", type=Path,
+                        help="Parse with a pre-generated stand-alone parser module")
+    parser.add_argument("--gen-standalone", type=Path,
+                        help="Write a stand-alone parser module and exit")
+    parser.add_argument("--objects", type=Path,
+                        help="Write object code for each class to this directory "
+                             "(e.g., OBJ) instead of assembly code")
+    parser.add_argument("--dump-asm", action="store_true",
+                        help="With --objects, also write the assembly code")
+    parser.add_argument("--no-fold", action="store_true",
+                        help="Do not fold constant expressions")
+    parser.add_argument("--fold-stats", action="store_true",
+                        help="Report how many AST nodes constant folding eliminated")
+    return parser.parse_args()
+
+
+def build_parser(args) -> object:
+    """The parser selected by the command line; any of them
+    produces the AST directly, with ASTBuilder as embedded transformer.
+    """
+    if args.standalone:
+        parser = standalone_parser(args.standalone)
+        if parser:
+            return parser
+    if args.no_parser_cache:
+        return cached_parser(cache_dir=None)
+    return cached_parser(cache_dir=args.parser_cache)
+
+
+BUILTINS_PATH = Path("orilib/builtin_methods.json")
+
+
+class Compiler:
+    """Parser and builtin symbol table, loaded once and
+    reused for every program we compile.
+    """
+    def __init__(self, parser, builtins_path: Path = BUILTINS_PATH,
+                 fold: bool = True, fold_stats: bool = False):
+        self.parser = parser
+        self.fold = fold
+        self.fold_stats = fold_stats
+        with open(builtins_path) as builtins:
+            self.builtins = json.load(builtins)
+
+    def analyze(self, code: str) -> ASTNode:
+        """Quack source text -> AST ready for code generation"""
+        global JUMP_COUNT
+        JUMP_COUNT = 0   # Labels need only be unique within one program
+        #ultimate transformation (ASTBuilder runs inside the parser)
+        ast: ASTNode = self.parser.parse(code)
+        # initialization adds to the symbol table, so each
+        # program starts from a fresh copy of the builtins
+        symtab = copy.deepcopy(self.builtins)
+        #walk to initialize and type check
+        ast.initialization(symtab)
+        ast.type_check(symtab)
+        if self.fold:
+            before = ast.size()
+            ast.fold()
+            if self.fold_stats:
+                log.info(f"Constant folding eliminated {before - ast.size()} of {before} AST nodes")
+        return ast
+
+    def compile(self, code: str) -> str:
+        """Quack source text -> assembly code text"""
+        return str(self.analyze(code))
+
+    def compile_file(self, source: Path, target: Path) -> Path:
+        """Compile source file to target .asm file, writing the
+        code as it is generated
+        """
+        ast = self.analyze(source.read_text())
+        with open(target, "w") as out:
+            emit(ast, out)
+        return target
+
+    def compile_to_objects(self, code: str, optimize: bool = False,
+                           dump: Optional[Path] = None) -> list:
+        """Quack source text -> an assembler ObjectCode for each
+        class, without going through assembly code.  The assembly
+        code can still be written to dump, for debugging.
+        """
+        ast = self.analyze(code)
+        if dump:
+            with open(dump, "w") as out:
+                emit(ast, out)
+        return emit_objects(ast, optimize)
+
+
+def write_objects(objects: list, lib: Path) -> List[Path]:
+    """Write ObjectCode from compile_to_objects to lib as JSON files"""
+    import assemble
+    import objfile
+    lib.mkdir(parents=True, exist_ok=True)
+    targets = []
+    for code in objects:
+        target = lib.joinpath(code.class_name + objfile.JSON_SUFFIX)
+        assemble.remove_other_format(target, binary=False)
+        with open(target, "wb") as f:
+            objfile.write(code.struct(), f)
+        targets.append(target)
+    return targets
+
+
+def asm_target(source: Path, outdir: Optional[Path]) -> Path:
+    """Where the assembly code for source should go"""
+    if outdir:
+        return outdir.joinpath(source.name).with_suffix(".asm")
+    return source.with_suffix(".asm")
+
+
+def expand_sources(sources: List[Path]) -> List[Path]:
+    """Source files named directly or found in named directories"""
+    files = []
+    for src in sources:
+        if src.is_dir():
+            files += sorted(src.glob("*.qk"))
+        else:
+            files.append(src)
+    return files
+
+
+def compile_many(compiler: Compiler, sources: List[Path],
+                 outdir: Optional[Path], objects: Optional[Path] = None,
+                 dump_asm: bool = False) -> bool:
+    """Compile each source to its own .asm file, or with objects,
+    to object code files in that directory.
+    Errors in one source do not prevent compiling the others.
+    """
+    ok = True
+    if outdir:
+        outdir.mkdir(parents=True, exist_ok=True)
+    for src in expand_sources(sources):
+        try:
+            if objects:
+                dump = asm_target(src, outdir) if dump_asm else None
+                targets = write_objects(compiler.compile_to_objects(src.read_text(), dump=dump), objects)
+                log.info(f"Compiled {src} -> {', '.join(str(t) for t in targets)}")
+                continue
+            target = compiler.compile_file(src, asm_target(src, outdir))
+            log.info(f"Compiled {src} -> {target}")
+        except Exception as e:
+            log.error(f"Failed to compile {src}: {e}")
+            ok = False
+    return ok
+
+
+def serve_request(compiler: Compiler, request: str,
+                  outdir: Optional[Path]) -> str:
+    """One line of the server protocol.
+    Request is 'source [target]'; reply is 'ok target'
+    or 'error source: message'.
+    """
+    parts = request.split()
+    if not parts or len(parts) > 2:
+        return f"error {request}: expected 'source [target]'"
+    source = Path(parts[0])
+    if len(parts) == 2:
+        target = Path(parts[1])
+    else:
+        target = asm_target(source, outdir)
+    try:
+        compiler.compile_file(source, target)
+    except Exception as e:
+        return f"error {source}: {e}"
+    return f"ok {target}"
+
+
+def serve_stdin(compiler: Compiler, outdir: Optional[Path]):
+    """Line protocol on stdin/stdout, e.g., for an editor integration"""
+    for line in sys.stdin:
+        if line.strip():
+            print(serve_request(compiler, line.strip(), outdir), flush=True)
+
+
+def serve_socket(compiler: Compiler, path: Path, outdir: Optional[Path]):
+    """Same line protocol, for any number of clients on a Unix socket"""
+    import socketserver
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                request = line.decode("utf-8").strip()
+                if request:
+                    reply = serve_request(compiler, request, outdir)
+                    self.wfile.write(f"{reply}\n".encode("utf-8"))
+
+    if path.exists():
+        path.unlink()
+    with socketserver.UnixStreamServer(str(path), Handler) as server:
+        log.info(f"Serving compile requests on {path}")
+        server.serve_forever()
+
+
 def main():
-    quack_parser = Lark(open("orilib/quack_grammar.txt"), parser='lalr')
-    quack = quack_parser.parse
-    code = sys.stdin.read()
-    tree = quack(code)
-    #print(tree.pretty())
-
-    #ultimate transformation
-    ast: ASTNode = ASTBuilder().transform(tree)
+    args = cli()
+    if args.gen_standalone:
+        gen_standalone(args.gen_standalone)
+        return
+    if args.serve or not (args.socket or args.sources):
+        # stdout carries the protocol or the assembly code;
+        # keep log messages out of it
+        logging.getLogger().handlers[0].setStream(sys.stderr)
     #thank you, Pranav
-    builtins = open("orilib/builtin_methods.json")
-    symtab = json.load(builtins)
-    #walk to initialize and type check
-    ast.initialization(symtab)
-    print(ast)
-    json.dumps(symtab,indent=4, default=set_default)
-
-    f = open("./Quack.asm", "w")
-    f.write(str(ast))
-    f.close()
+    compiler = Compiler(build_parser(args), fold=not args.no_fold,
+                        fold_stats=args.fold_stats)
+    if args.serve:
+        serve_stdin(compiler, args.outdir)
+    elif args.socket:
+        serve_socket(compiler, args.socket, args.outdir)
+    elif args.sources:
+        if not compile_many(compiler, args.sources, args.outdir,
+                            args.objects, args.dump_asm):
+            sys.exit(1)
+    elif args.objects:
+        dump = Path("./Quack.asm") if args.dump_asm else None
+        objects = compiler.compile_to_objects(sys.stdin.read(), dump=dump)
+        for target in write_objects(objects, args.objects):
+            log.info(f"Wrote {target}")
+    else:
+        asm = compiler.compile(sys.stdin.read())
+        print(asm)
+        f = open("./Quack.asm", "w")
+        f.write(asm)
+        f.close()
 
     #os.system('python assemble.py Quack.asm OBJ/Quack.json')
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 1:
-        print("Need more argument")
-        sys.exit(1)
     main()
     #os.system('./bin/tiny_vm Quack')
\ No newline at end of file
@@ -39,6 +39,7 @@ void pop_log_level() {
 }
 
 
+#ifndef VM_RELEASE
 void log_debug(const char *fmt, ...) {
     if (LOGGING > DEBUG) return;
     va_list args;
@@ -47,6 +48,7 @@ void log_debug(const char *fmt, ...) {
     vfprintf(stderr, fmt, args);
     fprintf(stderr, "\n");
 }
+#endif
 
 void log_info(const char *fmt, ...) {
     if (LOGGING > INFO) return;
@@ -13,7 +13,14 @@ extern void set_log_level(enum LOG_LEVEL level);
 extern void push_log_level(enum LOG_LEVEL level);
 extern void pop_log_level(void);
 
+/* Release builds (VM_RELEASE) compile out debug logging
+ * entirely, including evaluation of its arguments.
+ */
+#ifdef VM_RELEASE
+#define log_debug(...) ((void) 0)
+#else
 extern void log_debug(const char *fmt, ...);
+#endif
 extern void log_info(const char *fmt, ...);
 extern void log_warn(const char *fmt, ...);
 extern void log_error(const char *fmt, ...);
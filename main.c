@@ -1,12 +1,32 @@
 #include <stdio.h>
+#include <stdlib.h>
 #include <string.h>
 #include <assert.h>
 #include <unistd.h>
+#include <time.h>
+#include <fcntl.h>
 #include "vm_state.h"
 #include "vm_loader.h"
+#include "vm_gc.h"
+#include "builtins.h"
+#include "vm_icache.h"
+#include "vm_output.h"
 #include "logger.h"
 
 #define PATHBUFSIZE 1000
+
+/* Heap or stack size like 512K, 64M, or 1G; 0 if malformed */
+static size_t parse_size(char *s) {
+    char *suffix;
+    unsigned long n = strtoul(s, &suffix, 10);
+    switch (*suffix) {
+        case 'G': case 'g': n *= 1024;  // Fall through
+        case 'M': case 'm': n *= 1024;  // Fall through
+        case 'K': case 'k': n *= 1024; ++suffix;
+    }
+    return *suffix ? 0 : n;
+}
+
 int main(int argc, char *argv[]) {
     set_log_level(INFO);
     log_info("This is the tiny VM\n");
@@ -15,17 +35,62 @@ int main(int argc, char *argv[]) {
     char load_path[PATHBUFSIZE];
     int ok = 1;
     char *load_library = "./OBJ";
-    while ((opt = getopt(argc, argv, ":DL:")) != -1) {
+    int stats = 0;
+    int call_sites = 0;
+    size_t heap_size = GC_DEFAULT_HEAP_SIZE;
+    size_t stack_size = FRAME_DEFAULT_WORDS * sizeof(vm_Word);
+    int output_fd = STDOUT_FILENO;
+    size_t output_buffer = OUTPUT_DEFAULT_BUFFER;
+    char *end;
+    while ((opt = getopt(argc, argv, ":DSIL:H:F:o:B:")) != -1) {
         switch (opt) {
             case 'L':
                 load_library = optarg;
                 fprintf(stderr, "Look in '%s' for object modules\n", optarg);
                 break;
             case 'D':
+#ifdef VM_RELEASE
+                fprintf(stderr, "Debug logging is not available in a release build\n");
+#endif
                 fprintf(stderr, "Noisy debugging selected with -%c\n", opt);
                 set_log_level(DEBUG);
                 vm_logging = DEBUG;
                 break;
+            case 'S':
+                stats = 1;
+                break;
+            case 'I':
+                call_sites = 1;
+                break;
+            case 'H':
+                heap_size = parse_size(optarg);
+                if (heap_size == 0) {
+                    fprintf(stderr, "Bad heap size '%s' (use e.g. 512K or 64M)\n", optarg);
+                    ok = 0;
+                }
+                break;
+            case 'F':
+                stack_size = parse_size(optarg);
+                if (stack_size == 0) {
+                    fprintf(stderr, "Bad frame stack size '%s' (use e.g. 1M or 256M)\n", optarg);
+                    ok = 0;
+                }
+                break;
+            case 'o':
+                output_fd = (int) strtol(optarg, &end, 10);
+                if (*end || end == optarg || fcntl(output_fd, F_GETFD) == -1) {
+                    fprintf(stderr, "Bad output file descriptor '%s' (use e.g. 3 "
+                            "with 3>out.txt)\n", optarg);
+                    ok = 0;
+                }
+                break;
+            case 'B':
+                output_buffer = parse_size(optarg);
+                if (output_buffer == 0) {
+                    fprintf(stderr, "Bad output buffer size '%s' (use e.g. 4K or 1M)\n", optarg);
+                    ok = 0;
+                }
+                break;
             case ':':
                 fprintf(stderr, "Option %s requires a value\n", optarg);
                 ok = 0;
@@ -37,8 +102,13 @@ int main(int argc, char *argv[]) {
         }
     }
     log_debug("Finished options, load library is %s\n", load_library);
+    struct timespec load_start, start, finish;
+    clock_gettime(CLOCK_MONOTONIC, &load_start);
     if (ok && optind < argc) {
         log_debug("There is at least one non-option argument\n");
+        vm_frame_init(stack_size / sizeof(vm_Word));
+        vm_gc_init(heap_size);
+        vm_output_init(output_fd, output_buffer);
         vm_loader_init(load_library);
         for (; ok && optind < argc; ++optind) {
             log_debug("Processing command line argument %d\n", optind);
@@ -49,8 +119,31 @@ int main(int argc, char *argv[]) {
     }
     if (ok) {
         log_info("Executing %s\n", main_class);
+        clock_gettime(CLOCK_MONOTONIC, &start);
         vm_run();
+        clock_gettime(CLOCK_MONOTONIC, &finish);
         log_info("Ran");
+        if (stats) {
+            double load_seconds = (start.tv_sec - load_start.tv_sec)
+                    + (start.tv_nsec - load_start.tv_nsec) / 1e9;
+            fprintf(stderr, "Loaded %d classes (%zu code words in %d segments) "
+                    "in %.6f seconds\n",
+                    vm_loader_stats.classes, vm_loader_stats.code_words,
+                    vm_loader_stats.code_segments, load_seconds);
+            double seconds = (finish.tv_sec - start.tv_sec)
+                    + (finish.tv_nsec - start.tv_nsec) / 1e9;
+            fprintf(stderr, "%ld instructions in %.6f seconds (%.0f per second)\n",
+                    vm_instr_count, seconds,
+                    seconds > 0 ? vm_instr_count / seconds : 0.0);
+            vm_gc_report();
+            fprintf(stderr, "Output: %zu bytes in %ld writes\n",
+                    vm_output_stats.bytes, vm_output_stats.writes);
+            fprintf(stderr, "Int results: %ld shared (cached), %ld allocated\n",
+                    n_ints_cached, n_ints_allocated);
+        }
+        if (call_sites) {
+            vm_ic_report();
+        }
     } else {
         fprintf(stderr, "Errors, will not run\n");
     }
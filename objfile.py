@@ -0,0 +1,197 @@
+"""Reading and writing tiny vm object code files.
+
+Object code comes in two formats with the same contents:
+JSON (the original format, easy to read and debug) and a
+compact binary format that the VM loader can use without
+parsing text.  Either way, the contents are a dict like the
+one ObjectCode.struct() builds in the assembler:
+
+    class_name, super:  names
+    methods, fields, imports:  lists of names
+    n_fields, n_methods, n_inherited:  counts
+    constants:  list of {"kind": "i" or "s", "value": text}
+    code:  list of {"name": method, "slot": n, "code": [int, ...]}
+
+The binary format is a sequence of 32 bit little-endian signed
+integers ("words"), in this order:
+
+    magic                 b"TVMO"
+    version               BINARY_VERSION
+    string table          count, then each string as its length in
+                          bytes followed by its UTF-8 bytes, a zero
+                          byte, and padding to a word boundary
+    class_name, super     string table indexes
+    n_fields, n_methods, n_inherited
+    methods, fields, imports
+                          each a count followed by string indexes
+    constants             count, then (kind, value) string index pairs
+    code                  count, then for each method its name
+                          (string index), slot, length, and code words
+
+Strings are zero-terminated so that the loader can use them in
+place in a memory-mapped file.  This layout MUST match the
+reader in vm_loader.c.
+"""
+
+import io
+import json
+import struct
+from pathlib import Path
+from typing import BinaryIO, Dict, List
+
+BINARY_MAGIC = b"TVMO"
+BINARY_VERSION = 1
+BINARY_SUFFIX = ".tvm"
+JSON_SUFFIX = ".json"
+
+
+class ObjectFileError(Exception):
+    """Malformed or unsupported object code file"""
+    pass
+
+
+class StringTable:
+    """Distinct strings, numbered in order of first use"""
+    def __init__(self):
+        self.strings: List[str] = []
+        self.index: Dict[str, int] = {}
+
+    def ref(self, s: str) -> int:
+        if s not in self.index:
+            self.index[s] = len(self.strings)
+            self.strings.append(s)
+        return self.index[s]
+
+
+def _words(values: List[int]) -> bytes:
+    return struct.pack(f"<{len(values)}i", *values)
+
+
+def _string_bytes(s: str) -> bytes:
+    encoded = s.encode("utf-8")
+    padding = 4 - len(encoded) % 4   # At least one zero byte
+    return _words([len(encoded)]) + encoded + bytes(padding)
+
+
+def to_binary(module: dict) -> bytes:
+    """Encode object code in the binary format"""
+    strings = StringTable()
+    body: List[int] = []
+
+    def names(items: List[str]):
+        body.append(len(items))
+        body.extend(strings.ref(item) for item in items)
+
+    body.append(strings.ref(module["class_name"]))
+    body.append(strings.ref(module["super"]))
+    body.extend([module["n_fields"], module["n_methods"], module["n_inherited"]])
+    names(module["methods"])
+    names(module["fields"])
+    names(module["imports"])
+    body.append(len(module["constants"]))
+    for constant in module["constants"]:
+        body.append(strings.ref(constant["kind"]))
+        body.append(strings.ref(str(constant["value"])))
+    body.append(len(module["code"]))
+    for method in module["code"]:
+        body.extend([strings.ref(method["name"]), method["slot"],
+                     len(method["code"])])
+        body.extend(method["code"])
+    header = BINARY_MAGIC + _words([BINARY_VERSION, len(strings.strings)])
+    table = b"".join(_string_bytes(s) for s in strings.strings)
+    return header + table + _words(body)
+
+
+class _Reader:
+    """Cursor over the words of a binary object file"""
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def word(self) -> int:
+        if self.pos + 4 > len(self.data):
+            raise ObjectFileError("Object file is truncated")
+        (value,) = struct.unpack_from("<i", self.data, self.pos)
+        self.pos += 4
+        return value
+
+    def words(self, n: int) -> List[int]:
+        if n < 0 or self.pos + 4 * n > len(self.data):
+            raise ObjectFileError("Object file is truncated")
+        values = list(struct.unpack_from(f"<{n}i", self.data, self.pos))
+        self.pos += 4 * n
+        return values
+
+    def string(self) -> str:
+        length = self.word()
+        text = self.data[self.pos:self.pos + length].decode("utf-8")
+        self.pos += length + 4 - length % 4
+        return text
+
+
+def from_binary(data: bytes) -> dict:
+    """Decode object code in the binary format"""
+    if data[:4] != BINARY_MAGIC:
+        raise ObjectFileError("Not a binary object file")
+    reader = _Reader(data)
+    reader.pos = 4
+    version = reader.word()
+    if version != BINARY_VERSION:
+        raise ObjectFileError(f"Unsupported object file version {version}")
+    strings = [reader.string() for _ in range(reader.word())]
+
+    def names() -> List[str]:
+        return [strings[i] for i in reader.words(reader.word())]
+
+    module = {"class_name": strings[reader.word()],
+              "super": strings[reader.word()]}
+    module["n_fields"], module["n_methods"], module["n_inherited"] = reader.words(3)
+    module["methods"] = names()
+    module["fields"] = names()
+    module["imports"] = names()
+    constants = []
+    for _ in range(reader.word()):
+        kind, value = reader.words(2)
+        constants.append({"kind": strings[kind], "value": strings[value]})
+    module["constants"] = constants
+    code = []
+    for _ in range(reader.word()):
+        name, slot, length = reader.words(3)
+        code.append({"name": strings[name], "slot": slot,
+                     "code": reader.words(length)})
+    module["code"] = code
+    return module
+
+
+def write(module: dict, f: BinaryIO, binary: bool = False):
+    """Write object code to a file opened in binary mode"""
+    if binary:
+        f.write(to_binary(module))
+    else:
+        # Written as it is encoded, not built up as one string first
+        text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+        json.dump(module, text, indent=4)
+        text.write("\n")
+        text.detach()   # Flushes, but leaves f open
+
+
+def load(path: Path) -> dict:
+    """Read object code in either format.
+    (Stub modules for built-in classes contain only
+    class_name, super, methods, and fields.)
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] == BINARY_MAGIC:
+        return from_binary(data)
+    return json.loads(data)
+
+
+def find(directory: Path, class_name: str) -> Path:
+    """Object file for class_name in directory, preferring the
+    binary format (like the VM loader) when both exist.
+    """
+    binary = directory.joinpath(class_name + BINARY_SUFFIX)
+    if binary.exists():
+        return binary
+    return directory.joinpath(class_name + JSON_SUFFIX)
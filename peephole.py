@@ -0,0 +1,230 @@
+"""Peephole optimization of assembly code, one method at a time.
+
+The assembler buffers the instructions of each method as a list in
+which a bare label (str) marks the address of the next instruction,
+and instructions are assembler Instruction objects with symbolic
+operands (label names, variable names).  optimize() rewrites that
+list before it is encoded and jumps are resolved.
+
+The code from compile.py is naive in predictable ways, e.g.,
+
+    jump_if else_2        jump_if then_4
+    jump then_1           jump else_5
+    then_1:               then_4:
+
+and a "const nothing / return" tail after explicit returns.  We
+repeat these rewrites until none applies:
+
+    - Jump threading:  a jump to a label on an unconditional
+      jump goes directly to that jump's target.
+    - Branch inversion:  "jump_if X; jump Y; X:" becomes
+      "jump_ifnot Y; X:" (and likewise for jump_ifnot).
+    - Jumps to the next instruction are removed.
+    - Labels no jump refers to are removed, and code after an
+      unconditional jump, return, or halt is removed up to the
+      next label.
+    - "load x; store x" is removed, as is "store x; load x" when
+      that load is the only load of x in the method.
+
+Afterward, select_superinstructions() replaces sequences of
+instructions with the superinstructions declared in opdefs.txt.
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+# The assembler's Instruction, or a label
+Item = Union[str, "Instruction"]
+
+JUMPS = ["jump", "jump_if", "jump_ifnot"]
+INVERSE = {"jump_if": "jump_ifnot", "jump_ifnot": "jump_if"}
+# Control never falls through to the next instruction
+UNCONDITIONAL = ["jump", "return", "halt"]
+
+
+def is_label(item: Item) -> bool:
+    return isinstance(item, str)
+
+
+def op_name(item: Item) -> Optional[str]:
+    """Operation name of an instruction, None for a label"""
+    if is_label(item):
+        return None
+    return item.operation.name
+
+
+def split_labels(items: List[Item]) -> List[Item]:
+    """Move labels of labeled instructions to bare labels,
+    so that each rewrite need consider only one kind.
+    """
+    result: List[Item] = []
+    for item in items:
+        if not is_label(item) and item.label:
+            result.append(item.label)
+            item.label = None
+        result.append(item)
+    return result
+
+
+def next_instruction(items: List[Item], pos: int) -> int:
+    """Position of the first instruction at or after pos,
+    skipping labels; len(items) if there is none.
+    """
+    while pos < len(items) and is_label(items[pos]):
+        pos += 1
+    return pos
+
+
+def thread_jumps(items: List[Item]) -> bool:
+    """Retarget jumps to labels that are on unconditional jumps"""
+    # label -> where a jump to it really goes
+    destination: Dict[str, str] = {}
+    for pos, item in enumerate(items):
+        if is_label(item):
+            target = next_instruction(items, pos)
+            if target < len(items) and op_name(items[target]) == "jump":
+                destination[item] = items[target].operand
+    changed = False
+    for item in items:
+        if op_name(item) in JUMPS:
+            target = item.operand
+            seen = {target}
+            # Follow the chain, stopping at a cycle (an infinite loop)
+            while target in destination and destination[target] not in seen:
+                target = destination[target]
+                seen.add(target)
+            if target != item.operand:
+                item.operand = target
+                changed = True
+    return changed
+
+
+def labels_before(items: List[Item], pos: int) -> List[str]:
+    """Labels between the instruction at pos and the one after it"""
+    labels = []
+    pos += 1
+    while pos < len(items) and is_label(items[pos]):
+        labels.append(items[pos])
+        pos += 1
+    return labels
+
+
+def invert_branches(items: List[Item], make: Callable) -> bool:
+    """jump_if X; jump Y; X:  =>  jump_ifnot Y; X:"""
+    changed = False
+    pos = 0
+    while pos + 2 < len(items):
+        branch, jump = items[pos], items[pos + 1]
+        if (op_name(branch) in INVERSE and op_name(jump) == "jump"
+                and branch.operand in labels_before(items, pos + 1)):
+            items[pos:pos + 2] = [make(INVERSE[branch.operation.name],
+                                       jump.operand)]
+            changed = True
+        pos += 1
+    return changed
+
+
+def remove_jumps_to_next(items: List[Item], make: Callable) -> bool:
+    changed = False
+    pos = 0
+    while pos < len(items):
+        item = items[pos]
+        if op_name(item) in JUMPS and item.operand in labels_before(items, pos):
+            if item.operation.name == "jump":
+                del items[pos]
+            else:
+                # The condition must still be popped
+                items[pos] = make("pop", None)
+            changed = True
+            continue
+        pos += 1
+    return changed
+
+
+def remove_dead_code(items: List[Item]) -> bool:
+    """Drop unreferenced labels, then unreachable instructions"""
+    referenced = {item.operand for item in items if op_name(item) in JUMPS}
+    changed = False
+    live: List[Item] = []
+    reachable = True
+    for item in items:
+        if is_label(item):
+            if item in referenced:
+                live.append(item)
+                reachable = True
+            else:
+                changed = True
+            continue
+        if not reachable:
+            changed = True
+            continue
+        live.append(item)
+        if op_name(item) in UNCONDITIONAL:
+            reachable = False
+    items[:] = live
+    return changed
+
+
+def remove_store_load(items: List[Item]) -> bool:
+    """load x; store x  and  store x; load x (x not loaded elsewhere)"""
+    loads: Dict[str, int] = {}
+    for item in items:
+        if op_name(item) == "load":
+            loads[item.operand] = loads.get(item.operand, 0) + 1
+    changed = False
+    pos = 0
+    while pos + 1 < len(items):
+        first, second = items[pos], items[pos + 1]
+        names = (op_name(first), op_name(second))
+        if (names in [("load", "store"), ("store", "load")]
+                and first.operand == second.operand
+                and (names[0] == "load" or loads[first.operand] == 1)):
+            del items[pos:pos + 2]
+            loads[first.operand] -= 1
+            changed = True
+            continue
+        pos += 1
+    return changed
+
+
+def count_instructions(items: List[Item]) -> int:
+    return sum(1 for item in items if not is_label(item))
+
+
+def optimize(items: List[Item], make: Callable) -> List[Item]:
+    """Optimized copy of a method's code.  make(opname, operand)
+    builds a new unlabeled instruction.
+    """
+    items = split_labels(items)
+    changed = True
+    while changed:
+        changed = thread_jumps(items)
+        changed = invert_branches(items, make) or changed
+        changed = remove_jumps_to_next(items, make) or changed
+        changed = remove_dead_code(items) or changed
+        changed = remove_store_load(items) or changed
+    return items
+
+
+def select_superinstructions(items: List[Item], fusions: Dict[Tuple[str, ...], object],
+                             make: Callable) -> List[Item]:
+    """Replace runs of instructions (with no label between them,
+    since a jump must land on a whole instruction) by the longest
+    matching superinstruction in fusions, which maps operation
+    names to a superinstruction definition.  make(definition,
+    instructions) builds the superinstruction.
+    """
+    longest = max((len(names) for names in fusions), default=0)
+    result: List[Item] = []
+    pos = 0
+    while pos < len(items):
+        for length in range(min(longest, len(items) - pos), 1, -1):
+            run = items[pos:pos + length]
+            names = tuple(op_name(item) for item in run)
+            if names in fusions:
+                result.append(make(fusions[names], run))
+                pos += length
+                break
+        else:
+            result.append(items[pos])
+            pos += 1
+    return result
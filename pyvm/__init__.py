@@ -0,0 +1,28 @@
+"""Pure-Python interpreter for tiny vm object code.
+
+A reference implementation of bin/tiny_vm for differential testing
+and quick experiments:  it loads the same object files (JSON or
+binary) and runs them the same way, without building the C vm.
+Run it like the C vm, from a directory with an OBJ library:
+
+    python3 path/to/pyvm Looper
+
+Since the built-in classes are module-level singletons, there
+should be one Machine at a time in a process.
+"""
+from pathlib import Path
+
+from pyvm.machine import Machine, VMError
+from pyvm.loader import Loader
+
+
+def run(class_names: list, lib: Path = Path("OBJ"), output=None,
+        flush=None) -> Machine:
+    """Load classes and run the last as the main class"""
+    vm = Machine() if output is None else Machine(output, flush or (lambda: None))
+    loader = Loader(vm, lib)
+    for class_name in class_names:
+        main_class = loader.ensure_loaded(class_name)
+    vm.set_main(main_class)
+    vm.run()
+    return vm
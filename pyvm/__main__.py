@@ -0,0 +1,54 @@
+"""Command line like bin/tiny_vm:  pyvm [-L lib] [-o fd] Class ..."""
+import argparse
+import logging
+import os
+import sys
+from pathlib import Path
+
+# Run as "python3 path/to/pyvm", the package's parent
+# (which also holds objfile.py and opdefs.txt) is not on the path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pyvm    # noqa: E402
+
+logging.basicConfig()
+
+
+def cli() -> object:
+    parser = argparse.ArgumentParser(
+        prog="pyvm", description="Run tiny vm object code in Python")
+    parser.add_argument("classes", nargs="+",
+                        help="Classes to load; the last is the main class")
+    parser.add_argument("-L", dest="lib", default="./OBJ",
+                        help="Look here for object modules")
+    parser.add_argument("-D", dest="debug", action="store_true",
+                        help="Log class loading")
+    parser.add_argument("-H", dest="heap_size",
+                        help="Heap size (accepted for compatibility with "
+                             "tiny_vm; Python manages memory itself)")
+    parser.add_argument("-o", dest="output_fd", type=int,
+                        help="Write program output to this file descriptor")
+    parser.add_argument("-B", dest="output_buffer",
+                        help="Output buffer size (accepted for compatibility "
+                             "with tiny_vm)")
+    return parser.parse_args()
+
+
+def main():
+    args = cli()
+    if args.debug:
+        logging.getLogger("pyvm").setLevel(logging.INFO)
+    output = sys.stdout
+    if args.output_fd is not None:
+        output = os.fdopen(args.output_fd, "w")
+    try:
+        pyvm.run(args.classes, Path(args.lib), output.write, output.flush)
+    except pyvm.VMError as e:
+        output.flush()
+        print(f"pyvm: {e}", file=sys.stderr)
+        sys.exit(1)
+    output.flush()
+
+
+if __name__ == "__main__":
+    main()
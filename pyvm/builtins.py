@@ -0,0 +1,465 @@
+"""The built-in classes Obj, String, Bool, Nothing, Int, List, Dict, and
+StringBuilder.
+
+As in builtins.c, each built-in method is a short sequence of vm
+code, usually a trampoline to a native (Python) function.  A native
+function receives the machine and the frame pointer; "this" is at
+stack[fp] and the arguments below it.  The order of each vtable must
+match the stub modules in OBJ/ that the assembler reads.
+"""
+from pyvm.machine import (Machine, VMClass, VMError, VMObject,
+                          CALL, CALL_NATIVE, LOAD, RETURN,
+                          OBJ, STRING, BOOL, INT, NOTHING_CLASS, LIST, DICT,
+                          STRING_BUILDER,
+                          NOTHING, TRUE, FALSE)
+
+
+def assert_is_type(thing: VMObject, expected: VMClass):
+    if not thing.clazz.is_subclass(expected):
+        raise VMError(f"Type check failure: {thing.clazz.name} "
+                      f"is not subclass of {expected.name}")
+
+
+def this_and_other(vm: Machine, fp: int, clazz: VMClass):
+    this = vm.stack[fp]
+    other = vm.stack[fp - 1]
+    assert_is_type(this, clazz)
+    assert_is_type(other, clazz)
+    return this, other
+
+
+def new_string(text: str) -> VMObject:
+    return VMObject(STRING, text)
+
+
+def new_int(n: int) -> VMObject:
+    # Int values are C ints, which wrap around at 32 bits
+    return VMObject(INT, (n + 0x80000000) % 0x100000000 - 0x80000000)
+
+
+def boolean(b: bool) -> VMObject:
+    return TRUE if b else FALSE
+
+
+def trampoline(native, arity: int) -> list:
+    return [(CALL_NATIVE, native), (RETURN, arity)]
+
+
+def native_tbd(vm: Machine, fp: int) -> VMObject:
+    vm.write(f"Unimplemented method on {vm.stack[fp].clazz.name}\n")
+    return NOTHING
+
+
+# Obj
+
+def native_Obj_string(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    return new_string(f"<Object at 0x{id(this):#x}>")
+
+
+def native_Obj_equals(vm: Machine, fp: int) -> VMObject:
+    this, other = this_and_other(vm, fp, OBJ)
+    return boolean(this is other)
+
+
+# String
+
+def native_String_constructor(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, STRING)
+    this.value = ""
+    return this
+
+
+def native_String_print(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, STRING)
+    vm.write(this.value)
+    return NOTHING
+
+
+def native_String_equals(vm: Machine, fp: int) -> VMObject:
+    this, other = this_and_other(vm, fp, STRING)
+    return boolean(this.value == other.value)
+
+
+def native_String_plus(vm: Machine, fp: int) -> VMObject:
+    this, other = this_and_other(vm, fp, STRING)
+    return new_string(this.value + other.value)
+
+
+def native_String_hash(vm: Machine, fp: int) -> VMObject:
+    # FNV-1a of the bytes of the text, as in builtins.c
+    this = vm.stack[fp]
+    assert_is_type(this, STRING)
+    h = 2166136261
+    for byte in this.value.encode():
+        h = ((h ^ byte) * 16777619) & 0xFFFFFFFF
+    return new_int(h)
+
+
+def native_String_flush(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, STRING)
+    vm.write(this.value)
+    vm.flush()
+    return NOTHING
+
+
+# Bool and Nothing have only their singleton instances
+
+def native_Boolean_constructor(vm: Machine, fp: int) -> VMObject:
+    return FALSE
+
+
+def native_Boolean_string(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    if this is TRUE:
+        return new_string("true")
+    if this is FALSE:
+        return new_string("false")
+    return new_string("!!!BOGUS BOOLEAN")
+
+
+def native_Nothing_constructor(vm: Machine, fp: int) -> VMObject:
+    return NOTHING
+
+
+def native_Nothing_string(vm: Machine, fp: int) -> VMObject:
+    return new_string("nothing")
+
+
+# Int
+
+def native_Int_constructor(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, INT)
+    this.value = 0
+    return this
+
+
+def native_Int_string(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, INT)
+    return new_string(str(this.value))
+
+
+def native_Int_equals(vm: Machine, fp: int) -> VMObject:
+    this, other = this_and_other(vm, fp, INT)
+    return boolean(this.value == other.value)
+
+
+def native_Int_less(vm: Machine, fp: int) -> VMObject:
+    this, other = this_and_other(vm, fp, INT)
+    return boolean(this.value < other.value)
+
+
+def native_Int_plus(vm: Machine, fp: int) -> VMObject:
+    this, other = this_and_other(vm, fp, INT)
+    return new_int(this.value + other.value)
+
+
+def native_Int_sub(vm: Machine, fp: int) -> VMObject:
+    this, other = this_and_other(vm, fp, INT)
+    return new_int(this.value - other.value)
+
+
+def native_Int_mult(vm: Machine, fp: int) -> VMObject:
+    this, other = this_and_other(vm, fp, INT)
+    return new_int(this.value * other.value)
+
+
+def native_Int_div(vm: Machine, fp: int) -> VMObject:
+    this, other = this_and_other(vm, fp, INT)
+    if other.value == 0:
+        raise VMError("Integer division by zero")
+    # C division truncates toward zero
+    quotient = abs(this.value) // abs(other.value)
+    if (this.value < 0) != (other.value < 0):
+        quotient = -quotient
+    return new_int(quotient)
+
+
+def native_Int_hash(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, INT)
+    return new_int(this.value)
+
+
+# List:  the hidden value is a Python list of elements
+
+def list_index(this: VMObject, arg: VMObject, limit: int) -> int:
+    """Value of an Int argument that must be an index 0..limit"""
+    if arg.clazz is not INT:
+        raise VMError(f"List index must be an Int, not {arg.clazz.name}")
+    if not 0 <= arg.value <= limit:
+        raise VMError(f"Index {arg.value} out of range for List of length {len(this.value)}")
+    return arg.value
+
+
+def element_text(item: VMObject) -> str:
+    """As in builtins.c, elements of other classes show only the class"""
+    if item.clazz is INT or item.clazz is STRING:
+        return str(item.value)
+    if item is TRUE:
+        return "true"
+    if item is FALSE:
+        return "false"
+    if item is NOTHING:
+        return "nothing"
+    return f"<{item.clazz.name}>"
+
+
+def native_List_constructor(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, LIST)
+    this.value = []
+    return this
+
+
+def native_List_string(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, LIST)
+    return new_string("[" + ", ".join(element_text(item) for item in this.value) + "]")
+
+
+def native_List_length(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, LIST)
+    return new_int(len(this.value))
+
+
+def native_List_get(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, LIST)
+    return this.value[list_index(this, vm.stack[fp - 1], len(this.value) - 1)]
+
+
+def native_List_set(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, LIST)
+    this.value[list_index(this, vm.stack[fp - 2], len(this.value) - 1)] = vm.stack[fp - 1]
+    return NOTHING
+
+
+def native_List_append(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, LIST)
+    this.value.append(vm.stack[fp - 1])
+    return NOTHING
+
+
+def native_List_sum(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, LIST)
+    for item in this.value:
+        if item.clazz is not INT:
+            raise VMError(f"List:sum of a list holding a {item.clazz.name}")
+    return new_int(sum(item.value for item in this.value))
+
+
+def native_List_join(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, LIST)
+    sep = vm.stack[fp - 1]
+    assert_is_type(sep, STRING)
+    for item in this.value:
+        if item.clazz is not STRING:
+            raise VMError(f"List:join of a list holding a {item.clazz.name}")
+    return new_string(sep.value.join(item.value for item in this.value))
+
+
+def native_List_slice(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, LIST)
+    start = list_index(this, vm.stack[fp - 2], len(this.value))
+    end = list_index(this, vm.stack[fp - 1], len(this.value))
+    if end < start:
+        raise VMError(f"List:slice from {start} to {end}")
+    return VMObject(LIST, this.value[start:end])
+
+
+# Dict:  the hidden value is a Python dict from the class and value
+# of each key to the key and its value.  Python dicts keep insertion
+# order, as the entries in builtins.c do.
+
+def dict_key(key: VMObject) -> tuple:
+    if key.clazz is not INT and key.clazz is not STRING:
+        raise VMError(f"Dict key must be an Int or String, not {key.clazz.name}")
+    return key.clazz.name, key.value
+
+
+def native_Dict_constructor(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, DICT)
+    this.value = {}
+    return this
+
+
+def native_Dict_string(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, DICT)
+    return new_string("{" + ", ".join(f"{element_text(key)}: {element_text(value)}"
+                                      for key, value in this.value.values()) + "}")
+
+
+def native_Dict_get(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, DICT)
+    key = vm.stack[fp - 1]
+    entry = this.value.get(dict_key(key))
+    if entry is None:
+        raise VMError(f"Dict has no key {element_text(key)}")
+    return entry[1]
+
+
+def native_Dict_put(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, DICT)
+    key = vm.stack[fp - 2]
+    entry = this.value.get(dict_key(key))
+    # The first key put stays, as in builtins.c
+    this.value[dict_key(key)] = (entry[0] if entry else key, vm.stack[fp - 1])
+    return NOTHING
+
+
+def native_Dict_has(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, DICT)
+    return boolean(dict_key(vm.stack[fp - 1]) in this.value)
+
+
+def native_Dict_remove(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, DICT)
+    return boolean(this.value.pop(dict_key(vm.stack[fp - 1]), None) is not None)
+
+
+def native_Dict_size(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, DICT)
+    return new_int(len(this.value))
+
+
+# StringBuilder:  the hidden value is a Python list of the
+# Strings appended, joined when we need the text
+
+def builder_text(this: VMObject) -> str:
+    assert_is_type(this, STRING_BUILDER)
+    if len(this.value) > 1:
+        this.value[:] = ["".join(this.value)]
+    return this.value[0] if this.value else ""
+
+
+def native_StringBuilder_constructor(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, STRING_BUILDER)
+    this.value = []
+    return this
+
+
+def native_StringBuilder_string(vm: Machine, fp: int) -> VMObject:
+    return new_string(builder_text(vm.stack[fp]))
+
+
+def native_StringBuilder_append(vm: Machine, fp: int) -> VMObject:
+    this = vm.stack[fp]
+    assert_is_type(this, STRING_BUILDER)
+    s = vm.stack[fp - 1]
+    assert_is_type(s, STRING)
+    this.value.append(s.value)
+    return NOTHING
+
+
+def native_StringBuilder_length(vm: Machine, fp: int) -> VMObject:
+    # Length in bytes, as in builtins.c
+    return new_int(len(builder_text(vm.stack[fp]).encode()))
+
+
+def install(vm: Machine):
+    """Load the code of the built-in methods and fill in the vtables"""
+    def method(code: list) -> int:
+        return vm.add_method(code)
+
+    obj_constructor = method([(RETURN, 0)])
+    obj_string = method(trampoline(native_Obj_string, 0))
+    # Obj:print is this.string().print()
+    obj_print = method([(LOAD, 0), (CALL, 1), (CALL, 2), (RETURN, 0)])
+    obj_equals = method(trampoline(native_Obj_equals, 1))
+    OBJ.vtable[:] = [obj_constructor, obj_string, obj_print, obj_equals]
+
+    STRING.vtable[:] = [
+        method(trampoline(native_String_constructor, 0)),
+        method([(LOAD, 0), (RETURN, 0)]),   # String:string is itself
+        method(trampoline(native_String_print, 0)),
+        method(trampoline(native_String_equals, 1)),
+        method(trampoline(native_tbd, 1)),  # less
+        method(trampoline(native_String_plus, 1)),
+        method(trampoline(native_String_hash, 0)),
+        method(trampoline(native_String_flush, 0))
+    ]
+
+    BOOL.vtable[:] = [
+        method(trampoline(native_Boolean_constructor, 0)),
+        method(trampoline(native_Boolean_string, 0)),
+        obj_print,
+        obj_equals
+    ]
+
+    NOTHING_CLASS.vtable[:] = [
+        method(trampoline(native_Nothing_constructor, 0)),
+        method(trampoline(native_Nothing_string, 0)),
+        obj_print,
+        obj_equals
+    ]
+
+    INT.vtable[:] = [
+        method(trampoline(native_Int_constructor, 0)),
+        method(trampoline(native_Int_string, 0)),
+        obj_print,
+        method(trampoline(native_Int_equals, 1)),
+        method(trampoline(native_Int_less, 1)),
+        method(trampoline(native_Int_plus, 1)),
+        method(trampoline(native_Int_sub, 1)),
+        method(trampoline(native_Int_mult, 1)),
+        method(trampoline(native_Int_div, 1)),
+        method(trampoline(native_Int_hash, 0))
+    ]
+
+    LIST.vtable[:] = [
+        method(trampoline(native_List_constructor, 0)),
+        method(trampoline(native_List_string, 0)),
+        obj_print,
+        obj_equals,
+        method(trampoline(native_List_length, 0)),
+        method(trampoline(native_List_get, 1)),
+        method(trampoline(native_List_set, 2)),
+        method(trampoline(native_List_append, 1)),
+        method(trampoline(native_List_sum, 0)),
+        method(trampoline(native_List_join, 1)),
+        method(trampoline(native_List_slice, 2))
+    ]
+
+    DICT.vtable[:] = [
+        method(trampoline(native_Dict_constructor, 0)),
+        method(trampoline(native_Dict_string, 0)),
+        obj_print,
+        obj_equals,
+        method(trampoline(native_Dict_get, 1)),
+        method(trampoline(native_Dict_put, 2)),
+        method(trampoline(native_Dict_has, 1)),
+        method(trampoline(native_Dict_remove, 1)),
+        method(trampoline(native_Dict_size, 0))
+    ]
+
+    STRING_BUILDER.vtable[:] = [
+        method(trampoline(native_StringBuilder_constructor, 0)),
+        method(trampoline(native_StringBuilder_string, 0)),
+        obj_print,
+        obj_equals,
+        method(trampoline(native_StringBuilder_append, 1)),
+        method(trampoline(native_StringBuilder_length, 0))
+    ]
+
+
+BUILTIN_CLASSES = [OBJ, STRING, BOOL, INT, NOTHING_CLASS, LIST, DICT, STRING_BUILDER]
@@ -0,0 +1,125 @@
+"""Linking loader for object code, like vm_loader.c.
+
+Modules are read with objfile (either format).  Each module's
+constants are interned in a pool shared by all modules, its imports
+are loaded recursively, and its method code is decoded into the
+(op, operand) tuples the interpreter runs.
+"""
+import logging
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import objfile
+from pyvm import builtins
+from pyvm.machine import (Machine, VMClass, VMError, VMObject, OPS,
+                          CONST, NEW, IS_INSTANCE, CALL_NATIVE,
+                          JUMP, JUMP_IF, JUMP_IFNOT,
+                          NOTHING, TRUE, FALSE)
+from pyvm.opcodes import read_opdefs, operand_counts
+
+log = logging.getLogger(__name__)
+
+# Named literals in const operands; MUST match vm_loader.h
+NAMED_LITERALS = {-1: NOTHING, -2: FALSE, -3: TRUE}
+
+JUMPS = [JUMP, JUMP_IF, JUMP_IFNOT]
+
+
+class Loader:
+    def __init__(self, vm: Machine, lib: Path):
+        self.vm = vm
+        self.lib = lib
+        self.opdefs = read_opdefs()
+        self.n_operands = operand_counts(self.opdefs)
+        # Shared constant pool, (kind, literal) -> object
+        self.constants: Dict[Tuple[str, str], VMObject] = {}
+        self.classes: Dict[str, VMClass] = {}
+        builtins.install(vm)
+        for clazz in builtins.BUILTIN_CLASSES:
+            self.classes[clazz.name] = clazz
+
+    def ensure_loaded(self, class_name: str) -> VMClass:
+        if class_name not in self.classes:
+            log.info(f"Requires loading {class_name}")
+            self.load_class(class_name)
+        return self.classes[class_name]
+
+    def load_class(self, class_name: str) -> VMClass:
+        path = objfile.find(self.lib, class_name)
+        log.info(f"Loading {path}")
+        return self.load_path(path)
+
+    def constant(self, kind: str, literal: str) -> VMObject:
+        key = (kind, literal)
+        if key not in self.constants:
+            if kind == "i":
+                self.constants[key] = builtins.new_int(int(literal))
+            elif kind == "s":
+                self.constants[key] = builtins.new_string(literal)
+            else:
+                raise VMError(f"Constant of unknown type '{kind}'")
+        return self.constants[key]
+
+    def load_path(self, path: Path) -> VMClass:
+        module = objfile.load(path)
+        constants = [self.constant(c["kind"], str(c["value"]))
+                     for c in module["constants"]]
+        the_super = self.ensure_loaded(module["super"])
+        # Inherited method addresses are copied into the vtable
+        vtable = list(the_super.vtable[:module["n_inherited"]])
+        vtable.extend([0] * (module["n_methods"] - len(vtable)))
+        clazz = VMClass(module["class_name"], the_super,
+                        module["n_fields"], vtable)
+        # Registered before imports are loaded, since
+        # a class may refer to itself
+        self.classes[clazz.name] = clazz
+        imports = [self.ensure_loaded(name) for name in module["imports"]]
+        for method in module["code"]:
+            code = self.decode(method["code"], constants, imports)
+            vtable[method["slot"]] = self.vm.add_method(code)
+        return clazz
+
+    def decode(self, words: List[int], constants: List[VMObject],
+               imports: List[VMClass]) -> List[tuple]:
+        """Decode method code, starting at the end of the code list.
+        Superinstructions are decoded to their parts, and enter
+        (which does nothing) is dropped, so we map word offsets in
+        the object code to positions in the decoded code to resolve
+        jumps.
+        """
+        base = len(self.vm.code)
+        code: List[tuple] = []
+        position: Dict[int, int] = {}   # word offset -> decoded index
+        jumps: List[Tuple[int, int]] = []  # (decoded index, target word)
+        pos = 0
+        while pos < len(words):
+            opdef = self.opdefs[words[pos]]
+            position[pos] = len(code)
+            pos += 1
+            for part in opdef.parts:
+                operand = None
+                if self.n_operands[part]:
+                    operand = words[pos]
+                    pos += 1
+                if part == "enter":
+                    continue
+                op = OPS[part]
+                if op == CONST:
+                    if operand < 0:
+                        operand = NAMED_LITERALS[operand]
+                    else:
+                        operand = constants[operand]
+                elif op == NEW or op == IS_INSTANCE:
+                    operand = imports[operand]
+                elif op in JUMPS:
+                    # Relative to the word after the operand
+                    jumps.append((len(code), pos + operand))
+                elif op == CALL_NATIVE:
+                    raise VMError("call_native in loaded code")
+                code.append((op, operand))
+        position[pos] = len(code)
+        for index, target in jumps:
+            if target not in position:
+                raise VMError(f"Jump to word {target} is not to an instruction")
+            code[index] = (code[index][0], base + position[target])
+        return code
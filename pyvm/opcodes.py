@@ -0,0 +1,41 @@
+"""The instruction set, read from the same opdefs.txt as the
+assembler and the C bytecode table, so that byte codes in object
+files mean the same thing here.
+"""
+from pathlib import Path
+from typing import Dict, List
+
+OPDEFS_PATH = Path(__file__).resolve().parent.parent.joinpath("opdefs.txt")
+
+
+class OpDef:
+    """An operation, or a superinstruction combining several"""
+    __slots__ = ("code", "name", "n_operands", "parts")
+
+    def __init__(self, code: int, name: str, n_operands: int, parts: List[str]):
+        self.code = code
+        self.name = name
+        self.n_operands = n_operands
+        # Basic operations executed in sequence; just this one
+        # if it is not a superinstruction
+        self.parts = parts or [name]
+
+
+def read_opdefs(path: Path = OPDEFS_PATH) -> List[OpDef]:
+    """Operations indexed by byte code"""
+    ops: List[OpDef] = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.split("#")[0].strip()
+            if not line:
+                continue
+            fields = line.split(",")
+            name, func, n_operands = fields[:3]
+            parts = fields[3].split("+") if len(fields) > 3 else []
+            ops.append(OpDef(len(ops), name, int(n_operands), parts))
+    return ops
+
+
+def operand_counts(ops: List[OpDef]) -> Dict[str, int]:
+    """Operand count of each basic operation, by name"""
+    return {op.name: op.n_operands for op in ops if op.parts == [op.name]}
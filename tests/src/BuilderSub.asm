@@ -0,0 +1,62 @@
+# Appending to a subclass of StringBuilder (Joiner), with a small
+# heap (-H 64K in TESTS.csv) so that collections happen while it
+# is growing its buffer.
+.class BuilderSub:Obj
+.method $constructor
+.local i,j,sb
+    enter
+    const ","
+    new Joiner
+    call Joiner:$constructor
+    store sb
+    const 0
+    store i
+build:                   # "0,1,...,99,"
+    const 100
+    load i
+    call Int:less
+    jump_ifnot built
+    load i
+    call Int:string
+    load sb
+    call Joiner:add
+    pop
+    const 0
+    store j
+churn:                   # Garbage Ints, to force collections
+    const 50
+    load j
+    call Int:less
+    jump_ifnot churned
+    const 1000000
+    load j
+    call Int:plus
+    pop
+    const 1
+    load j
+    call Int:plus
+    store j
+    jump churn
+churned:
+    const 1
+    load i
+    call Int:plus
+    store i
+    jump build
+built:
+    load sb
+    call Joiner:length
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    load sb
+    call Joiner:string
+    call String:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const nothing
+    return 0
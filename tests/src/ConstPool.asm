@@ -0,0 +1,144 @@
+# Constant pool: more than 30 distinct literals in one class,
+# repeated literals, and an Int and a String with the same text
+.class ConstPool:Obj
+.method $constructor
+    enter
+    const 7
+    call Int:print
+    pop
+    const "7"
+    const "7"
+    call String:equals
+    call Obj:print
+    pop
+    const "<0>"
+    call String:print
+    pop
+    const "<1>"
+    call String:print
+    pop
+    const "<2>"
+    call String:print
+    pop
+    const "<3>"
+    call String:print
+    pop
+    const "<4>"
+    call String:print
+    pop
+    const "<5>"
+    call String:print
+    pop
+    const "<6>"
+    call String:print
+    pop
+    const "<7>"
+    call String:print
+    pop
+    const "<8>"
+    call String:print
+    pop
+    const "<9>"
+    call String:print
+    pop
+    const "<10>"
+    call String:print
+    pop
+    const "<11>"
+    call String:print
+    pop
+    const "<12>"
+    call String:print
+    pop
+    const "<13>"
+    call String:print
+    pop
+    const "<14>"
+    call String:print
+    pop
+    const "<15>"
+    call String:print
+    pop
+    const "<16>"
+    call String:print
+    pop
+    const "<17>"
+    call String:print
+    pop
+    const "<18>"
+    call String:print
+    pop
+    const "<19>"
+    call String:print
+    pop
+    const "<20>"
+    call String:print
+    pop
+    const "<21>"
+    call String:print
+    pop
+    const "<22>"
+    call String:print
+    pop
+    const "<23>"
+    call String:print
+    pop
+    const "<24>"
+    call String:print
+    pop
+    const "<25>"
+    call String:print
+    pop
+    const "<26>"
+    call String:print
+    pop
+    const "<27>"
+    call String:print
+    pop
+    const "<28>"
+    call String:print
+    pop
+    const "<29>"
+    call String:print
+    pop
+    const "<30>"
+    call String:print
+    pop
+    const "<31>"
+    call String:print
+    pop
+    const "<32>"
+    call String:print
+    pop
+    const "<33>"
+    call String:print
+    pop
+    const "<34>"
+    call String:print
+    pop
+    const "<35>"
+    call String:print
+    pop
+    const "<36>"
+    call String:print
+    pop
+    const "<37>"
+    call String:print
+    pop
+    const "<38>"
+    call String:print
+    pop
+    const "<39>"
+    call String:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    load $
+    return 0
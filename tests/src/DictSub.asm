@@ -0,0 +1,97 @@
+# Putting to a subclass of Dict (NamedDict), with a small heap
+# (-H 64K in TESTS.csv) so that collections happen while the
+# dict holds the only references to its values.
+.class DictSub:Obj
+.method $constructor
+.local i,j,d
+    enter
+    const "squares"
+    new NamedDict
+    call NamedDict:$constructor
+    store d
+    const 0
+    store i
+fill:                    # d maps i to 100000 + i * i for i in 0..99
+    const 100
+    load i
+    call Int:less
+    jump_ifnot filled
+    load i
+    load i
+    load i
+    call Int:mult
+    const 100000
+    call Int:plus
+    load d
+    call NamedDict:put
+    pop
+    const 0
+    store j
+churn:                   # Garbage Ints, to force collections
+    const 50
+    load j
+    call Int:less
+    jump_ifnot churned
+    const 1000000
+    load j
+    call Int:plus
+    pop
+    const 1
+    load j
+    call Int:plus
+    store j
+    jump churn
+churned:
+    const 1
+    load i
+    call Int:plus
+    store i
+    jump fill
+filled:
+    load d
+    call NamedDict:size
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const 99
+    load d
+    call NamedDict:get
+    call Obj:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const 5
+    load d
+    call NamedDict:remove
+    call Bool:print
+    pop
+    const " "
+    call String:print
+    pop
+    const 5
+    load d
+    call NamedDict:has
+    call Bool:print
+    pop
+    const " "
+    call String:print
+    pop
+    load d
+    call NamedDict:size
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    load d
+    call NamedDict:name
+    call String:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const nothing
+    return 0
@@ -0,0 +1,163 @@
+# The built-in Dict:  put, get, has, remove, size, printing,
+# and the hash methods of Int and String.  Run with a small
+# heap (-H 64K in TESTS.csv), so that collections happen while
+# the only references to the big Ints kept in the dict are its
+# values.
+.class Dicts:Obj
+.method $constructor
+.local i,d,junk
+    enter
+    new Dict
+    call Dict:$constructor
+    store d
+    const 0
+    store i
+fill:                    # d maps i to 100000 + 1000 * i for i in 0..199
+    const 200
+    load i
+    call Int:less
+    jump_ifnot filled
+    load i
+    const 1000
+    load i
+    call Int:mult
+    const 100000
+    call Int:plus
+    load d
+    call Dict:put
+    pop
+    const 1
+    load i
+    call Int:plus
+    store i
+    jump fill
+filled:
+    const 0
+    store i
+churn:                   # Garbage dicts, to force collections
+    const 3000
+    load i
+    call Int:less
+    jump_ifnot churned
+    new Dict
+    call Dict:$constructor
+    store junk
+    const "garbage"
+    load i
+    load junk
+    call Dict:put
+    pop
+    const 1
+    load i
+    call Int:plus
+    store i
+    jump churn
+churned:
+    load d
+    call Dict:size
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const 199
+    load d
+    call Dict:get
+    call Obj:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const 3
+    store i
+empty:                   # Remove all but the keys 0, 1, 2
+    const 200
+    load i
+    call Int:less
+    jump_ifnot emptied
+    load i
+    load d
+    call Dict:remove
+    pop
+    const 1
+    load i
+    call Int:plus
+    store i
+    jump empty
+emptied:
+    load d
+    call Dict:size
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const 5
+    load d
+    call Dict:has
+    call Bool:print
+    pop
+    const " "
+    call String:print
+    pop
+    const 2
+    load d
+    call Dict:has
+    call Bool:print
+    pop
+    const " "
+    call String:print
+    pop
+    const 5
+    load d
+    call Dict:remove
+    call Bool:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const "two"
+    const "zwei"
+    load d
+    call Dict:put
+    pop
+    const 1
+    const "one"
+    load d
+    call Dict:put
+    pop
+    const "three"
+    const 3
+    load d
+    call Dict:put
+    pop
+    const "two"
+    load d
+    call Dict:get
+    call Obj:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    load d
+    call Dict:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const "abc"
+    call String:hash
+    call Int:print
+    pop
+    const " "
+    call String:print
+    pop
+    const 42
+    call Int:hash
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const nothing
+    return 0
@@ -0,0 +1,96 @@
+# Allocates far more than fits in the heap it is run
+# with (-H 64K in TESTS.csv), so the collector must run
+# many times.  A list of 500 nodes built first must
+# survive all the collections intact.
+.class GcStress:Obj
+.field next
+.field value
+.method $constructor
+.local i,list,node,total
+    enter
+    const 0
+    store i
+    load $
+    store list
+build:                   # list = new node(i, list), 500 times
+    const 500
+    load i
+    call Int:less
+    jump_ifnot churn_init
+    new $
+    store node
+    load list
+    load node
+    store_field $:next
+    load i
+    load node
+    store_field $:value
+    load node
+    store list
+    const 1
+    load i
+    call Int:plus
+    store i
+    jump build
+churn_init:
+    const 0
+    store i
+    const 0
+    store total
+churn:                   # Garbage:  Ints, Strings, and nodes
+    const 20000
+    load i
+    call Int:less
+    jump_ifnot walk_init
+    load i
+    load total
+    call Int:plus
+    store total
+    load i
+    call Int:string
+    pop
+    new $
+    pop
+    const 1
+    load i
+    call Int:plus
+    store i
+    jump churn
+walk_init:
+    load total
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const 0
+    store i
+    const 0
+    store total
+walk:                    # Sum of the values in the list
+    const 500
+    load i
+    call Int:less
+    jump_ifnot done
+    load list
+    load_field $:value
+    load total
+    call Int:plus
+    store total
+    load list
+    load_field $:next
+    store list
+    const 1
+    load i
+    call Int:plus
+    store i
+    jump walk
+done:
+    load total
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const nothing
+    return 0
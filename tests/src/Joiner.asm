@@ -0,0 +1,31 @@
+# A subclass of the built-in StringBuilder with a field of its
+# own.  Its constructor does not (cannot) call the StringBuilder
+# constructor, so append must work on the zeroed native state
+# from new.
+.class Joiner:StringBuilder
+.field sep
+
+.method $constructor
+.args s
+    enter
+    load s
+    load $
+    store_field $:sep
+    load $
+    return 1
+
+# Append s and then the separator
+.method add
+.args s
+    enter
+    load s
+    load $
+    call StringBuilder:append
+    pop
+    load $
+    load_field $:sep
+    load $
+    call StringBuilder:append
+    pop
+    const nothing
+    return 1
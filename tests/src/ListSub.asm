@@ -0,0 +1,83 @@
+# Appending to a subclass of List (TaggedList), with a small
+# heap (-H 64K in TESTS.csv) so that collections happen while
+# the list holds the only references to its elements.
+.class ListSub:Obj
+.method $constructor
+.local i,j,nums
+    enter
+    new TaggedList
+    call TaggedList:$constructor
+    store nums
+    const "squares"
+    load nums
+    call TaggedList:set_tag
+    pop
+    const 0
+    store i
+fill:                    # nums holds 100000 + i * i for i in 0..49
+    const 50
+    load i
+    call Int:less
+    jump_ifnot filled
+    load i
+    load i
+    call Int:mult
+    const 100000
+    call Int:plus
+    load nums
+    call TaggedList:append
+    pop
+    const 0
+    store j
+churn:                   # Garbage Ints, to force collections
+    const 100
+    load j
+    call Int:less
+    jump_ifnot churned
+    const 1000000
+    load j
+    call Int:plus
+    pop
+    const 1
+    load j
+    call Int:plus
+    store j
+    jump churn
+churned:
+    const 1
+    load i
+    call Int:plus
+    store i
+    jump fill
+filled:
+    load nums
+    call TaggedList:length
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const 49
+    load nums
+    call TaggedList:get
+    call Obj:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    load nums
+    call TaggedList:sum
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    load nums
+    call TaggedList:tag
+    call String:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const nothing
+    return 0
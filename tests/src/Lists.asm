@@ -0,0 +1,138 @@
+# The built-in List:  append, get, set, length, the bulk
+# operations sum, join, and slice, and printing.  Run with
+# a small heap (-H 64K in TESTS.csv), so that collections
+# happen while the only references to the big Ints kept
+# in the list are its elements.
+.class Lists:Obj
+.method $constructor
+.local i,nums,words,part,junk
+    enter
+    new List
+    call List:$constructor
+    store nums
+    const 0
+    store i
+fill:                    # nums holds 100000 + 1000 * i for i in 0..99
+    const 100
+    load i
+    call Int:less
+    jump_ifnot filled
+    const 1000
+    load i
+    call Int:mult
+    const 100000
+    call Int:plus
+    load nums
+    call List:append
+    pop
+    const 1
+    load i
+    call Int:plus
+    store i
+    jump fill
+filled:
+    const 0
+    store i
+churn:                   # Garbage lists, to force collections
+    const 3000
+    load i
+    call Int:less
+    jump_ifnot churned
+    new List
+    call List:$constructor
+    store junk
+    load i
+    load junk
+    call List:append
+    pop
+    const "garbage"
+    load junk
+    call List:append
+    pop
+    const 1
+    load i
+    call Int:plus
+    store i
+    jump churn
+churned:
+    load nums
+    call List:length
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const 99
+    load nums
+    call List:get
+    call Obj:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    load nums
+    call List:sum
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const 0
+    const -7
+    load nums
+    call List:set
+    pop
+    const 0
+    const 3
+    load nums
+    call List:slice
+    store part
+    load part
+    call List:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    new List
+    call List:$constructor
+    store words
+    const "tiny"
+    load words
+    call List:append
+    pop
+    const "vm"
+    load words
+    call List:append
+    pop
+    const "lists"
+    load words
+    call List:append
+    pop
+    const "-"
+    load words
+    call List:join
+    call String:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const true
+    load words
+    call List:append
+    pop
+    const nothing
+    load words
+    call List:append
+    pop
+    load part
+    load words
+    call List:append
+    pop
+    load words
+    call List:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const nothing
+    return 0
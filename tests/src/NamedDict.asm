@@ -0,0 +1,20 @@
+# A subclass of the built-in Dict with a field of its own.  Its
+# constructor does not (cannot) call the Dict constructor, so the
+# Dict methods must work on the zeroed native state from new.
+.class NamedDict:Dict
+.field name
+
+.method $constructor
+.args n
+    enter
+    load n
+    load $
+    store_field $:name
+    load $
+    return 1
+
+.method name
+    enter
+    load $
+    load_field $:name
+    return 0
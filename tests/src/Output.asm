@@ -0,0 +1,43 @@
+# Buffered output:  run with a 16-byte buffer (-B 16 in TESTS.csv),
+# so that prints fill it, overflow it, and are longer than it, and
+# with String:flush in between.  The output must come out in order.
+.class Output:Obj
+.method $constructor
+.local i
+    enter
+    const 0
+    store i
+count:
+    const 20
+    load i
+    call Int:less
+    jump_ifnot counted
+    load i
+    call Int:print
+    pop
+    const " "
+    call String:print
+    pop
+    const 1
+    load i
+    call Int:plus
+    store i
+    jump count
+counted:
+    const "\n"
+    call String:flush
+    pop
+    const "A line longer than the sixteen-byte output buffer\n"
+    call String:print
+    pop
+    const ""
+    call String:flush
+    pop
+    const "done"
+    call String:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const nothing
+    return 0
@@ -0,0 +1,38 @@
+# Naive code of the kind compile.py produces, for the
+# peephole optimizer (assemble.py -O).  Output must be
+# the same with and without optimization.
+.class Peephole:Obj
+.method $constructor
+.local  i,t
+    enter
+    const 0
+    store i
+cond:
+    const 3
+    load i
+    call Int:less
+    jump_if body     # Inverted to jump_ifnot endloop
+    jump endloop
+body:
+    load i
+    call Int:print
+    pop
+    load i           # No effect
+    store i
+    const 1
+    load i
+    call Int:plus
+    store t          # t is not loaded elsewhere
+    load t
+    store i
+    jump next        # Threaded through to cond
+next:
+    jump cond
+endloop:
+    const "\ndone\n"
+    call String:print
+    pop
+    const nothing
+    return 0
+    const nothing    # Unreachable
+    return 0
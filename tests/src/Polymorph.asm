@@ -0,0 +1,58 @@
+# One call site (in show) with receivers of five classes,
+# more than an inline cache holds, so it becomes megamorphic
+# and keeps replacing entries.  Each must still get its own
+# print method.  (tiny_vm -I reports the call sites.)
+.class Polymorph:Obj
+.method string            # Used by the inherited Obj:print
+    enter
+    const "a Polymorph"
+    return 0
+
+.method show
+.args x
+    enter
+    load x
+    call Obj:print       # Int, String, Bool, Nothing, or Polymorph
+    pop
+    const "\n"
+    call String:print
+    pop
+    const nothing
+    return 1
+
+.method $constructor
+.local i
+    enter
+    const 0
+    store i
+again:
+    const 42
+    load $
+    call $:show
+    pop
+    const "text"
+    load $
+    call $:show
+    pop
+    const true
+    load $
+    call $:show
+    pop
+    const nothing
+    load $
+    call $:show
+    pop
+    load $
+    load $
+    call $:show
+    pop
+    const 1
+    load i
+    call Int:plus
+    store i
+    const 2
+    load i
+    call Int:less
+    jump_if again
+    const nothing
+    return 0
@@ -0,0 +1,58 @@
+# Ints, Bools, and nothing are immutable and shared;
+# results must be the same whether or not they come
+# from the shared Int cache (INT_CACHE_MIN..INT_CACHE_MAX).
+.class SharedInts:Obj
+.method $constructor
+    enter
+    new Int              # 0, the shared zero
+    call Int:$constructor
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    new Bool             # false
+    call Bool:$constructor
+    call Bool:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const 1
+    const 1024           # Just inside the default cache
+    call Int:plus
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const 128
+    const 0
+    call Int:sub         # -128, the bottom of the cache
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const 129
+    const 0
+    call Int:sub         # Just outside
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const 7
+    const 6
+    call Int:mult        # 42 from the cache, equal to a fresh 42
+    const 100
+    const 4200
+    call Int:div
+    call Int:equals
+    call Bool:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const nothing
+    return 0
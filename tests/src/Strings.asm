@@ -0,0 +1,124 @@
+# String:plus past the old 255-byte limit, StringBuilder, and
+# String:equals and String:hash on long strings.  Run with a
+# small heap (-H 64K in TESTS.csv) so that garbage builders are
+# collected while one is still in use.
+.class Strings:Obj
+.method $constructor
+.local i,s,sb,t,junk
+    enter
+    const "-vm"
+    const "tiny"
+    call String:plus
+    call String:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const "abcdefghij"
+    store s
+    const 0
+    store i
+double:                  # s is 10 * 2^6 = 640 bytes
+    const 6
+    load i
+    call Int:less
+    jump_ifnot doubled
+    load s
+    load s
+    call String:plus
+    store s
+    const 1
+    load i
+    call Int:plus
+    store i
+    jump double
+doubled:
+    new StringBuilder
+    call StringBuilder:$constructor
+    store sb
+    const 0
+    store i
+build:                   # The same 640 bytes, with garbage builders
+    const 3000
+    load i
+    call Int:less
+    jump_ifnot built
+    const 64
+    load i
+    call Int:less
+    jump_ifnot garbage
+    const "abcdefghij"
+    load sb
+    call StringBuilder:append
+    pop
+garbage:
+    new StringBuilder
+    call StringBuilder:$constructor
+    store junk
+    load s
+    load junk
+    call StringBuilder:append
+    pop
+    const 1
+    load i
+    call Int:plus
+    store i
+    jump build
+built:
+    load sb
+    call StringBuilder:length
+    call Int:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    load sb
+    call StringBuilder:string
+    store t
+    load s
+    load t
+    call String:equals
+    call Bool:print
+    pop
+    const " "
+    call String:print
+    pop
+    load s
+    call String:hash
+    load t
+    call String:hash
+    call Int:equals
+    call Bool:print
+    pop
+    const " "
+    call String:print
+    pop
+    const "!"
+    load t
+    call String:plus
+    load s
+    call String:equals
+    call Bool:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    new StringBuilder
+    call StringBuilder:$constructor
+    store sb
+    const "Hello, "
+    load sb
+    call StringBuilder:append
+    pop
+    const "world"
+    load sb
+    call StringBuilder:append
+    pop
+    load sb
+    call StringBuilder:print
+    pop
+    const "\n"
+    call String:print
+    pop
+    const nothing
+    return 0
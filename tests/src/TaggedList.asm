@@ -0,0 +1,20 @@
+# A subclass of the built-in List with a field of its own.
+# It inherits the List constructor, which sets up the native
+# state that its field must not overlap.
+.class TaggedList:List
+.field tag
+
+.method set_tag
+.args t
+    enter
+    load t
+    load $
+    store_field $:tag
+    const nothing
+    return 1
+
+.method tag
+    enter
+    load $
+    load_field $:tag
+    return 0
@@ -1,5 +1,5 @@
-"""Simple test script for Ori (tiny vm) asm files.
-(Extend later to work with Quack compilation)
+"""Simple test script for Ori (tiny vm) asm files,
+and Quack programs compiled with compile.py.
 
 FIXME: There must be better ways to handle file dependencies
 """
@@ -8,6 +8,7 @@ import pathlib
 import shutil
 import filecmp
 import csv
+import argparse
 
 import logging
 import sys
@@ -21,8 +22,16 @@ log.setLevel(logging.INFO)
 PY = "python3"
 ROOT = ".."
 ASM = f"{ROOT}/assemble.py"
+QC = "compile.py"   # Run in ROOT, where it finds orilib/
 VM = f"{ROOT}/bin/tiny_vm"
-BUILTINS = ["Bool.json", "Int.json", "Nothing.json", "Obj.json", "String.json"]
+VMS = {"c": [VM], "py": [PY, f"{ROOT}/pyvm"]}   # Reference interpreter
+RUN_VM = VMS["c"]
+JOBS = 4   # Assembler processes
+FORMAT = "json"   # Object code format, json or bin
+OPTIMIZE = False  # Assemble with peephole optimization
+SUFFIXES = {"json": ".json", "bin": ".tvm"}
+BUILTINS = ["Bool.json", "Dict.json", "Int.json", "List.json", "Nothing.json",
+            "Obj.json", "String.json", "StringBuilder.json"]
 ASMREQS = ["asm.conf", "opdefs.txt"]
 
 def install_prereqs():
@@ -57,22 +66,71 @@ def assemble(class_name: str) -> bool:
     return True
 
 
-def test_class(class_name: str) -> bool:
+def compile_quack(name: str) -> bool:
+    """Compile src/Name.qk to object code in OBJ.  Every Quack
+    program has main class $Main, so compile each one just
+    before running it.
+    """
+    src = pathlib.Path("./src/" + name + ".qk").resolve()
+    obj = pathlib.Path("./OBJ").resolve()
+    try:
+        proc = subprocess.run([PY, QC, "--objects", obj, src], cwd=ROOT, text=True)
+        proc.check_returncode() # May throw CalledProcessError
+    except subprocess.CalledProcessError:
+        log.warning(f"Compiler failed on {src}")
+        return False
+    return True
+
+
+def object_path(class_name: str) -> pathlib.Path:
+    """Where the assembler puts object code in the chosen FORMAT"""
+    return pathlib.Path("./OBJ/" + class_name + SUFFIXES[FORMAT])
+
+
+def assemble_all(class_names: list) -> bool:
+    """Translate src/Class.asm to OBJ/Class.json (or Class.tvm)
+    for all the classes with a single (parallel) assembler run.
+    Returns True iff all were assembled; check for each object
+    file to see which were.
+    """
+    srcs = []
+    for class_name in class_names:
+        srcs.append(pathlib.Path("./src/" + class_name + ".asm"))
+        object_path(class_name).unlink(missing_ok=True)
+    options = ["--jobs", str(JOBS), "--format", FORMAT]
+    if OPTIMIZE:
+        options.append("--optimize")
+    proc = subprocess.run([PY, ASM] + options + srcs, text=True)
+    if proc.returncode != 0:
+        log.warning(f"Assembler failed on some of {class_names}")
+        return False
+    return True
+
+
+def assembled(class_name: str) -> bool:
+    """Did assemble_all produce object code for class_name?"""
+    return object_path(class_name).exists()
+
+
+def test_class(class_name: str, options: list = [], main: str = None) -> bool:
     """Assemble, run, and check a single test case
     for a class C, in src/C.asm, with expected output
-    in expect/C_stdout.txt.  Returns True iff test case
-    has expected outcome.
+    in expect/C_stdout.txt.  Options (from the Options
+    column of TESTS.csv) are passed to the vm.  A Quack
+    test case C runs main class $Main instead.
+    Returns True iff test case has expected outcome.
     """
     ok = True
     observed_stdout = pathlib.Path("out/" + class_name + "_stdout.txt")
     observed_stderr = pathlib.Path("out/" + class_name + "_stderr.txt")
     expect_stdout = pathlib.Path("expect/" + class_name + "_stdout.txt")
-    if not assemble(class_name):
+    if main is None and not assembled(class_name):
+        log.warning(f"No object code for {class_name}")
         return False
     try:
         std_out = open(observed_stdout, "w")
         std_err = open(observed_stderr, "w")
-        proc = subprocess.run([VM, class_name], text=True,
+        proc = subprocess.run(RUN_VM + options + [main or class_name], text=True,
                               stdout=std_out, stderr=std_err)
         proc.check_returncode() # May throw CalledProcessError
         if filecmp.cmp(observed_stdout, expect_stdout):
@@ -86,25 +144,47 @@ def test_class(class_name: str) -> bool:
     return ok
 
 
+def cli():
+    parser = argparse.ArgumentParser("Run the tiny vm test cases")
+    parser.add_argument("--format", choices=SUFFIXES.keys(), default=FORMAT,
+                        help="Object code format to assemble and load")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="Assemble with peephole optimization")
+    parser.add_argument("--vm", choices=VMS.keys(), default="c",
+                        help="Run with the C vm or the Python interpreter")
+    return parser.parse_args()
+
+
 def main():
     """Stub"""
+    global FORMAT, OPTIMIZE, RUN_VM
+    args = cli()
+    FORMAT = args.format
+    OPTIMIZE = args.optimize
+    RUN_VM = VMS[args.vm]
     install_prereqs()
-    with open("src/TESTS.csv") as cases:
-        case_reader = csv.DictReader(cases)
-        for case in case_reader:
-            class_name = case["Class"]
-            action = case["Action"]
-            if action == "assemble":
-                # Assemble but do not execute
-                log.info(f"Class '{class_name} -- assemble only")
-                ok = assemble(class_name)
-            elif action == "run":
-                log.info(f"Class '{class_name} -- assemble and run")
-                ok = test_class(class_name)
-            else:
-                log.error(f"Unrecognized action '{action}' for class {class_name}")
-            if not ok:
-                print(f"*** Failed test case: {action} {class_name}", file=sys.stderr)
+    with open("src/TESTS.csv") as case_file:
+        cases = list(csv.DictReader(case_file))
+    assemble_all([case["Class"] for case in cases if case["Action"] != "compile"])
+    for case in cases:
+        class_name = case["Class"]
+        action = case["Action"]
+        if action == "assemble":
+            # Assemble but do not execute
+            log.info(f"Class '{class_name} -- assemble only")
+            ok = assembled(class_name)
+        elif action == "run":
+            log.info(f"Class '{class_name} -- assemble and run")
+            options = (case.get("Options") or "").split()
+            ok = test_class(class_name, options)
+        elif action == "compile":
+            log.info(f"Class '{class_name} -- compile and run")
+            options = (case.get("Options") or "").split()
+            ok = compile_quack(class_name) and test_class(class_name, options, "$Main")
+        else:
+            log.error(f"Unrecognized action '{action}' for class {class_name}")
+        if not ok:
+            print(f"*** Failed test case: {action} {class_name}", file=sys.stderr)
     # FIXME: Add a check for omitted source files
     print("Testing complete")
 
@@ -10,6 +10,7 @@
 int main(int argc, char **argv) {
     set_log_level(DEBUG);
     fprintf(stderr, "Testing the 'roll' operation\n");
+    vm_frame_init(1024);
     vm_frame_push_word((vm_Word) {.intval = 44});
     vm_frame_push_word((vm_Word) {.intval = 43});
     vm_frame_push_word((vm_Word) {.intval = 42});
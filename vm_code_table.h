@@ -11,10 +11,18 @@
 #include "vm_state.h"
 #include "vm_ops.h"
 
+/* A superinstruction combines up to MAX_OP_PARTS operations,
+ * listed by byte code in parts.  Operations that are not
+ * superinstructions have n_parts = 0.
+ */
+#define MAX_OP_PARTS 4
+
 typedef struct {
     char *name;
     vm_Instr instr;
     int n_operands;
+    int n_parts;
+    int parts[MAX_OP_PARTS];
 } op_tbl_entry;
 
 extern op_tbl_entry vm_op_bytecodes[];
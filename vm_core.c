@@ -7,6 +7,7 @@
 #include "logger.h"
 #include <assert.h>
 
+#ifndef VM_RELEASE
 void check_health_class(class_ref c) {
     assert(c->header.healthy_class_tag == HEALTHY);
 }
@@ -15,3 +16,4 @@ void check_health_object(obj_ref v) {
     assert(v->header.tag == GOOD_OBJ_TAG);
     assert(v->header.clazz->header.healthy_class_tag == HEALTHY);
 }
+#endif
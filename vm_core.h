@@ -14,6 +14,7 @@
 
 struct obj_struct;
 struct class_struct;
+struct vm_call_site;
 
 typedef struct obj_struct*
 obj_ref;
@@ -24,7 +25,7 @@ class_ref;
 struct obj_header_struct {
     class_ref clazz;
     int tag; // Validation tag for test & debug
-    // To do:  garbage collector metadata would go here.
+    int gc_flags; // Garbage collector metadata (see vm_gc.h)
 };
 
 
@@ -44,7 +45,9 @@ struct class_header_struct {
     int healthy_class_tag;
     class_ref super;  // Needed for typecase
     int n_fields;     // Redundant but convenient for debugging
+    int field_base;   // Words of native state (e.g., a List's items) before fields[0]
     int object_size;  // Malloc this much before calling constructor
+    int gc_flags;     // Initial gc_flags of objects (see vm_gc.h)
 };
 
 
@@ -63,6 +66,7 @@ typedef union u_Word {
     // which may be ...
     vm_Intval intval;        // Only for method slot indexes; these are not Int objects
     vm_Native native;        // A native method
+    struct vm_call_site *site;  // Call instruction operand (see vm_icache.h)
     // The following things appear in the activation record stack
     obj_ref obj;            // Reference (pointer) to an object
     class_ref clazz;        // A class to be instantiated
@@ -96,10 +100,16 @@ struct class_struct {
  * eliminate the run-time cost.
  */
 #define HEALTHY 1234
-extern void check_health_class(class_ref c);
 #define GOOD_OBJ_TAG 0xceed
 // == 52973 decimal
+/* Health checks are compiled out of release builds */
+#ifdef VM_RELEASE
+#define check_health_class(c) ((void) 0)
+#define check_health_object(v) ((void) 0)
+#else
+extern void check_health_class(class_ref c);
 extern void check_health_object(obj_ref v);
+#endif
 
 
 #endif //TINY_VM_VM_CORE_H
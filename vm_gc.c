@@ -0,0 +1,340 @@
+/*
+ * Mark-sweep garbage collection over a fixed arena.
+ *
+ * The arena is divided into 8-byte granules.  Two bitmaps, with
+ * a bit per granule, record where allocated objects start and which
+ * of them are marked.  The start bitmap lets us treat any word on
+ * the frame stack as a possible reference:  it is one only if it
+ * points exactly at the start of an allocated object.  (The frame
+ * stack also holds saved program counters and frame pointers, which
+ * never point into the arena.)
+ *
+ * Everything in the arena that is not an allocated object is a
+ * free chunk, which begins with its size, so the sweep can walk the
+ * arena from one end to the other.  Free chunks of up to
+ * N_EXACT granules are kept on lists by exact size, and larger ones
+ * on a single first-fit list.  The sweep coalesces neighboring free
+ * chunks and rebuilds all the lists.  An 8-byte fragment is too small
+ * for a list entry; it stays a "filler" chunk until it is coalesced.
+ */
+
+#include "vm_gc.h"
+#include "vm_state.h"
+#include "builtins.h"
+#include "logger.h"
+#include <assert.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#define GRANULE 8
+#define MIN_CHUNK 16   // Room for a free chunk header
+#define N_EXACT 32     // Exact-size free lists for 1..32 granules
+
+struct free_chunk {
+    size_t size;                // Bytes, including this header
+    struct free_chunk *next;    // Absent in an 8-byte filler
+};
+
+static char *heap_start = 0;
+static char *heap_end = 0;
+static unsigned char *start_bits = 0;
+static unsigned char *mark_bits = 0;
+
+static struct free_chunk *exact_lists[N_EXACT + 1];
+static struct free_chunk *large_list = 0;
+
+struct vm_gc_stats vm_gc_stats;
+
+/* ---------- Bitmaps ---------- */
+
+static inline size_t granule(char *p) {
+    return (p - heap_start) / GRANULE;
+}
+
+static inline int get_bit(unsigned char *bits, size_t g) {
+    return (bits[g >> 3] >> (g & 7)) & 1;
+}
+
+static inline void set_bit(unsigned char *bits, size_t g) {
+    bits[g >> 3] |= (unsigned char) (1 << (g & 7));
+}
+
+static inline void clear_bit(unsigned char *bits, size_t g) {
+    bits[g >> 3] &= (unsigned char) ~(1 << (g & 7));
+}
+
+/* Is p the start of an allocated object? */
+static inline int is_heap_object(char *p) {
+    return p >= heap_start && p < heap_end
+           && (p - heap_start) % GRANULE == 0
+           && get_bit(start_bits, granule(p));
+}
+
+static inline size_t round_size(size_t n_bytes) {
+    size_t size = (n_bytes + GRANULE - 1) & ~((size_t) GRANULE - 1);
+    return size < MIN_CHUNK ? MIN_CHUNK : size;
+}
+
+static size_t object_size(obj_ref obj) {
+    return round_size(obj->header.clazz->header.object_size);
+}
+
+/* ---------- Free lists ---------- */
+
+/* Make [p, p+size) a free chunk and list it */
+static void add_free(char *p, size_t size) {
+    struct free_chunk *chunk = (struct free_chunk *) p;
+    chunk->size = size;
+    if (size < MIN_CHUNK) {
+        return;  // Filler, reclaimed when coalesced with a neighbor
+    }
+    size_t g = size / GRANULE;
+    if (g <= N_EXACT) {
+        chunk->next = exact_lists[g];
+        exact_lists[g] = chunk;
+    } else {
+        chunk->next = large_list;
+        large_list = chunk;
+    }
+}
+
+/* Allocate size bytes from the front of a free chunk
+ * (already unlinked), freeing the rest.
+ */
+static void *split(struct free_chunk *chunk, size_t size) {
+    size_t rest = chunk->size - size;
+    if (rest > 0) {
+        add_free((char *) chunk + size, rest);
+    }
+    return chunk;
+}
+
+/* Memory from the free lists, or 0 if nothing fits */
+static void *take(size_t size) {
+    size_t g = size / GRANULE;
+    if (g <= N_EXACT && exact_lists[g]) {
+        struct free_chunk *chunk = exact_lists[g];
+        exact_lists[g] = chunk->next;
+        return chunk;
+    }
+    // A larger exact-size chunk, leaving a remainder that can be listed
+    for (size_t h = g + MIN_CHUNK / GRANULE; h <= N_EXACT; ++h) {
+        if (exact_lists[h]) {
+            struct free_chunk *chunk = exact_lists[h];
+            exact_lists[h] = chunk->next;
+            return split(chunk, size);
+        }
+    }
+    struct free_chunk **link = &large_list;
+    while (*link) {
+        struct free_chunk *chunk = *link;
+        if (chunk->size >= size) {
+            *link = chunk->next;
+            return split(chunk, size);
+        }
+        link = &chunk->next;
+    }
+    return 0;
+}
+
+/* ---------- Public interface ---------- */
+
+void vm_gc_init(size_t heap_size) {
+    assert(heap_start == 0);  // Only one heap
+    heap_size = round_size(heap_size);
+    heap_start = malloc(heap_size);
+    size_t bitmap_bytes = (heap_size / GRANULE + 7) / 8;
+    start_bits = calloc(bitmap_bytes, 1);
+    mark_bits = calloc(bitmap_bytes, 1);
+    if (!heap_start || !start_bits || !mark_bits) {
+        log_error("Cannot allocate a heap of %zu bytes", heap_size);
+        exit(1);
+    }
+    heap_end = heap_start + heap_size;
+    vm_gc_stats.heap_size = heap_size;
+    add_free(heap_start, heap_size);
+    log_debug("Heap of %zu bytes at %p", heap_size, heap_start);
+}
+
+void *vm_gc_alloc(size_t n_bytes) {
+    if (! heap_start) {
+        vm_gc_init(GC_DEFAULT_HEAP_SIZE);
+    }
+    size_t size = round_size(n_bytes);
+    void *p = take(size);
+    if (! p) {
+        vm_gc_collect();
+        p = take(size);
+        if (! p) {
+            log_error("Out of memory: heap of %zu bytes is full "
+                      "(use -H for a larger heap)", vm_gc_stats.heap_size);
+            exit(1);
+        }
+    }
+    set_bit(start_bits, granule(p));
+    vm_gc_stats.objects_allocated += 1;
+    vm_gc_stats.bytes_allocated += size;
+    return p;
+}
+
+/* ---------- Extra roots ---------- */
+
+#define GC_MAX_EXTRA_ROOTS 64
+static obj_ref *extra_roots[GC_MAX_EXTRA_ROOTS];
+static int n_extra_roots = 0;
+
+void vm_gc_push_root(obj_ref *root) {
+    assert(n_extra_roots < GC_MAX_EXTRA_ROOTS);
+    extra_roots[n_extra_roots++] = root;
+}
+
+void vm_gc_pop_roots(int n) {
+    assert(n <= n_extra_roots);
+    n_extra_roots -= n;
+}
+
+/* ---------- Mark ---------- */
+
+/* Marked objects whose fields have not been scanned yet */
+static obj_ref *mark_stack = 0;
+static size_t mark_stack_size = 0;
+static size_t mark_stack_capacity = 0;
+
+static void mark(obj_ref obj) {
+    char *p = (char *) obj;
+    if (! is_heap_object(p) || get_bit(mark_bits, granule(p))) {
+        return;
+    }
+    set_bit(mark_bits, granule(p));
+    if (mark_stack_size == mark_stack_capacity) {
+        mark_stack_capacity = mark_stack_capacity ? 2 * mark_stack_capacity : 1024;
+        mark_stack = realloc(mark_stack, mark_stack_capacity * sizeof(obj_ref));
+        assert(mark_stack);
+    }
+    mark_stack[mark_stack_size++] = obj;
+}
+
+static void mark_from_roots(void) {
+    for (vm_addr w = vm_frame_stack; w && w <= vm_sp; ++w) {
+        mark(w->obj);
+    }
+    vm_for_each_const(mark);
+    for (int i = 0; i < n_extra_roots; ++i) {
+        mark(*extra_roots[i]);
+    }
+    while (mark_stack_size > 0) {
+        obj_ref obj = mark_stack[--mark_stack_size];
+        int n_fields = obj->header.clazz->header.n_fields;
+        obj_ref *fields = obj->fields + obj->header.clazz->header.field_base;
+        for (int i = 0; i < n_fields; ++i) {
+            mark(fields[i]);
+        }
+        if (obj->header.gc_flags & GC_OWNS_ITEMS) {
+            obj_List list = (obj_List) obj;
+            for (int i = 0; i < list->length; ++i) {
+                mark(list->items[i]);
+            }
+        }
+        if (obj->header.gc_flags & GC_OWNS_TABLE) {
+            obj_Dict dict = (obj_Dict) obj;
+            for (int i = 0; i < dict->n_entries; ++i) {
+                if (dict->entries[i].key) {
+                    mark(dict->entries[i].key);
+                    mark(dict->entries[i].value);
+                }
+            }
+        }
+    }
+}
+
+/* ---------- Sweep ---------- */
+
+static void release(obj_ref obj) {
+    if (obj->header.gc_flags & GC_OWNS_TEXT) {
+        free(((obj_String) obj)->text);
+    }
+    if (obj->header.gc_flags & GC_OWNS_ITEMS) {
+        free(((obj_List) obj)->items);
+    }
+    if (obj->header.gc_flags & GC_OWNS_TABLE) {
+        free(((obj_Dict) obj)->slots);
+        free(((obj_Dict) obj)->entries);
+    }
+    if (obj->header.gc_flags & GC_OWNS_BUFFER) {
+        free(((obj_StringBuilder) obj)->text);
+    }
+    obj->header.tag = 0;   // So health checks catch dangling references
+    vm_gc_stats.objects_reclaimed += 1;
+}
+
+static void sweep(void) {
+    memset(exact_lists, 0, sizeof(exact_lists));
+    large_list = 0;
+    char *run = 0;   // Start of the current run of free memory
+    char *p = heap_start;
+    while (p < heap_end) {
+        size_t g = granule(p);
+        size_t size;
+        if (get_bit(start_bits, g)) {
+            size = object_size((obj_ref) p);
+            if (get_bit(mark_bits, g)) {
+                clear_bit(mark_bits, g);
+                if (run) {
+                    add_free(run, p - run);
+                    run = 0;
+                }
+                p += size;
+                continue;
+            }
+            release((obj_ref) p);
+            clear_bit(start_bits, g);
+            vm_gc_stats.bytes_reclaimed += size;
+        } else {
+            size = ((struct free_chunk *) p)->size;
+        }
+        if (! run) {
+            run = p;
+        }
+        p += size;
+    }
+    if (run) {
+        add_free(run, p - run);
+    }
+}
+
+static double now(void) {
+    struct timespec t;
+    clock_gettime(CLOCK_MONOTONIC, &t);
+    return t.tv_sec + t.tv_nsec / 1e9;
+}
+
+void vm_gc_collect(void) {
+    if (! heap_start) {
+        return;
+    }
+    double start = now();
+    mark_from_roots();
+    sweep();
+    double pause = now() - start;
+    vm_gc_stats.collections += 1;
+    vm_gc_stats.pause_seconds += pause;
+    if (pause > vm_gc_stats.max_pause_seconds) {
+        vm_gc_stats.max_pause_seconds = pause;
+    }
+    log_debug("Collection %ld took %.6f seconds",
+              vm_gc_stats.collections, pause);
+}
+
+void vm_gc_report(void) {
+    struct vm_gc_stats *s = &vm_gc_stats;
+    log_info("GC: heap %zu bytes, %ld collections, "
+             "%.6f s total pause (max %.6f s)",
+             s->heap_size, s->collections,
+             s->pause_seconds, s->max_pause_seconds);
+    log_info("GC: allocated %ld objects (%zu bytes), "
+             "reclaimed %ld objects (%zu bytes)",
+             s->objects_allocated, s->bytes_allocated,
+             s->objects_reclaimed, s->bytes_reclaimed);
+}
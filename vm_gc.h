@@ -0,0 +1,71 @@
+/*
+ * The object heap and its garbage collector.
+ *
+ * Objects are allocated in a single arena of fixed size and
+ * reclaimed by mark-sweep collection when an allocation does
+ * not fit.  The roots are the frame stack (from the bottom to
+ * vm_sp), the constant pool, and any references a native method
+ * has registered with vm_gc_push_root.  Class objects are not in
+ * the heap, and neither are the static objects nothing, true,
+ * and false.
+ *
+ * A native method that allocates more than once must register
+ * references it holds in C variables across those allocations,
+ * since only the frame stack is scanned:
+ *
+ *     obj_ref a = new_string(...);
+ *     vm_gc_push_root(&a);
+ *     obj_ref b = new_string(...);   // May collect, but not a
+ *     ...
+ *     vm_gc_pop_roots(1);
+ */
+
+#ifndef TINY_VM_VM_GC_H
+#define TINY_VM_VM_GC_H
+
+#include <stddef.h>
+#include "vm_core.h"
+
+#define GC_DEFAULT_HEAP_SIZE (16 * 1024 * 1024)  // Bytes
+
+/* gc_flags in the object header */
+#define GC_OWNS_TEXT 1   // String whose text is freed with it
+#define GC_OWNS_ITEMS 2  // List whose items are marked, and freed with it
+#define GC_OWNS_TABLE 4  // Dict whose entries are marked, and freed with it
+#define GC_OWNS_BUFFER 8 // StringBuilder whose text is freed with it
+
+/* Create the heap (before loading anything).  If it is not
+ * called, the first allocation creates a heap of the default size.
+ */
+extern void vm_gc_init(size_t heap_size);
+
+/* Allocate n_bytes in the heap, collecting garbage if necessary.
+ * The memory is not initialized.  Exits the vm if the heap is full.
+ */
+extern void *vm_gc_alloc(size_t n_bytes);
+
+/* Collect garbage now */
+extern void vm_gc_collect(void);
+
+/* Extra roots for native methods */
+extern void vm_gc_push_root(obj_ref *root);
+extern void vm_gc_pop_roots(int n);
+
+/* Statistics */
+struct vm_gc_stats {
+    size_t heap_size;
+    long collections;
+    long objects_allocated;
+    size_t bytes_allocated;
+    long objects_reclaimed;
+    size_t bytes_reclaimed;
+    double pause_seconds;       // Total
+    double max_pause_seconds;
+};
+
+extern struct vm_gc_stats vm_gc_stats;
+
+/* Report statistics on stderr (through the logger) */
+extern void vm_gc_report(void);
+
+#endif //TINY_VM_VM_GC_H
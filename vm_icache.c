@@ -0,0 +1,82 @@
+/*
+ * Inline caches for method calls (see vm_icache.h)
+ */
+
+#include "vm_icache.h"
+#include "vm_ops.h"
+#include "logger.h"
+#include <assert.h>
+#include <stdio.h>
+#include <stdlib.h>
+
+/* Sites in order of first execution */
+static struct vm_call_site *first_site = 0;
+static struct vm_call_site *last_site = 0;
+
+struct vm_call_site *vm_new_call_site(int method_index, char *where, int offset) {
+    struct vm_call_site *site = calloc(1, sizeof(struct vm_call_site));
+    assert(site);
+    site->method_index = method_index;
+    site->where = where;
+    site->offset = offset;
+    return site;
+}
+
+/* Is the method [enter, call_native f, return n]?
+ * Then calling f directly has the same effect.
+ */
+static void find_native(struct vm_ic_entry *entry) {
+    vm_addr code = entry->method;
+    entry->native = 0;
+    if (code[0].instr == vm_op_enter
+        && code[1].instr == vm_op_call_native
+        && code[3].instr == vm_op_return) {
+        entry->native = code[2].native;
+        entry->arity = code[4].intval;
+    }
+}
+
+struct vm_ic_entry *vm_ic_miss(struct vm_call_site *site, class_ref clazz) {
+    check_health_class(clazz);
+    site->misses += 1;
+    if (! site->listed) {
+        site->listed = 1;
+        if (last_site) {
+            last_site->next_site = site;
+        } else {
+            first_site = site;
+        }
+        last_site = site;
+    }
+    struct vm_ic_entry *entry;
+    if (site->n_entries < IC_WAYS) {
+        entry = &site->entries[site->n_entries++];
+    } else {
+        site->megamorphic = 1;
+        entry = &site->entries[IC_WAYS - 1];
+    }
+    entry->clazz = clazz;
+    entry->method = clazz->vtable[site->method_index];
+    find_native(entry);
+    log_debug("Call site %s+%d caches %s (%s)", site->where, site->offset,
+              clazz->header.class_name, entry->native ? "native" : "interpreted");
+    return entry;
+}
+
+void vm_ic_report(void) {
+    fprintf(stderr, "%-32s %5s %12s %8s  %s\n",
+            "call site", "slot", "hits", "misses", "receiver classes");
+    for (struct vm_call_site *site = first_site; site; site = site->next_site) {
+        char where[100];
+        snprintf(where, sizeof where, "%s+%d", site->where, site->offset);
+        fprintf(stderr, "%-32s %5d %12ld %8ld ",
+                where, site->method_index, site->hits, site->misses);
+        for (int i = 0; i < site->n_entries; ++i) {
+            struct vm_ic_entry *entry = &site->entries[i];
+            fprintf(stderr, " %s%s", entry->clazz->header.class_name,
+                    entry->native ? "*" : "");
+        }
+        fprintf(stderr, "%s\n", site->megamorphic ? "  (megamorphic)" : "");
+    }
+    fprintf(stderr, "(* = native method called directly)\n");
+}
@@ -0,0 +1,75 @@
+/*
+ * Inline caches for method calls.
+ *
+ * The operand of a call instruction is a call site rather than
+ * a bare vtable slot.  The call site remembers, for the last few
+ * receiver classes seen there, which method the vtable lookup
+ * found, so a call usually costs a comparison of class pointers.
+ * When the method is just a trampoline to a native function
+ * (enter, call_native f, return n), the site also remembers f
+ * and n, and the call invokes f directly without building a
+ * frame.
+ *
+ * A site with more receiver classes than it has entries
+ * (IC_WAYS) is megamorphic;  it keeps replacing its last entry.
+ * Hit and miss counts for each site that has been executed can
+ * be reported at exit (tiny_vm -I).
+ */
+
+#ifndef TINY_VM_VM_ICACHE_H
+#define TINY_VM_VM_ICACHE_H
+
+#include "vm_core.h"
+
+#define IC_WAYS 4   // Receiver classes cached per call site
+
+struct vm_ic_entry {
+    class_ref clazz;      // Receiver class
+    vm_addr method;       // Its method for the call
+    vm_Native native;     // If the method is a native trampoline, the
+    int arity;            // native function and the arguments to pop
+};
+
+struct vm_call_site {
+    int method_index;     // vtable slot
+    char *where;          // Calling method, for the report
+    int offset;           // Word offset of the call in that method
+    int n_entries;
+    int megamorphic;      // Has had more than IC_WAYS classes
+    long hits;
+    long misses;
+    struct vm_ic_entry entries[IC_WAYS];
+    struct vm_call_site *next_site;  // Executed sites, for the report
+    int listed;
+};
+
+/* Operand of a call in hand-written code (built-in methods), e.g.
+ *     {.instr = vm_op_methodcall}, CALL_SITE(2, "Obj:print", 5),
+ */
+#define CALL_SITE(slot, where_text, at) \
+    {.site = &(struct vm_call_site) {.method_index = (slot), \
+                                     .where = (where_text), .offset = (at)}}
+
+/* A call site for the loader */
+extern struct vm_call_site *vm_new_call_site(int method_index,
+                                             char *where, int offset);
+
+/* Fill an entry for clazz after a miss */
+extern struct vm_ic_entry *vm_ic_miss(struct vm_call_site *site, class_ref clazz);
+
+/* The cache entry for a receiver of class clazz */
+static inline struct vm_ic_entry *vm_ic_lookup(struct vm_call_site *site,
+                                               class_ref clazz) {
+    for (int i = 0; i < site->n_entries; ++i) {
+        if (site->entries[i].clazz == clazz) {
+            site->hits += 1;
+            return &site->entries[i];
+        }
+    }
+    return vm_ic_miss(site, clazz);
+}
+
+/* Hits and misses per call site, on stderr */
+extern void vm_ic_report(void);
+
+#endif //TINY_VM_VM_ICACHE_H
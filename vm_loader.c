@@ -4,12 +4,18 @@
 #include "vm_state.h"
 #include "builtins.h" // For constants
 #include "vm_code_table.h" // opcode -> instruction
+#include "vm_icache.h"
 #include "logger.h"
 #include <cjson/cJSON.h>
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
+#include <stdint.h>
 #include <assert.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
 
 
 // Set load library path before loading each class by name.
@@ -17,32 +23,103 @@
 // loads from the class name alone
 static char *PATH_PREFIX = "UNINITIALIZED LOAD PATH";
 
+/* Code is loaded into segments.  The first is vm_code_block;
+ * when a method does not fit in what is left of the current
+ * segment, we start a new one (big enough for the method, if it
+ * is bigger than a segment).  Each method is contiguous, and
+ * nothing moves once loaded.
+ */
+static vm_Word *code_segment = vm_code_block;
+static size_t code_segment_words = CODE_SEGMENT_WORDS;
+
 // Address to load to (pushed forward by each load)
 // Note this is changed in vm_loader_init
 int vm_code_index = 0;  // This actually index, not address
 // And we need the address for methods, so ...
 vm_addr vm_current_address() {
-    return &vm_code_block[vm_code_index];
+    return &code_segment[vm_code_index];
 }
 
+struct vm_loader_stats vm_loader_stats = {.code_segments = 1};
 
+/* Make room for n_words contiguous words of code at vm_current_address() */
+static void reserve_code(int n_words) {
+    vm_loader_stats.code_words += n_words;
+    assert(vm_code_index >= 0 && n_words >= 0);
+    if ((size_t) (vm_code_index + n_words) <= code_segment_words) {
+        return;
+    }
+    code_segment_words = n_words > CODE_SEGMENT_WORDS ? n_words : CODE_SEGMENT_WORDS;
+    code_segment = malloc(code_segment_words * sizeof(vm_Word));
+    if (! code_segment) {
+        log_error("Cannot allocate a code segment of %zu words", code_segment_words);
+        exit(1);
+    }
+    vm_code_index = 0;
+    vm_loader_stats.code_segments += 1;
+    log_debug("New code segment of %zu words at %p", code_segment_words, code_segment);
+}
 
 /* Table of already loaded classes.
  * Note that since each class header contains its name, a simple
- * list of classes references will do; we can look them up by checking
- * the ref->header.name
+ * list of classes references will do, indexed by an open addressing
+ * hash table on the name (0 marks an empty bucket, so bucket
+ * entries are list positions + 1).  Both are doubled as needed.
  */
-#define MAX_CLASSES 100   // And we will behave very badly if you have more
-class_ref loaded_classes[MAX_CLASSES];
-static int n_classes_loaded;
+static class_ref *loaded_classes = 0;
+static int n_classes_loaded = 0;
+static int loaded_capacity = 0;
+static int *class_buckets = 0;
+static unsigned int class_bucket_count = 0;  // Always a power of 2
+
+/* FNV-1a hash of a class name */
+static unsigned int name_hash(char *name) {
+    unsigned int h = 2166136261u;
+    for (char *p = name; *p; ++p) {
+        h ^= (unsigned char) *p;
+        h *= 16777619u;
+    }
+    return h;
+}
+
+/* Bucket holding the class called name, or the empty bucket where it belongs */
+static unsigned int class_bucket(char *name) {
+    unsigned int mask = class_bucket_count - 1;
+    unsigned int b = name_hash(name) & mask;
+    while (class_buckets[b]) {
+        if (strcmp(loaded_classes[class_buckets[b] - 1]->header.class_name, name) == 0) {
+            break;
+        }
+        b = (b + 1) & mask;
+    }
+    return b;
+}
+
+static void grow_class_buckets(void) {
+    free(class_buckets);
+    class_bucket_count = class_bucket_count ? 2 * class_bucket_count : 64;
+    class_buckets = calloc(class_bucket_count, sizeof(int));
+    assert(class_buckets);
+    for (int i = 0; i < n_classes_loaded; ++i) {
+        class_buckets[class_bucket(loaded_classes[i]->header.class_name)] = i + 1;
+    }
+}
 
 /* Add a class reference to the table of loaded classes.
  */
 static void set_loaded(class_ref c) {
-    int slot = n_classes_loaded++;
-    assert(n_classes_loaded < MAX_CLASSES);
-    loaded_classes[slot] = c;
-    return;
+    if (n_classes_loaded == loaded_capacity) {
+        loaded_capacity = loaded_capacity ? 2 * loaded_capacity : 64;
+        loaded_classes = realloc(loaded_classes, loaded_capacity * sizeof(class_ref));
+        assert(loaded_classes);
+    }
+    assert(n_classes_loaded >= 0);
+    if ((unsigned int) (2 * (n_classes_loaded + 1)) >= class_bucket_count) {
+        grow_class_buckets();
+    }
+    loaded_classes[n_classes_loaded++] = c;
+    class_buckets[class_bucket(c->header.class_name)] = n_classes_loaded;
+    vm_loader_stats.classes = n_classes_loaded;
 }
 
 /* Initialize loader
@@ -59,6 +136,9 @@ void vm_loader_init(char *load_path_prefix) {
     set_loaded(the_class_Boolean);
     set_loaded(the_class_Int);
     set_loaded(the_class_Nothing);
+    set_loaded(the_class_List);
+    set_loaded(the_class_Dict);
+    set_loaded(the_class_StringBuilder);
     // We'll leave a little room for a "main" code sequence
     // at the beginning
     vm_code_index = 16;
@@ -67,13 +147,13 @@ void vm_loader_init(char *load_path_prefix) {
     vm_code_block[0] = (vm_Word) {.instr = vm_op_const};
     vm_code_block[1] = (vm_Word) {.intval = no_main};
     vm_code_block[2] = (vm_Word) {.instr = vm_op_methodcall};
-    vm_code_block[3] = (vm_Word) {.intval = 2}; // "print" method
+    vm_code_block[3] = (vm_Word) {.site = vm_new_call_site(2, "$main", 2)}; // "print" method
     vm_code_block[4] = (vm_Word) {.instr = vm_op_halt};
     //
     // The named constant literals
-    create_const_value("$nothing", nothing);
-    create_const_value("$true", lit_true);
-    create_const_value("$false", lit_false);
+    create_const_value(the_class_Nothing, "$nothing", nothing);
+    create_const_value(the_class_Boolean, "$true", lit_true);
+    create_const_value(the_class_Boolean, "$false", lit_false);
 }
 
 /* When everything is loaded, we can patch in a call to the
@@ -86,7 +166,7 @@ void vm_loader_set_main(char *main_class_name) {
     vm_code_block[0] = (vm_Word) {.instr = vm_op_new};
     vm_code_block[1] = (vm_Word) {.clazz = main_class};
     vm_code_block[2] = (vm_Word) {.instr = vm_op_methodcall};
-    vm_code_block[3] = (vm_Word) {.intval = 0}; // Constructor method slot
+    vm_code_block[3] = (vm_Word) {.site = vm_new_call_site(0, "$main", 2)}; // Constructor method slot
     vm_code_block[4] = (vm_Word) {.instr = vm_op_pop};
     vm_code_block[5] = (vm_Word) {.instr = vm_op_halt};
 }
@@ -96,12 +176,11 @@ void vm_loader_set_main(char *main_class_name) {
  * or return 0 indicating class is not loaded.
  */
 class_ref find_loaded(char *name) {
-    for (int i=0; i < n_classes_loaded; ++i) {
-        if (strcmp(loaded_classes[i]->header.class_name, name) == 0) {
-            return loaded_classes[i];
-        }
+    if (class_bucket_count == 0) {
+        return 0;
     }
-    return 0;
+    int position = class_buckets[class_bucket(name)];
+    return position ? loaded_classes[position - 1] : 0;
 }
 
 class_ref ensure_loaded(char *class_name) {
@@ -118,35 +197,43 @@ class_ref ensure_loaded(char *class_name) {
 
 
 
-// Capacity limit:  For simplicity we read into a
-// buffer of 20k bytes.
-//
-#define FILE_BUFFER_CAPACITY (1024 * 100 * sizeof(char))
-
-
-/* read_file_fd
- * returns 0 (failure) or 1 (success)
+/* The contents of an object code file, in either format.
+ * Names and code words point into the parsed JSON tree or
+ * the mapped binary file, so they are valid only while that
+ * module is being loaded.  The layout of both formats is
+ * described in objfile.py.
  */
-int read_file_fd(FILE *fd, char *file_buffer) {
-    int pos = 0;
-    char ch;
-    /* Simple, not efficient. */
-    while (1) {
-        ch = fgetc(fd);
-        if (feof(fd)) {
-            break;
-        } else if (ferror(fd)) {
-            perror("Error reading file");
-            break;
-        }
-        file_buffer[pos++] = ch;
-    }
-    // Do we need to add the null byte?  Maybe.
-    file_buffer[pos] = 0;
-    return 1;
+struct method_image {
+    char *name;
+    int slot;
+    int n_words;
+    int32_t *words;
+};
+
+struct module_image {
+    char *class_name;
+    char *super_name;
+    int n_fields;
+    int n_methods;
+    int n_inherited;
+    int n_constants;
+    char **const_kinds;
+    char **const_values;
+    int n_imports;
+    char **imports;
+    int n_code;
+    struct method_image *code;
+};
+
+static void free_module_image(struct module_image *m) {
+    free(m->const_kinds);
+    free(m->const_values);
+    free(m->imports);
+    free(m->code);
 }
 
-vm_Word *translate_method_code(cJSON *ops, int const_map[], class_ref class_map[]);
+vm_Word *translate_method_code(char *class_name, struct method_image *method,
+                               int const_map[], class_ref class_map[]);
 
 /*
  * Constants in a class file (.json) are referenced as small
@@ -158,25 +245,16 @@ vm_Word *translate_method_code(cJSON *ops, int const_map[], class_ref class_map[
  * (Java, in contrast, maintains a separate constant pool for each
  * class at run-time.)
  */
-static int remap_constants(int map[], cJSON *tree, int capacity) {
-    cJSON *constants = cJSON_GetObjectItemCaseSensitive(tree,
-                                           "constants");
-    if (constants == NULL) {
-        perror("Missing 'constants' element in json");
-        return 0;
-    }
+static int remap_constants(int map[], struct module_image *m) {
     int literal_count = 0;
-    cJSON *el;
-    cJSON_ArrayForEach(el, constants) {
-        cJSON *kind_el = cJSON_GetObjectItemCaseSensitive(el, "kind");
-        cJSON *value_el = cJSON_GetObjectItemCaseSensitive(el, "value");
-        char *kind = kind_el->valuestring;
-        char *literal = value_el->valuestring;
-        int internal;
+    for (int i = 0; i < m->n_constants; ++i) {
+        char *kind = m->const_kinds[i];
+        char *literal = m->const_values[i];
+        int internal = 0;
         if (kind[0] == 'i') {
             internal = int_literal_const(literal);
         } else if (kind[0] == 's') {
-            internal = str_literal_const(strdup(literal));
+            internal = str_literal_const(literal);
         } else {
             perror("Constant of unknown type");
         }
@@ -184,81 +262,69 @@ static int remap_constants(int map[], cJSON *tree, int capacity) {
         log_debug("Literal %s internal %d remapped to %d",
                   literal, literal_count, internal);
         ++literal_count;
-        assert(literal_count < capacity);
     }
     return literal_count; // Actually it's the count - 1
 }
 
-/*  Object code in .json file refers to classes by index of its
+/*  Object code refers to classes by index of its
  * "imports" list.  We
  *  need to make sure each referenced class is loaded, and to
  *  map those indexes to actual references to loaded classes.
  */
-static int map_classes(class_ref class_map[], cJSON *tree, int capacity) {
+static int map_classes(class_ref class_map[], struct module_image *m) {
     int class_count = 0;
-    cJSON *imports = cJSON_GetObjectItemCaseSensitive(tree,
-                                                        "imports");
-    if (imports == NULL) {
-        perror("Missing 'imports' element in json");
-        return 0;
-    }
-    assert(cJSON_IsArray(imports));
-    cJSON *el = imports->child;
-    while (el) {
-        assert(class_count < capacity);
-        char *class_name = el->valuestring;
+    for (int i = 0; i < m->n_imports; ++i) {
+        char *class_name = m->imports[i];
         class_ref clazz = ensure_loaded(class_name);
         class_map[class_count] = clazz;
         ++class_count;
-        el = el->next;
     }
     return class_count; // Actually it's the count - 1
 }
 
 
-static int load_json(char buf[]) {
-    cJSON *tree = NULL; // Tree as a whole
-    cJSON *val = NULL;  // Named value in tree
-    cJSON *el = NULL;   // Element of value
-    tree = cJSON_Parse(buf);  // Must free at end
-    if (tree == NULL) {
-        perror("load_json in vm_loader.c: Failed to parse buffer. ");
-        assert(tree);  // Will definitely abort
-    }
-
+static int load_module(struct module_image *m) {
     /* module constant index -> global constant index */
-    int constant_renumber_map[30];
-    int n_consts = remap_constants(constant_renumber_map, tree, 30);
+    int *constant_renumber_map = malloc((m->n_constants + 1) * sizeof(int));
+    int n_consts = remap_constants(constant_renumber_map, m);
 
     // Mapping imported classes was here; moving AFTER we
     // create and index this class so that it can reference itself
 
     // Create and initialize a class object
     // push_log_level(DEBUG);
-    char *class_name = cJSON_GetStringValue(
-            cJSON_GetObjectItemCaseSensitive(tree, "class_name"));
-    char *super_name = cJSON_GetStringValue(
-            cJSON_GetObjectItemCaseSensitive(tree, "super"));
+    char *class_name = m->class_name;
+    char *super_name = m->super_name;
     log_info("Class %s extends %s", class_name, super_name);
     // Counts of methods and fields; I'm letting the assembler do the work here.
-    int n_fields = (int) cJSON_GetNumberValue(
-            cJSON_GetObjectItemCaseSensitive(tree, "n_fields"));
-    int n_methods = (int) cJSON_GetNumberValue(
-            cJSON_GetObjectItemCaseSensitive(tree, "n_methods"));
+    int n_fields = m->n_fields;
+    int n_methods = m->n_methods;
     log_info("Class %s has %d methods and %d fields",
              class_name, n_methods, n_fields);
     size_t class_obj_size =
             sizeof(struct class_header_struct)
             + n_methods * sizeof(vm_Word);
-    size_t obj_size = sizeof(struct obj_header_struct) + n_fields * sizeof(vm_Word);
     class_ref the_super = ensure_loaded(super_name);
     assert(the_super); // Error if we can't find the superclass
+    /* A builtin superclass like List keeps native state after the
+     * object header, where the assembler knows nothing of it.  Our
+     * fields go after that state, so the native methods we inherit
+     * find it where they expect.
+     */
+    size_t super_words =
+            (the_super->header.object_size - sizeof(struct obj_header_struct)
+             + sizeof(vm_Word) - 1) / sizeof(vm_Word);
+    int field_base = (int) super_words - the_super->header.n_fields;
+    size_t obj_size = sizeof(struct obj_header_struct)
+            + (field_base + n_fields) * sizeof(vm_Word);
     class_ref the_class = (class_ref) malloc(class_obj_size);
     the_class->header = (struct class_header_struct) {
             .class_name = strdup(class_name),
             .healthy_class_tag = HEALTHY,
             .n_fields = n_fields,
+            .field_base = field_base,
             .object_size = obj_size,
+            .gc_flags = the_super->header.gc_flags,
             .super = the_super
     };
     log_debug("Class %s class object size %d with %d methods",
@@ -268,8 +334,7 @@ static int load_json(char buf[]) {
     log_debug("Size of object header alone is %d bytes\n",
              sizeof(struct obj_header_struct));
     // Copy inherited method pointers into vtable
-    int n_inherited = (int) cJSON_GetNumberValue(
-            cJSON_GetObjectItemCaseSensitive(tree, "n_inherited"));
+    int n_inherited = m->n_inherited;
     for (int i = 0; i < n_inherited; ++i) {
         the_class->vtable[i] = the_super->vtable[i];
     }
@@ -282,112 +347,364 @@ static int load_json(char buf[]) {
     /* module class index -> class reference,
     * with potential side effect of loading more class files.
     */
-    class_ref class_map[30];
-    int n_classes = map_classes(class_map, tree, 30);
+    class_ref *class_map = malloc((m->n_imports + 1) * sizeof(class_ref));
+    int n_classes = map_classes(class_map, m);
 
-
-    cJSON *code_table = cJSON_GetObjectItemCaseSensitive(tree, "code");
-    assert(code_table);  // Abort if it wasn't present
-    assert(cJSON_IsArray(code_table));  // Should be an array of methods
-    cJSON_ArrayForEach(el, code_table) {
-        char *method_name = cJSON_GetStringValue(
-                cJSON_GetObjectItemCaseSensitive(el, "name"));
-        int method_slot = (int) cJSON_GetNumberValue(
-                cJSON_GetObjectItemCaseSensitive(el, "slot"));
-        cJSON *ops = cJSON_GetObjectItemCaseSensitive(el, "code");
+    for (int i = 0; i < m->n_code; ++i) {
+        struct method_image *method = &m->code[i];
         vm_Word *method_start_addr =
-                translate_method_code(ops, constant_renumber_map, class_map);
-        the_class->vtable[method_slot] = method_start_addr;
+                translate_method_code(class_name, method,
+                                      constant_renumber_map, class_map);
+        the_class->vtable[method->slot] = method_start_addr;
     }
-    cJSON_Delete(tree);
+    free(class_map);
+    free(constant_renumber_map);
     return 1;
 }
 
-vm_Word *translate_method_code(cJSON *ops, int const_map[], class_ref class_map[]) {
+/* Translate one operand of a basic operation.  The operand of
+ * a call (a vtable slot) becomes a call site with an inline cache,
+ * described for reports by where (the method) and the offset of
+ * the instruction in it.
+ */
+static void translate_operand(vm_Instr instr, int operand,
+                              int const_map[], class_ref class_map[],
+                              char *where, int offset) {
+    log_debug("[%d] Operand: %d", vm_code_index, operand);
+    if (instr == vm_op_const) {
+        int const_index;
+        if (operand == CODE_FALSE) {
+            const_index = lookup_const_index(the_class_Boolean, "$false");
+        } else if (operand == CODE_TRUE) {
+            const_index = lookup_const_index(the_class_Boolean, "$true");
+        } else if (operand == CODE_NOTHING) {
+            const_index = lookup_const_index(the_class_Nothing, "$nothing");
+        } else {
+            assert(operand >= 0);
+            const_index = const_map[operand];
+        }
+        assert(const_index);
+        check_health_object(get_const_value(const_index));
+        code_segment[vm_code_index++] = (vm_Word)
+                {.intval=  const_index};
+    } else if (instr == vm_op_methodcall) {
+        code_segment[vm_code_index++] = (vm_Word)
+                {.site = vm_new_call_site(operand, where, offset)};
+    } else if(instr == vm_op_new || instr == vm_op_is_instance) {
+        class_ref clazz = class_map[operand];
+        log_debug("Translating allocation of new '%s'",
+                  clazz->header.class_name);
+        code_segment[vm_code_index++] = (vm_Word)
+                {.clazz = clazz};
+    } else {
+        code_segment[vm_code_index++] = (vm_Word)
+                {.intval = operand};
+    }
+}
+
+vm_Word *translate_method_code(char *class_name, struct method_image *method,
+                               int const_map[], class_ref class_map[]) {
     // Translating code.  Constants must be renumbered since local
     // constant number is not global constant number.
-    assert (cJSON_IsArray(ops));
-    cJSON *el = ops->child;
+    // Each word of object code becomes one word of loaded code.
+    reserve_code(method->n_words);
     vm_Word *method_start_address = vm_current_address();
-    while (el) {
-        assert(cJSON_IsNumber(el));
-        int opcode = el->valueint;
+    char *where;   // Shared by the call sites in this method
+    asprintf(&where, "%s:%s", class_name, method->name);
+    int pos = 0;
+    while (pos < method->n_words) {
+        int opcode = method->words[pos];
+        int offset = vm_current_address() - method_start_address;
         log_debug("[%d] Op: %d (%s)",
-               vm_current_address() - vm_code_block,
-               opcode, vm_op_bytecodes[opcode].name);
-        vm_code_block[vm_code_index++] = (vm_Word)
+               vm_code_index, opcode, vm_op_bytecodes[opcode].name);
+        code_segment[vm_code_index++] = (vm_Word)
                 {.instr = vm_op_bytecodes[opcode].instr};
 
-        if (vm_op_bytecodes[opcode].n_operands) {
-            // Max is 1 operand!
-            el = el->next;
-            int operand = el->valueint;
-            log_debug("[%d] Operand: %d",
-                      vm_current_address() - vm_code_block,
-                      operand);
-            if (vm_op_bytecodes[opcode].instr == vm_op_const) {
-                int const_index;
-                if (operand == CODE_FALSE) {
-                    const_index = lookup_const_index("$false");
-                } else if (operand == CODE_TRUE) {
-                    const_index = lookup_const_index("$true");
-                } else if (operand == CODE_NOTHING) {
-                    const_index = lookup_const_index("$nothing");
-                } else {
-                    assert(operand >= 0);
-                    const_index = const_map[operand];
-                }
-                assert(const_index);
-                check_health_object(get_const_value(const_index));
-                vm_code_block[vm_code_index++] = (vm_Word)
-                        {.intval=  const_index};
-            } else if(vm_op_bytecodes[opcode].instr == vm_op_new
-                      || vm_op_bytecodes[opcode].instr == vm_op_is_instance) {
-                class_ref clazz = class_map[operand];
-                log_debug("Translating allocation of new '%s'",
-                          clazz->header.class_name);
-                vm_code_block[vm_code_index++] = (vm_Word)
-                        {.clazz = clazz};
-            } else {
-                vm_code_block[vm_code_index++] = (vm_Word)
-                        {.intval = operand};
+        // A superinstruction is followed by the operands of its
+        // parts, in order; each is translated according to its part.
+        int n_parts = vm_op_bytecodes[opcode].n_parts;
+        int *parts = vm_op_bytecodes[opcode].parts;
+        if (n_parts == 0) {
+            n_parts = 1;
+            parts = &opcode;
+        }
+        for (int i = 0; i < n_parts; ++i) {
+            op_tbl_entry *part = &vm_op_bytecodes[parts[i]];
+            // Max is 1 operand per part!
+            if (part->n_operands) {
+                ++pos;
+                assert(pos < method->n_words);
+                translate_operand(part->instr, method->words[pos],
+                                  const_map, class_map, where, offset);
             }
         }
-        el = el->next;
+        ++pos;
     }
+    assert(vm_current_address() == method_start_address + method->n_words);
     return method_start_address;
 }
 
+/* ----------------- JSON object code ---------------- */
 
+/* Names in a JSON array, as a malloced array of pointers
+ * into the tree.  Returns the number of names.
+ */
+static int json_names(cJSON *tree, char *key, char ***names) {
+    cJSON *array = cJSON_GetObjectItemCaseSensitive(tree, key);
+    if (array == NULL) {
+        log_error("Missing '%s' element in json", key);
+        *names = 0;
+        return 0;
+    }
+    assert(cJSON_IsArray(array));
+    int n = cJSON_GetArraySize(array);
+    *names = malloc((n + 1) * sizeof(char *));
+    int i = 0;
+    cJSON *el;
+    cJSON_ArrayForEach(el, array) {
+        (*names)[i++] = el->valuestring;
+    }
+    return n;
+}
 
-/* Load an "object" file (json format) from
- * a class name.
+static int load_json(char buf[], size_t length) {
+    cJSON *tree = NULL; // Tree as a whole
+    cJSON *el = NULL;   // Element of value
+    tree = cJSON_ParseWithLength(buf, length);  // Must free at end
+    if (tree == NULL) {
+        perror("load_json in vm_loader.c: Failed to parse buffer. ");
+        assert(tree);  // Will definitely abort
+    }
+    struct module_image m;
+    m.class_name = cJSON_GetStringValue(
+            cJSON_GetObjectItemCaseSensitive(tree, "class_name"));
+    m.super_name = cJSON_GetStringValue(
+            cJSON_GetObjectItemCaseSensitive(tree, "super"));
+    m.n_fields = (int) cJSON_GetNumberValue(
+            cJSON_GetObjectItemCaseSensitive(tree, "n_fields"));
+    m.n_methods = (int) cJSON_GetNumberValue(
+            cJSON_GetObjectItemCaseSensitive(tree, "n_methods"));
+    m.n_inherited = (int) cJSON_GetNumberValue(
+            cJSON_GetObjectItemCaseSensitive(tree, "n_inherited"));
+    m.n_imports = json_names(tree, "imports", &m.imports);
+
+    cJSON *constants = cJSON_GetObjectItemCaseSensitive(tree, "constants");
+    m.n_constants = cJSON_GetArraySize(constants);
+    m.const_kinds = malloc((m.n_constants + 1) * sizeof(char *));
+    m.const_values = malloc((m.n_constants + 1) * sizeof(char *));
+    int i = 0;
+    cJSON_ArrayForEach(el, constants) {
+        m.const_kinds[i] = cJSON_GetStringValue(
+                cJSON_GetObjectItemCaseSensitive(el, "kind"));
+        m.const_values[i] = cJSON_GetStringValue(
+                cJSON_GetObjectItemCaseSensitive(el, "value"));
+        ++i;
+    }
+
+    cJSON *code_table = cJSON_GetObjectItemCaseSensitive(tree, "code");
+    assert(code_table);  // Abort if it wasn't present
+    assert(cJSON_IsArray(code_table));  // Should be an array of methods
+    m.n_code = cJSON_GetArraySize(code_table);
+    m.code = malloc((m.n_code + 1) * sizeof(struct method_image));
+    i = 0;
+    cJSON_ArrayForEach(el, code_table) {
+        struct method_image *method = &m.code[i++];
+        method->name = cJSON_GetStringValue(
+                cJSON_GetObjectItemCaseSensitive(el, "name"));
+        method->slot = (int) cJSON_GetNumberValue(
+                cJSON_GetObjectItemCaseSensitive(el, "slot"));
+        cJSON *ops = cJSON_GetObjectItemCaseSensitive(el, "code");
+        assert(cJSON_IsArray(ops));
+        method->n_words = cJSON_GetArraySize(ops);
+        method->words = malloc((method->n_words + 1) * sizeof(int32_t));
+        int pos = 0;
+        cJSON *op;
+        cJSON_ArrayForEach(op, ops) {
+            assert(cJSON_IsNumber(op));
+            method->words[pos++] = op->valueint;
+        }
+    }
+
+    int ok = load_module(&m);
+    for (i = 0; i < m.n_code; ++i) {
+        free(m.code[i].words);
+    }
+    free_module_image(&m);
+    cJSON_Delete(tree);
+    return ok;
+}
+
+/* ---------------- Binary object code --------------- */
+
+#define BINARY_MAGIC "TVMO"
+#define BINARY_VERSION 1
+
+/* Cursor over the 32-bit words of a mapped binary object file.
+ * The format is little-endian, as are the machines we run on.
+ */
+struct word_cursor {
+    int32_t *pos;
+    int32_t *end;
+    int ok;     // Cleared if we try to read past the end
+};
+
+static int32_t next_word(struct word_cursor *c) {
+    if (c->pos >= c->end) {
+        c->ok = 0;
+        return 0;
+    }
+    return *c->pos++;
+}
+
+/* Table of n names given as string table indexes */
+static char **binary_names(struct word_cursor *c, char *strings[],
+                           int n_strings, int n) {
+    char **names = malloc((n + 1) * sizeof(char *));
+    for (int i = 0; i < n; ++i) {
+        int32_t index = next_word(c);
+        if (index < 0 || index >= n_strings) {
+            c->ok = 0;
+            index = 0;
+        }
+        names[i] = strings[index];
+    }
+    return names;
+}
+
+static int load_binary(char buf[], size_t length) {
+    struct word_cursor c = {
+            .pos = (int32_t *) buf, .end = (int32_t *) (buf + length), .ok = 1};
+    next_word(&c);  // Magic number, checked by caller
+    int32_t version = next_word(&c);
+    if (version != BINARY_VERSION) {
+        log_error("Unsupported object file version %d", version);
+        return 0;
+    }
+    /* String table:  Each string is in place in the mapped file,
+     * zero terminated and padded to a word boundary.
+     */
+    int n_strings = next_word(&c);
+    char **strings = malloc((n_strings + 1) * sizeof(char *));
+    for (int i = 0; c.ok && i < n_strings; ++i) {
+        int32_t n_bytes = next_word(&c);
+        if (n_bytes < 0 || n_bytes / 4 + 1 > c.end - c.pos) {
+            c.ok = 0;
+            break;
+        }
+        strings[i] = (char *) c.pos;
+        c.pos += n_bytes / 4 + 1;
+    }
+    if (! c.ok || n_strings < 1) {
+        log_error("Malformed string table in binary object file");
+        free(strings);
+        return 0;
+    }
+    struct module_image m;
+    char **names = binary_names(&c, strings, n_strings, 2);
+    m.class_name = names[0];
+    m.super_name = names[1];
+    free(names);
+    m.n_fields = next_word(&c);
+    m.n_methods = next_word(&c);
+    m.n_inherited = next_word(&c);
+    /* The method and field names are only needed by the assembler */
+    int n_names = next_word(&c);
+    free(binary_names(&c, strings, n_strings, c.ok ? n_names : 0));
+    n_names = next_word(&c);
+    free(binary_names(&c, strings, n_strings, c.ok ? n_names : 0));
+    m.n_imports = next_word(&c);
+    m.imports = binary_names(&c, strings, n_strings, c.ok ? m.n_imports : 0);
+    m.n_constants = next_word(&c);
+    if (! c.ok || m.n_constants < 0 || m.n_constants > c.end - c.pos) {
+        m.n_constants = 0;
+        c.ok = 0;
+    }
+    m.const_kinds = malloc((m.n_constants + 1) * sizeof(char *));
+    m.const_values = malloc((m.n_constants + 1) * sizeof(char *));
+    for (int i = 0; i < m.n_constants; ++i) {
+        names = binary_names(&c, strings, n_strings, 2);
+        m.const_kinds[i] = names[0];
+        m.const_values[i] = names[1];
+        free(names);
+    }
+    m.n_code = next_word(&c);
+    if (! c.ok || m.n_code < 0 || m.n_code > c.end - c.pos) {
+        m.n_code = 0;
+        c.ok = 0;
+    }
+    m.code = malloc((m.n_code + 1) * sizeof(struct method_image));
+    for (int i = 0; c.ok && i < m.n_code; ++i) {
+        struct method_image *method = &m.code[i];
+        names = binary_names(&c, strings, n_strings, 1);
+        method->name = names[0];
+        free(names);
+        method->slot = next_word(&c);
+        method->n_words = next_word(&c);
+        if (method->n_words < 0 || method->n_words > c.end - c.pos) {
+            c.ok = 0;
+            break;
+        }
+        // Code words are used in place
+        method->words = c.pos;
+        c.pos += method->n_words;
+    }
+    int ok = c.ok;
+    if (ok) {
+        ok = load_module(&m);
+    } else {
+        log_error("Binary object file is truncated or malformed");
+    }
+    free_module_image(&m);
+    free(strings);
+    return ok;
+}
+
+
+/* Load an object file from a class name, preferring
+ * the binary format if both are present.
  */
 #define PATHBUFSIZE 4096
 extern int vm_load_class(char *classname) {
     char load_path[PATHBUFSIZE];
     // Use printf for multi-concat
-    snprintf(load_path, PATHBUFSIZE, "%s/%s.json", PATH_PREFIX, classname);
+    snprintf(load_path, PATHBUFSIZE, "%s/%s.tvm", PATH_PREFIX, classname);
+    if (access(load_path, R_OK) != 0) {
+        snprintf(load_path, PATHBUFSIZE, "%s/%s.json", PATH_PREFIX, classname);
+    }
     log_info("Loading %s", load_path);
     return vm_load_from_path(load_path);
 }
 
 
+/* Object files are mapped into memory rather than read,
+ * so there is no limit on their size.  The format is
+ * recognized by the magic number at the start of binary files.
+ */
 int vm_load_from_path(char *path) {
-    char file_buffer[FILE_BUFFER_CAPACITY];
-    FILE *fd = fopen(path, "r");
-    if (! fd) {
+    int fd = open(path, O_RDONLY);
+    if (fd < 0) {
         perror("Failed to open file");
         return 0;
     }
+    struct stat file_stat;
+    if (fstat(fd, &file_stat) != 0 || file_stat.st_size == 0) {
+        log_error("Cannot load empty or unreadable file %s", path);
+        close(fd);
+        return 0;
+    }
+    size_t length = file_stat.st_size;
+    char *buf = mmap(0, length, PROT_READ, MAP_PRIVATE, fd, 0);
+    close(fd);
+    if (buf == MAP_FAILED) {
+        perror("Failed to map file");
+        return 0;
+    }
     int ok;
-    ok = read_file_fd(fd, file_buffer);
-    if (ok) {
-        cJSON *jobj = cJSON_Parse(file_buffer);
-        ok = (jobj != NULL);
+    if (length >= 4 && memcmp(buf, BINARY_MAGIC, 4) == 0) {
+        ok = load_binary(buf, length);
+    } else {
+        ok = load_json(buf, length);
     }
-    assert(ok);
-    ok = load_json(file_buffer);
-    fclose(fd);
+    munmap(buf, length);
     return ok;
 }
@@ -3,13 +3,22 @@
 #ifndef TINY_VM_VM_LOADER_H
 #define TINY_VM_VM_LOADER_H
 
+#include <stddef.h>
 #include "vm_core.h"
 
-/* Loading normally starts at address 0,
- * but may be controlled through vm_code_index.
+/* Loading normally starts at address 0 of the current code
+ * segment, but may be controlled through vm_code_index.
  */
 extern int vm_code_index;
 
+/* What has been loaded, for tiny_vm -S */
+struct vm_loader_stats {
+    int classes;         // Including the built-in classes
+    size_t code_words;   // Of loaded methods
+    int code_segments;
+};
+extern struct vm_loader_stats vm_loader_stats;
+
 /* Initialize loader (loads built-in classes)
  */
 extern void vm_loader_init(char *load_path_prefix);
@@ -24,12 +33,12 @@ void vm_loader_set_main(char *main_class_name);
  */
 extern class_ref find_loaded(char *name);
 
-/* Load an "object" file (json format) from
- * a class name.
+/* Load an "object" file from a class name, in
+ * binary format (Class.tvm) if present, else Class.json.
  */
 extern int vm_load_class(char *classname);
 
-/* Load an "object" file, which should be in JSON format.
+/* Load an "object" file, in JSON or binary format.
  * Return 1 = success, 0 = failure.
  */
 extern int vm_load_from_path(char *path);
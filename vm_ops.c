@@ -5,9 +5,13 @@
 #include "vm_ops.h"
 #include "vm_state.h"
 #include "builtins.h"  // For literals lit_true, lit_false, nothing
+#include "vm_gc.h"
+#include "vm_icache.h"
+#include "vm_output.h"
 #include "logger.h"
 #include <stdlib.h>
 #include <stdio.h>
+#include <string.h>
 #include <assert.h>
 
 /*  Push inline constant (by constant table index).
@@ -23,8 +27,9 @@ void vm_op_const(void) {
     return;
 }
 
-/* Halt the virtual machine */
+/* Halt the virtual machine, writing out buffered output */
 void vm_op_halt(void) {
+    vm_output_flush();
     vm_run_state = VM_HALTED;
 }
 
@@ -66,10 +71,27 @@ extern void vm_op_jump_ifnot() {
 /* Call a method on an object; the object
  * should be on the eval stack, and the
  * next word in the instruction stream should
- * be the index of the native_method in the vtable.
+ * be the call site, which holds the index of the
+ * method in the vtable and an inline cache of
+ * the methods found there (see vm_icache.h).
  */
 extern void vm_op_methodcall(void) {
-    int method_index = vm_fetch_next().intval;
+    struct vm_call_site *site = vm_fetch_next().site;
+    obj_ref receiver = (*vm_sp).obj;
+    check_health_object(receiver);
+    struct vm_ic_entry *target = vm_ic_lookup(site, receiver->header.clazz);
+    if (target->native) {
+        // What the trampoline would do, without the frame:  The
+        // native function finds "this" at fp and its arguments below.
+        vm_addr caller_fp = vm_fp;
+        vm_fp = vm_sp;
+        obj_ref result = target->native();
+        check_health_object(result);
+        vm_fp = caller_fp;
+        vm_sp -= target->arity;
+        (*vm_sp).obj = result;
+        return;
+    }
     // New "this" will be receiver object
     vm_addr new_fp = vm_sp;
     // Save program counter for return
@@ -77,14 +99,7 @@ extern void vm_op_methodcall(void) {
     // Save caller's frame pointer
     vm_frame_push_word((vm_Word) {.frame_addr = vm_fp});
     vm_fp = new_fp;
-    // Address of code for called method, found in the
-    // class vtable.
-    obj_ref receiver = (*vm_fp).obj;
-    check_health_object(receiver);
-    class_ref clazz = receiver->header.clazz;
-    check_health_class(clazz);
-    vm_addr method_addr = clazz->vtable[method_index];
-    vm_pc = method_addr;
+    vm_pc = target->method;
     return;
 }
 
@@ -154,19 +169,47 @@ extern void vm_op_return() {
 extern obj_ref vm_new_obj(class_ref clazz) {
     check_health_class(clazz);
     log_debug("Allocating a new object of type %s\n", clazz->header.class_name);
-    obj_ref new_thing = (obj_ref) malloc(clazz->header.object_size);
+    obj_ref new_thing = (obj_ref) vm_gc_alloc(clazz->header.object_size);
     new_thing->header.clazz = clazz;
     new_thing->header.tag = GOOD_OBJ_TAG;
-    for (int i=0; i < clazz->header.n_fields; ++i) {
-        new_thing->fields[i] = nothing;
+    new_thing->header.gc_flags = clazz->header.gc_flags;
+    /* Native state (e.g., of a List) starts out zero, which the
+     * builtin methods take as empty, in case a subclass constructor
+     * does not call the builtin one.  Fields come after it.
+     */
+    int n_fields = clazz->header.n_fields;
+    size_t state_size = clazz->header.object_size
+            - sizeof(struct obj_header_struct) - n_fields * sizeof(obj_ref);
+    memset(new_thing->fields, 0, state_size);
+    int base = clazz->header.field_base;
+    for (int i=0; i < n_fields; ++i) {
+        new_thing->fields[base + i] = nothing;
     }
     return new_thing;
 }
 
+/* Instances of Bool, Nothing, and Int are immutable and shared:
+ * "new" provides the canonical one (false, nothing, or 0) for the
+ * constructor, rather than a fresh object that would be garbage.
+ */
+static obj_ref canonical_instance(class_ref clazz) {
+    if (clazz == the_class_Boolean) {
+        return lit_false;
+    } else if (clazz == the_class_Nothing) {
+        return nothing;
+    } else if (clazz == the_class_Int) {
+        return new_int(0);
+    }
+    return 0;
+}
+
 extern void vm_op_new(void) {
     class_ref clazz = vm_fetch_next().clazz;
     check_health_class(clazz);
-    obj_ref new_thing = vm_new_obj(clazz);
+    obj_ref new_thing = canonical_instance(clazz);
+    if (! new_thing) {
+        new_thing = vm_new_obj(clazz);
+    }
     check_health_object(new_thing);
     vm_eval_push(new_thing);
     return;
@@ -277,7 +320,8 @@ extern void vm_op_load_field() {
     check_health_object(the_obj);
     log_debug("Loading field %d from %s object\n", field_slot,
               the_obj->header.clazz->header.class_name);
-    obj_ref val = the_obj->fields[field_slot];
+    int base = the_obj->header.clazz->header.field_base;
+    obj_ref val = the_obj->fields[base + field_slot];
     check_health_object(val);
     vm_frame_push_word((vm_Word) {.obj=val});
 }
@@ -304,6 +348,7 @@ extern void vm_op_store_field() {
               value->header.clazz->header.class_name,
               field_slot,
               target_obj->header.clazz->header.class_name);
-    target_obj->fields[field_slot] = value;
+    int base = target_obj->header.clazz->header.field_base;
+    target_obj->fields[base + field_slot] = value;
     // pop_log_level();
 }
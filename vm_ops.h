@@ -19,7 +19,8 @@ extern void vm_op_halt(void);
 
 /* Call a method (virtual function) indirectly
  * through the vtable of an object's class.
- * Next word should be method index.
+ * Next word should be a call site (vm_icache.h),
+ * which holds the method index.
  *
  * vm_op_methodcall(m_index): [arg, arg, ...,  receiver] -> [result]
  */
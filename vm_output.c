@@ -0,0 +1,73 @@
+/*
+ * Buffered output for the print methods (see vm_output.h)
+ */
+
+#include "vm_output.h"
+#include "logger.h"
+#include <assert.h>
+#include <errno.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+
+struct vm_output_stats vm_output_stats = {0};
+
+static int output_fd = STDOUT_FILENO;
+static char *buffer = 0;
+static size_t capacity = 0;
+static size_t used = 0;
+static int failed = 0;    // Report a failed write only once
+
+/* Write all of text, unless the output is gone */
+static void write_all(const char *text, size_t length) {
+    while (length > 0 && ! failed) {
+        ssize_t n = write(output_fd, text, length);
+        if (n < 0) {
+            if (errno == EINTR) {
+                continue;
+            }
+            static const char message[] = "Error: cannot write program output\n";
+            write(STDERR_FILENO, message, sizeof message - 1);
+            failed = 1;
+            return;
+        }
+        vm_output_stats.writes += 1;
+        text += n;
+        length -= n;
+    }
+}
+
+void vm_output_init(int fd, size_t buffer_size) {
+    assert(buffer == 0);  // Only one output
+    buffer = malloc(buffer_size);
+    if (! buffer) {
+        log_error("Cannot allocate an output buffer of %zu bytes", buffer_size);
+        exit(1);
+    }
+    output_fd = fd;
+    capacity = buffer_size;
+    atexit(vm_output_flush);
+    log_debug("Output to fd %d through a buffer of %zu bytes", fd, buffer_size);
+}
+
+void vm_output_write(const char *text, size_t length) {
+    if (! buffer) {
+        vm_output_init(STDOUT_FILENO, OUTPUT_DEFAULT_BUFFER);
+    }
+    vm_output_stats.bytes += length;
+    if (length > capacity - used) {
+        vm_output_flush();
+        if (length >= capacity) {
+            write_all(text, length);
+            return;
+        }
+    }
+    memcpy(buffer + used, text, length);
+    used += length;
+}
+
+void vm_output_flush(void) {
+    size_t length = used;
+    used = 0;
+    write_all(buffer, length);
+}
@@ -0,0 +1,41 @@
+/*
+ * Output of the print methods of the built-in classes.
+ *
+ * Printing appends text to a buffer in the vm rather than making
+ * a stdio call per object.  The buffer is written to the output
+ * file descriptor (standard output unless tiny_vm -o names another)
+ * when it fills, when the program halts, when the vm exits through
+ * exit() (including errors in built-in methods), when the frame
+ * stack overflows, and when the program calls String:flush.  Text
+ * longer than the buffer is written directly.
+ */
+
+#ifndef TINY_VM_VM_OUTPUT_H
+#define TINY_VM_VM_OUTPUT_H
+
+#include <stddef.h>
+
+#define OUTPUT_DEFAULT_BUFFER (64 * 1024)  // Bytes
+
+/* Choose the output file descriptor and buffer size.  If it is not
+ * called, the first write uses standard output and the default size.
+ */
+extern void vm_output_init(int fd, size_t buffer_size);
+
+/* Buffer length bytes of text */
+extern void vm_output_write(const char *text, size_t length);
+
+/* Write out whatever is buffered.  Only async-signal-safe calls,
+ * so a signal handler may flush before exiting.
+ */
+extern void vm_output_flush(void);
+
+/* Statistics */
+struct vm_output_stats {
+    size_t bytes;      // Printed
+    long writes;       // System calls to write them
+};
+
+extern struct vm_output_stats vm_output_stats;
+
+#endif //TINY_VM_VM_OUTPUT_H
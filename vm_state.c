@@ -7,13 +7,18 @@
 #include "vm_code_table.h"
 #include "logger.h"
 #include "builtins.h"  // For debugging only
+#include "vm_output.h"
 #include <assert.h>
 #include <stdio.h>
+#include <stdlib.h>
 #include <string.h>
+#include <signal.h>
+#include <unistd.h>
+#include <sys/mman.h>
 
 /* The concrete data structures live here */
 
-vm_Word vm_code_block[CODE_CAPACITY];
+vm_Word vm_code_block[CODE_SEGMENT_WORDS];
 vm_addr vm_pc =   &vm_code_block[0];
 int vm_run_state = VM_RUNNING;
 enum LOG_LEVEL vm_logging = INFO;
@@ -24,9 +29,10 @@ char *guess_description(vm_Word w);
 /* Fetch next word from code block,
  * advancing the program counter.
  */
+#ifndef VM_RELEASE
 vm_Word vm_fetch_next(void) {
     vm_Word cur = (*vm_pc);
-    if (vm_pc >= vm_code_block && vm_pc < vm_code_block + CODE_CAPACITY) {
+    if (vm_pc >= vm_code_block && vm_pc < vm_code_block + CODE_SEGMENT_WORDS) {
         // Looks like we are executing an instruction in the main
         // code memory
         int word_number = vm_pc - vm_code_block;
@@ -49,21 +55,70 @@ extern void vm_relative_jump(int n) {
     vm_pc += n;
     log_debug("New program counter is %p", vm_pc);
 }
+#endif
 
 
 /* ----------Activation records (frames) -----------
  *
  * Upward growing stack (real stacks grow downward).
  */
-vm_Word vm_frame_stack[FRAME_CAPACITY];
+vm_Word *vm_frame_stack = 0;
+vm_Word *vm_frame_limit = 0;
 
-vm_Word *vm_fp = vm_frame_stack;    // Frame pointer, points to "this" object
-vm_Word *vm_sp = vm_frame_stack;    // Stack pointer, points to top item
+vm_Word *vm_fp = 0;    // Frame pointer, points to "this" object
+vm_Word *vm_sp = 0;    // Stack pointer, points to top item
 /* Evaluation stack is at end of activation record. */
 
+static char *guard_start = 0;
+static size_t guard_size = 0;
 
+/* A fault in the guard page is a stack overflow;  anything else
+ * is left to the default action.  Only async-signal-safe calls here.
+ */
+static void frame_fault(int sig, siginfo_t *info, void *context) {
+    (void) context;
+    char *addr = info->si_addr;
+    if (addr >= guard_start && addr < guard_start + guard_size) {
+        static const char message[] =
+                "Frame stack overflow (use -F for a larger stack)\n";
+        vm_output_flush();
+        write(STDERR_FILENO, message, sizeof message - 1);
+        _exit(1);
+    }
+    signal(sig, SIG_DFL);   // Fault again, this time fatally
+}
+
+void vm_frame_init(size_t max_words) {
+    assert(vm_frame_stack == 0);  // Only one stack
+    guard_size = (size_t) sysconf(_SC_PAGESIZE);
+    size_t stack_size = (max_words * sizeof(vm_Word) + guard_size - 1)
+                        / guard_size * guard_size;
+    char *region = mmap(0, stack_size + guard_size, PROT_READ | PROT_WRITE,
+                        MAP_PRIVATE | MAP_ANONYMOUS | MAP_NORESERVE, -1, 0);
+    if (region == MAP_FAILED) {
+        log_error("Cannot reserve a frame stack of %zu bytes", stack_size);
+        exit(1);
+    }
+    guard_start = region + stack_size;
+    mprotect(guard_start, guard_size, PROT_NONE);
+    struct sigaction action = {.sa_sigaction = frame_fault, .sa_flags = SA_SIGINFO};
+    sigemptyset(&action.sa_mask);
+    sigaction(SIGSEGV, &action, 0);
+    vm_frame_stack = (vm_Word *) region;
+    vm_frame_limit = (vm_Word *) guard_start;
+    vm_fp = vm_frame_stack;
+    vm_sp = vm_frame_stack;
+    log_debug("Frame stack of %zu words at %p",
+              stack_size / sizeof(vm_Word), region);
+}
+
+
+#ifndef VM_RELEASE  // Inline in vm_state.h
 /* Push a single word on the frame stack */
 void vm_frame_push_word(vm_Word val) {
+    if (! vm_frame_stack) {
+        vm_frame_init(FRAME_DEFAULT_WORDS);
+    }
     ++ vm_sp;
     *vm_sp = val;
 }
@@ -97,6 +152,7 @@ obj_ref vm_eval_pop() {
     assert(w.obj->header.tag == GOOD_OBJ_TAG);
     return w.obj;
 }
+#endif
 
 /* Roll the stack:
  * roll 2: [ob x y] -> [x y ob]
@@ -116,6 +172,7 @@ void vm_roll(int n) {
 /* --------------------- Constant pool --------------- */
 
 struct constant_pool_entry {
+    class_ref kind;
     char* name;
     obj_ref const_object;
 };
@@ -128,32 +185,92 @@ struct constant_pool_entry {
  * indexes are remapped while the module is loaded.
  */
 
-/* The global pool */
-static struct constant_pool_entry vm_constant_pool[CONST_POOL_CAPACITY];
+/* The global pool, doubled when it is full */
+static struct constant_pool_entry *vm_constant_pool = 0;
+static int vm_const_capacity = 0;
 static int vm_next_const = 1; // Skip index 0 so that it can be failure signal
 
-/* lookup_const_index("literal string") returns index
- * OR zero to indicate not present
+/* Intern table:  Open addressing hash table from (kind, literal)
+ * to index in the constant pool, where 0 marks an empty bucket.
+ * It is doubled whenever it becomes half full, so probe
+ * sequences stay short.
  */
-extern int lookup_const_index(char *literal) {
-    // We start with index 1, not 0, so that we can use 0 as failure
-    for (int i=1; i < vm_next_const; ++i) {
-        if (strcmp(literal, vm_constant_pool[i].name) == 0) {
-            return i;
+static int *const_buckets = 0;
+static unsigned int const_bucket_count = 0;  // Always a power of 2
+
+/* FNV-1a hash of the literal, mixed with the class */
+static unsigned int const_hash(class_ref kind, char *literal) {
+    unsigned int h = 2166136261u;
+    for (char *p = literal; *p; ++p) {
+        h ^= (unsigned char) *p;
+        h *= 16777619u;
+    }
+    h ^= (unsigned int) ((unsigned long) kind >> 4);
+    h *= 16777619u;
+    return h;
+}
+
+/* Bucket holding (kind, literal), or the empty bucket where it belongs */
+static unsigned int const_bucket(class_ref kind, char *literal) {
+    unsigned int mask = const_bucket_count - 1;
+    unsigned int b = const_hash(kind, literal) & mask;
+    while (const_buckets[b]) {
+        struct constant_pool_entry *entry = &vm_constant_pool[const_buckets[b]];
+        if (entry->kind == kind && strcmp(entry->name, literal) == 0) {
+            break;
         }
+        b = (b + 1) & mask;
     }
-    // Not present in constant table
-    return 0;
+    return b;
+}
+
+static void grow_const_buckets(void) {
+    int *old_buckets = const_buckets;
+    unsigned int old_count = const_bucket_count;
+    const_bucket_count = old_count ? 2 * old_count : 64;
+    const_buckets = calloc(const_bucket_count, sizeof(int));
+    assert(const_buckets);
+    for (unsigned int i = 0; i < old_count; ++i) {
+        int index = old_buckets[i];
+        if (index) {
+            struct constant_pool_entry *entry = &vm_constant_pool[index];
+            const_buckets[const_bucket(entry->kind, entry->name)] = index;
+        }
+    }
+    free(old_buckets);
+}
+
+/* lookup_const_index(the_class_String, "literal string") returns index
+ * OR zero to indicate not present
+ */
+extern int lookup_const_index(class_ref kind, char *literal) {
+    if (const_bucket_count == 0) {
+        return 0;
+    }
+    // Index 0 (empty bucket) doubles as "not present"
+    return const_buckets[const_bucket(kind, literal)];
 }
 
 /* create_const_value returns a positive index of the
  * entry the new constant object will have in the constant pool.
  */
-extern int create_const_value(char *literal, obj_ref value) {
+extern int create_const_value(class_ref kind, char *literal, obj_ref value) {
+    if (vm_next_const >= vm_const_capacity) {
+        vm_const_capacity = vm_const_capacity ? 2 * vm_const_capacity : 128;
+        vm_constant_pool = realloc(vm_constant_pool,
+                                   vm_const_capacity * sizeof(struct constant_pool_entry));
+        assert(vm_constant_pool);
+    }
+    assert(vm_next_const > 0);
+    if ((unsigned int) (2 * vm_next_const) >= const_bucket_count) {
+        grow_const_buckets();
+    }
     int const_index = vm_next_const;
     vm_next_const += 1;
+    vm_constant_pool[const_index].kind = kind;
     vm_constant_pool[const_index].name = strdup(literal);
     vm_constant_pool[const_index].const_object = value;
+    const_buckets[const_bucket(kind, literal)] = const_index;
     return const_index;
 }
 
@@ -165,6 +282,13 @@ extern obj_ref get_const_value(int index) {
     return vm_constant_pool[index].const_object;
 }
 
+/* Apply visit to each object in the pool (the collector's roots) */
+extern void vm_for_each_const(void (*visit)(obj_ref)) {
+    for (int i=1; i < vm_next_const; ++i) {
+        visit(vm_constant_pool[i].const_object);
+    }
+}
+
 /* Debugging support */
 extern void dump_constants(void) {
     for (int i=1; i < vm_next_const; ++i) {
@@ -237,8 +361,8 @@ char *guess_description(vm_Word w) {
         return buff;
     }
     /* An address on the stack? */
-    long stack_base =  (long) &vm_frame_stack[0];
-    long stack_limit = (long) &vm_frame_stack[FRAME_CAPACITY];
+    long stack_base =  (long) vm_frame_stack;
+    long stack_limit = (long) vm_frame_limit;
     long as_frame = (long) w.frame_addr;
     if (stack_base <= as_frame && as_frame < stack_limit) {
         int frame_num = w.frame_addr - vm_frame_stack;
@@ -252,6 +376,7 @@ char *guess_description(vm_Word w) {
     return buff;
 }
 
+#ifndef VM_RELEASE
 void stack_dump(int n_words) {
     const char* fp_ind = "-fp->";
     const char* not_fp = "     ";
@@ -280,6 +405,8 @@ void stack_dump(int n_words) {
     log_debug("===");
 }
 
+#endif
+
 /* One execution step, at current PC */
 void vm_step() {
     vm_Instr instr = vm_fetch_next().instr;
@@ -291,11 +418,30 @@ void vm_step() {
 }
 
 
+long vm_instr_count = 0;
+
+#ifdef VM_RELEASE
+/* Code is call-threaded:  each instruction word is the
+ * function implementing it, so the loop just calls it.
+ */
+void vm_run() {
+    long count = 0;
+    vm_run_state = VM_RUNNING;
+    while (vm_run_state == VM_RUNNING) {
+        vm_Instr instr = (vm_pc++)->instr;
+        (*instr)();
+        ++count;
+    }
+    vm_instr_count += count;
+}
+#else
 void vm_run() {
     vm_run_state = VM_RUNNING;
     // push_log_level(DEBUG);
     while (vm_run_state == VM_RUNNING) {
         vm_step();
+        ++vm_instr_count;
     }
     // pop_log_level();
 }
+#endif
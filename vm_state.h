@@ -13,9 +13,10 @@
 #ifndef TINY_VM_VM_STATE_H
 #define TINY_VM_VM_STATE_H
 
-#define CODE_CAPACITY    1024  // Max # instruction words
-#define FRAME_CAPACITY   1024    // Procedure call stack words
-#define CONST_POOL_CAPACITY 128  // Constant objects, created during loading
+#define CODE_SEGMENT_WORDS  65536  // Instruction words per code segment
+#define FRAME_DEFAULT_WORDS (8 * 1024 * 1024)  // Frame stack limit, unless vm_frame_init is told otherwise
+
+#include <stddef.h>
 
 /* Core definitions shared with
  * builtins.h
@@ -31,22 +32,33 @@
  * creating native methods with trampolines.
  * Program counter always points at next instruction
  * word (not currently executing word).
+ *
+ * vm_code_block is the first code segment.  The loader
+ * allocates more segments as it needs them (see vm_loader.c);
+ * code never moves once it is loaded, since vtables, call
+ * sites, and saved program counters point into it.
  */
-extern vm_Word vm_code_block[];
+extern vm_Word vm_code_block[CODE_SEGMENT_WORDS];
 extern vm_addr vm_pc;
 
 /* Fetch word at program counter, and advance
  * pc to point to next instruction.
- */
-extern vm_Word vm_fetch_next(void);
-
-
-/* A jump is an adjustment (+/- n instruction words)
+ *
+ * A jump is an adjustment (+/- n instruction words)
  * to program counter.  A jump of 0 would continue
  * to next instruction. A jump of -2 would repeat
  * the jump instruction.
+ *
+ * In release builds (VM_RELEASE) these and the stack
+ * operations below are inline, without tracing or checks.
  */
+#ifdef VM_RELEASE
+static inline vm_Word vm_fetch_next(void) { return *vm_pc++; }
+static inline void vm_relative_jump(int n) { vm_pc += n; }
+#else
+extern vm_Word vm_fetch_next(void);
 extern void vm_relative_jump(int n);
+#endif
 
 
 /* Execution run state - running or halted
@@ -67,25 +79,51 @@ extern  enum LOG_LEVEL vm_logging;
  * how a stack would be used in native code, although native code would
  * typically be register-oriented and make less use of an evaluation stack.
  */
+#ifndef VM_RELEASE
 extern void vm_eval_push(obj_ref v);
 extern obj_ref vm_eval_pop();
+#endif
 
 
 /* Frame (activation record) stack.
+ *
+ * The stack is a region of address space reserved by vm_frame_init,
+ * which the operating system backs with memory as the stack grows
+ * into it.  It is followed by an inaccessible guard page, so that
+ * overflowing the stack stops the VM with an error rather than
+ * overwriting whatever follows.  Pushes need no check.
  */
-extern vm_Word vm_frame_stack[FRAME_CAPACITY];
+extern vm_Word *vm_frame_stack;
+extern vm_Word *vm_frame_limit;   // End of the usable stack
 extern vm_addr vm_sp;   // Stack pointer  (next free location on stack)
 extern vm_addr vm_fp;   // Frame pointer  (locals and return address are relative to this)
 
+/* Reserve a frame stack of up to max_words words.  (Debugging builds
+ * call this with FRAME_DEFAULT_WORDS on the first push if need be.)
+ */
+extern void vm_frame_init(size_t max_words);
+
 /* Single word push/pop */
+#ifdef VM_RELEASE
+static inline void vm_frame_push_word(vm_Word val) { *++vm_sp = val; }
+static inline vm_Word vm_frame_pop_word(void) { return *vm_sp--; }
+static inline void vm_eval_push(obj_ref v) { *++vm_sp = (vm_Word) {.obj = v}; }
+static inline obj_ref vm_eval_pop(void) { return (vm_sp--)->obj; }
+static inline vm_Word vm_frame_top_word(void) { return *vm_sp; }
+#else
 extern void vm_frame_push_word(vm_Word val);
 extern vm_Word vm_frame_pop_word();
 extern vm_Word vm_frame_top_word();  // Without popping
+#endif
 /*  roll 2: [ob x y] -> [x y ob] */
 extern void vm_roll(int n);
 
 /* Debugging */
+#ifdef VM_RELEASE
+#define stack_dump(n_words) ((void) 0)
+#else
 void stack_dump(int n_words);
+#endif
 extern void dump_constants(void);
 extern char *guess_description(vm_Word w);
 
@@ -99,23 +137,38 @@ extern char *guess_description(vm_Word w);
  * Constant values are object references.
  */
 
-/* lookup_const_index("literal string") returns index
+/* Constants are interned:  There is at most one constant of each
+ * class with a given literal text.  (The class is part of the key,
+ * so that Int 7 and String "7" are distinct constants.)
+ */
+
+/* The pool grows as constants are created, and is indexed by a hash
+ * table, so loading many modules stays cheap.
+ */
+
+/* lookup_const_index(the_class_String, "literal string") returns index
  * OR zero to indicate not present
  */
-extern int lookup_const_index(char *literal);
+extern int lookup_const_index(class_ref kind, char *literal);
 
 /* create_const_value returns a positive index of the
  * entry the new constant object will have in the constant pool.
  */
-extern int create_const_value(char *literal, obj_ref value);
+extern int create_const_value(class_ref kind, char *literal, obj_ref value);
 
 /* get_const_value returns an object reference corresponding
  * to the provided index.
  */
 extern obj_ref get_const_value(int index);
 
+/* Apply visit to each object in the constant pool */
+extern void vm_for_each_const(void (*visit)(obj_ref));
+
 
 /* Execution control */
 void vm_run();
 
+/* Count of instructions executed by vm_run */
+extern long vm_instr_count;
+
 #endif //TINY_VM_VM_STATE_H